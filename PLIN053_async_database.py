@@ -0,0 +1,149 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+
+
+class DatabaseRequest:
+    """Jeden asynchronní požadavek na databázi"""
+
+    def __init__(self, tag=None):
+        self.tag = tag
+        self.future = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Zrušení požadavku - výsledek se už nedoručí"""
+        self.cancelled = True
+        if self.future:
+            self.future.cancel()
+
+
+class AsyncDatabase:
+    """Neblokující fasáda nad Database.
+
+    Dotazy běží ve vláknech na pozadí a výsledek se předá callbacku
+    v hlavním vlákně Kivy přes Clock.schedule_once. Nový požadavek se
+    stejným tagem zruší předchozí (např. novější vyhledávání).
+
+    Použití: async_db.get_books_page(cursor, callback=self.show_books, tag='home')
+    """
+
+    def __init__(self, db, max_workers=2):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='database')
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def submit(self, method_name, *args, callback=None, error_callback=None, tag=None, **kwargs):
+        """Spuštění metody Database na pozadí, vrací DatabaseRequest"""
+        method = getattr(self.db, method_name)
+        request = DatabaseRequest(tag)
+
+        if tag is not None:
+            with self._lock:
+                previous = self._latest.get(tag)
+                self._latest[tag] = request
+            if previous:
+                previous.cancel()
+
+        request.future = self.executor.submit(method, *args, **kwargs)
+        request.future.add_done_callback(
+            lambda future: Clock.schedule_once(lambda dt: self._finish(request, callback, error_callback))
+        )
+        return request
+
+    def cancel(self, tag):
+        """Zrušení posledního požadavku s daným tagem"""
+        with self._lock:
+            request = self._latest.pop(tag, None)
+        if request:
+            request.cancel()
+
+    def _finish(self, request, callback, error_callback):
+        """Doručení výsledku v hlavním vlákně"""
+        if request.cancelled or request.future.cancelled():
+            return
+
+        if request.tag is not None:
+            with self._lock:
+                if self._latest.get(request.tag) is request:
+                    del self._latest[request.tag]
+
+        error = request.future.exception()
+        if error is not None:
+            if error_callback:
+                error_callback(error)
+            else:
+                print(f"Chyba při asynchronním dotazu: {str(error)}")
+        elif callback:
+            callback(request.future.result())
+
+    def shutdown(self):
+        """Ukončení vláken na pozadí"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __getattr__(self, name):
+        # Metody Database volané asynchronně: async_db.get_messages(1, callback=...)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = getattr(self.db, name)
+        if not callable(method):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.submit(name, *args, **kwargs)
+
+
+class ReadReceipts:
+    """Odložené a sloučené potvrzování přečtených zpráv.
+
+    mark() si jen zapamatuje nejvyšší přečtené id zprávy pro každou
+    konverzaci. Zápis proběhne nejdřív po delay sekundách jedním UPDATE
+    na konverzaci, takže procházení dlouhého vlákna nezapisuje po zprávách.
+    Volá se z hlavního vlákna Kivy.
+    """
+
+    def __init__(self, async_db, delay=1.0):
+        self.async_db = async_db
+        self.delay = delay
+        self._pending = {}
+        self._sent = {}
+        self._listeners = []
+        self._event = None
+
+    def add_listener(self, callback):
+        """Callback volaný po zápisu, který změnil počty nepřečtených zpráv"""
+        self._listeners.append(callback)
+
+    def mark(self, conversation_id, user_id, message_id):
+        """Zprávy konverzace až po message_id jsou přečtené"""
+        key = (conversation_id, user_id)
+        if message_id <= max(self._pending.get(key, 0), self._sent.get(key, 0)):
+            return
+        self._pending[key] = message_id
+        if self._event is None:
+            self._event = Clock.schedule_once(self.flush, self.delay)
+
+    def flush(self, dt=None, wait=False):
+        """Okamžitý zápis všech odložených potvrzení (wait=True -> v tomto vlákně).
+
+        Bez wait vrací odeslané požadavky (DatabaseRequest).
+        """
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+        pending, self._pending = self._pending, {}
+        requests = []
+        for (conversation_id, user_id), message_id in pending.items():
+            self._sent[(conversation_id, user_id)] = message_id
+            if wait:
+                self.async_db.db.mark_messages_read(conversation_id, user_id, message_id)
+            else:
+                requests.append(self.async_db.mark_messages_read(conversation_id, user_id, message_id,
+                                                                 callback=self._written))
+        return requests
+
+    def _written(self, marked):
+        if marked:
+            for callback in self._listeners:
+                callback()
@@ -0,0 +1,1014 @@
+#!/usr/bin/env python3
+"""Benchmarky databázové vrstvy Knihomatu.
+
+Spuštění z příkazové řádky, např.:
+    python PLIN053_benchmark.py pool --calls 2000
+    python PLIN053_benchmark.py search --books 100000
+    python PLIN053_benchmark.py checkout --processes 8 --books 500
+    python PLIN053_benchmark.py conversation --processes 8
+    python PLIN053_benchmark.py inbox --threads 300
+    python PLIN053_benchmark.py receipts --messages 500
+    python PLIN053_benchmark.py chat --messages 30
+    python PLIN053_benchmark.py history --messages 5000
+    python PLIN053_benchmark.py outbox --writes 500
+    python PLIN053_benchmark.py records --books 100000
+    python PLIN053_benchmark.py suite --scales 1k,100k --output vysledky.json
+    python PLIN053_benchmark.py compare baseline.json vysledky.json
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Kivy jinak zpracovává argumenty příkazové řádky sám
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from kivy.clock import Clock
+from kivy.uix.label import Label
+
+from PLIN053_database import MESSAGES_PAGE_SIZE, Database, PooledConnection, count_result_rows
+from PLIN053_dataset import AUTHORS, SCALES, TITLE_WORDS, generate_dataset
+from PLIN053_outbox import Outbox
+from PLIN053_records import Book, record_factory
+from PLIN053_remote_database import RemoteDatabase
+from PLIN053_server import DatabaseServer
+
+
+class PerCallConnectionDatabase(Database):
+    """Původní chování: nové sqlite3.connect pro každé volání metody"""
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_name, factory=PooledConnection)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def seed_database(db, users=50, books=2000, conversations=200, messages=20):
+    """Naplnění databáze ukázkovými daty"""
+    rnd = random.Random(42)
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
+            [(f"Uživatel {i}", f"user{i}@knihomat.cz", db.hash_password("heslo123"))
+             for i in range(1, users + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO books (title, author, price, condition, description, seller_id, is_sold) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(f"Kniha {i} {' '.join(rnd.sample(TITLE_WORDS, 2))}", rnd.choice(AUTHORS),
+              rnd.randint(50, 900), 'Velmi dobrý', f"Popis knihy: {rnd.choice(TITLE_WORDS)}",
+              rnd.randint(1, users), rnd.random() < 0.2)
+             for i in range(books)]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, ?)",
+            [(rnd.randint(1, books), rnd.randint(1, users), rnd.randint(1, users))
+             for _ in range(conversations)]
+        )
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
+            [(c, rnd.randint(1, users), f"Zpráva {m}")
+             for c in range(1, conversations + 1) for m in range(messages)]
+        )
+
+
+def calls_per_second(func, calls):
+    """Počet volání funkce za sekundu"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = time.perf_counter() - start
+    return calls / elapsed if elapsed else float('inf')
+
+
+def hot_read_methods(db):
+    """Nejčastěji volané čtecí metody (seznam knih, chat, konverzace)"""
+    return {
+        'get_all_books': lambda: db.get_all_books(),
+        'get_messages': lambda: db.get_messages(1),
+        'get_user_conversations': lambda: db.get_user_conversations(1),
+        'get_book_details': lambda: db.get_book_details(1),
+        'get_seller_id_by_book': lambda: db.get_seller_id_by_book(1),
+    }
+
+
+def bench_pool(args):
+    """Porovnání volání za sekundu bez poolu a s poolem spojení"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_bench.db')
+    pooled = Database(db_path)
+    seed_database(pooled)
+    per_call = PerCallConnectionDatabase(db_path)
+
+    print(f"{'metoda':<26}{'bez poolu':>12}{'s poolem':>12}{'zrychlení':>11}")
+    before_methods = hot_read_methods(per_call)
+    for name, func in hot_read_methods(pooled).items():
+        before = calls_per_second(before_methods[name], args.calls)
+        after = calls_per_second(func, args.calls)
+        print(f"{name:<26}{before:>10.0f}/s{after:>10.0f}/s{after / before:>10.2f}x")
+
+    pooled.close()
+
+
+def bench_search(args):
+    """Porovnání vyhledávání přes LIKE a přes FTS5 index"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_search.db')
+    db = Database(db_path)
+    start = time.perf_counter()
+    seed_database(db, books=args.books, conversations=0, messages=0)
+    print(f"Vloženo {args.books} knih za {time.perf_counter() - start:.1f} s")
+
+    queries = ['capek', 'Čapek', 'Krakatit', 'svejk', 'matem', 'dobreho vojaka', 'Kniha 4242']
+    print(f"{'dotaz':<18}{'LIKE':>12}{'FTS5':>12}{'výsledků LIKE/FTS':>20}")
+    for query in queries:
+        like_rate = calls_per_second(lambda: db.search_books_like(query), args.calls)
+        fts_rate = calls_per_second(lambda: db.search_books(query), args.calls)
+        found = f"{len(db.search_books_like(query))}/{len(db.search_books(query))}"
+        print(f"{query:<18}{1000 / like_rate:>9.2f} ms{1000 / fts_rate:>9.2f} ms{found:>20}")
+
+    db.close()
+
+
+def legacy_create_order(db_name, book_id, buyer_id, buyer_address, buyer_phone):
+    """Původní create_order: SELECT is_sold, pak INSERT a UPDATE bez zámku"""
+    conn = sqlite3.connect(db_name, timeout=10.0)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT seller_id, price, is_sold FROM books WHERE id = ?", (book_id,))
+        seller_id, price, is_sold = cursor.fetchone()
+        if is_sold:
+            return False, "Kniha již byla prodána!"
+        if seller_id == buyer_id:
+            return False, "Nemůžete koupit vlastní knihu!"
+        cursor.execute(
+            "INSERT INTO orders (book_id, buyer_id, seller_id, total_price, buyer_address, buyer_phone) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (book_id, buyer_id, seller_id, price, buyer_address, buyer_phone)
+        )
+        cursor.execute("UPDATE books SET is_sold = TRUE WHERE id = ?", (book_id,))
+        conn.commit()
+        return True, "OK"
+    except Exception as e:
+        return False, f"Chyba při vytváření objednávky: {str(e)}"
+    finally:
+        conn.close()
+
+
+def checkout_worker(db_path, buyer_id, book_ids, legacy, start_event):
+    """Jeden kupující, který se snaží koupit všechny knihy v náhodném pořadí"""
+    db = Database(db_path)
+    rnd = random.Random(buyer_id)
+    book_ids = list(book_ids)
+    rnd.shuffle(book_ids)
+
+    stats = {'ok': 0, 'sold': 0, 'errors': 0, 'locked': 0, 'latencies': []}
+    start_event.wait()
+    for book_id in book_ids:
+        start = time.perf_counter()
+        if legacy:
+            success, message = legacy_create_order(db_path, book_id, buyer_id, 'Brno', '+420 123 456 789')
+        else:
+            success, message = db.create_order(book_id, buyer_id, 'Brno', '+420 123 456 789')
+        stats['latencies'].append(time.perf_counter() - start)
+
+        if success:
+            stats['ok'] += 1
+        elif 'prodána' in message:
+            stats['sold'] += 1
+        else:
+            stats['errors'] += 1
+            stats['locked'] += 'locked' in message
+    db.close()
+    return stats
+
+
+def percentile(values, fraction):
+    """Percentil seřazeného seznamu hodnot"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench_checkout(args):
+    """Souběžné nákupy stejných knih z více procesů - kontrola dvojího prodeje"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_checkout.db')
+    db = Database(db_path)
+    seed_database(db, users=args.processes + 1, books=0, conversations=0, messages=0)
+    with db.connection() as conn:
+        # Všechny knihy prodává uživatel 1, kupující jsou 2..N+1
+        conn.executemany(
+            "INSERT INTO books (title, author, price, condition, description, seller_id) VALUES (?, ?, ?, ?, ?, 1)",
+            [(f"Kniha {i}", 'Karel Čapek', 100, 'Dobrý', '') for i in range(args.books)]
+        )
+        book_ids = [row[0] for row in conn.execute("SELECT id FROM books")]
+    db.close()
+
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Manager() as manager:
+        start_event = manager.Event()
+        with ctx.Pool(args.processes) as pool:
+            results = [pool.apply_async(checkout_worker, (db_path, buyer_id, book_ids, args.legacy, start_event))
+                       for buyer_id in range(2, args.processes + 2)]
+            time.sleep(1.0)  # Všechny procesy se stihnou připravit
+            start = time.perf_counter()
+            start_event.set()
+            stats = [result.get() for result in results]
+            elapsed = time.perf_counter() - start
+
+    db = Database(db_path)
+    with db.connection() as conn:
+        double_sold = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT book_id FROM orders GROUP BY book_id HAVING COUNT(*) > 1)"
+        ).fetchone()[0]
+        orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    db.close()
+
+    attempts = sum(len(s['latencies']) for s in stats)
+    latencies = sorted(latency for s in stats for latency in s['latencies'])
+    print(f"Režim: {'původní create_order' if args.legacy else 'atomický create_order'}")
+    print(f"Procesů {args.processes}, knih {args.books}, pokusů {attempts} za {elapsed:.2f} s")
+    print(f"Propustnost: {attempts / elapsed:.0f} pokusů/s, {orders / elapsed:.0f} prodejů/s")
+    print(f"Latence p50 {percentile(latencies, 0.5) * 1000:.2f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"Úspěšné nákupy {sum(s['ok'] for s in stats)}, již prodáno {sum(s['sold'] for s in stats)}, "
+          f"chyby {sum(s['errors'] for s in stats)} (z toho zamčeno {sum(s['locked'] for s in stats)})")
+    print(f"Objednávek {orders}, dvakrát prodaných knih: {double_sold}")
+    return 1 if double_sold else 0
+
+
+def seed_conversation(db, book_id=1):
+    """Konverzace o knize mezi jejím prodávajícím a druhým uživatelem (seed s users=2)"""
+    seller_id = db.get_seller_id_by_book(book_id)
+    return db.create_or_get_conversation(book_id, 3 - seller_id, seller_id)
+
+
+def legacy_create_or_get_conversation(conn, book_id, buyer_id, seller_id):
+    """Původní create_or_get_conversation: SELECT a pak podmíněný INSERT"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id FROM conversations WHERE book_id = ? AND buyer_id = ? AND seller_id = ?",
+            (book_id, buyer_id, seller_id)
+        )
+        conversation = cursor.fetchone()
+        if conversation:
+            return conversation[0]
+        cursor.execute(
+            "INSERT INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, ?)",
+            (book_id, buyer_id, seller_id)
+        )
+        conn.commit()
+        return cursor.lastrowid
+    except Exception:
+        conn.rollback()
+        return None
+
+
+def conversation_worker(db_path, triples, legacy, start_event):
+    """Otevření stejných konverzací souběžně s ostatními procesy"""
+    db = Database(db_path)
+    start_event.wait()
+    conn = sqlite3.connect(db_path, timeout=10.0)
+    results = []
+    for book_id, buyer_id, seller_id in triples:
+        if legacy:
+            results.append(legacy_create_or_get_conversation(conn, book_id, buyer_id, seller_id))
+        else:
+            results.append(db.create_or_get_conversation(book_id, buyer_id, seller_id))
+    conn.close()
+    db.close()
+    return results
+
+
+def bench_conversation(args):
+    """Souběžné create_or_get_conversation a porovnání latence s původní verzí"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_conversation.db')
+    db = Database(db_path)
+    seed_database(db, users=50, books=args.conversations, conversations=0, messages=0)
+    # Kupující se střídají, prodávající je vždy ten skutečný
+    with db.connection() as conn:
+        sellers = dict(conn.execute("SELECT id, seller_id FROM books"))
+    triples = [(book_id, (sellers[book_id] + book_id % 40) % 50 + 1, sellers[book_id])
+               for book_id in range(1, args.conversations + 1)]
+
+    # Souběh: všechny procesy otevírají stejné konverzace ve stejném pořadí
+    for legacy in (True, False):
+        with db.connection() as conn:
+            conn.execute("DELETE FROM conversations")
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Manager() as manager:
+            start_event = manager.Event()
+            with ctx.Pool(args.processes) as pool:
+                results = [pool.apply_async(conversation_worker, (db_path, triples, legacy, start_event))
+                           for _ in range(args.processes)]
+                time.sleep(1.0)
+                start_event.set()
+                ids = [result.get() for result in results]
+
+        failed = sum(conversation_id is None for worker_ids in ids for conversation_id in worker_ids)
+        mismatched = sum(len(set(column)) > 1 for column in zip(*ids))
+        print(f"{'původní' if legacy else 'upsert '}: {args.processes} procesů x {len(triples)} konverzací, "
+              f"selhání {failed}, nesouhlasících id {mismatched}")
+
+    # Latence jednoho volání (obě varianty přes jedno otevřené spojení)
+    legacy_conn = sqlite3.connect(db_path, timeout=10.0)
+    with db.connection() as conn:
+        conn.execute("DELETE FROM conversations")
+    print(f"{'případ':<22}{'původní':>12}{'upsert':>12}")
+    for case in ('nová', 'existující'):
+        timings = []
+        for legacy in (True, False):
+            if case == 'nová':
+                with db.connection() as conn:
+                    conn.execute("DELETE FROM conversations")
+            start = time.perf_counter()
+            for book_id, buyer_id, seller_id in triples:
+                if legacy:
+                    legacy_create_or_get_conversation(legacy_conn, book_id, buyer_id, seller_id)
+                else:
+                    db.create_or_get_conversation(book_id, buyer_id, seller_id)
+            timings.append((time.perf_counter() - start) / len(triples) * 1000)
+        print(f"{case:<22}{timings[0]:>9.3f} ms{timings[1]:>9.3f} ms")
+    legacy_conn.close()
+    db.close()
+
+
+def legacy_user_conversations(conn, user_id):
+    """Původní seznam konverzací a k němu dotaz na poslední zprávu každé z nich"""
+    conversations = conn.execute('''
+        SELECT DISTINCT c.id, b.title, b.author,
+               CASE WHEN c.buyer_id = ? THEN seller_u.name ELSE buyer_u.name END as other_user_name,
+               CASE WHEN c.buyer_id = ? THEN 'buyer' ELSE 'seller' END as user_role,
+               c.created_at
+        FROM conversations c
+        JOIN books b ON c.book_id = b.id
+        JOIN users seller_u ON c.seller_id = seller_u.id
+        JOIN users buyer_u ON c.buyer_id = buyer_u.id
+        WHERE c.buyer_id = ? OR c.seller_id = ?
+        ORDER BY c.created_at DESC
+    ''', (user_id, user_id, user_id, user_id)).fetchall()
+
+    inbox = []
+    for conversation in conversations:
+        last = conn.execute(
+            "SELECT message, created_at FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT 1",
+            (conversation[0],)).fetchone()
+        unread = conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND sender_id != ? AND NOT is_read",
+            (conversation[0], user_id)).fetchone()[0]
+        inbox.append((*conversation, last[0] if last else None, last[1] if last else conversation[5], unread))
+    inbox.sort(key=lambda row: row[7], reverse=True)
+    return inbox
+
+
+def bench_inbox(args):
+    """Seznam konverzací uživatele s mnoha vlákny: původní dotazy vs. souhrny"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_inbox.db')
+    db = Database(db_path)
+    seed_database(db, users=args.threads + 1, books=args.threads, conversations=0, messages=0)
+    with db.connection() as conn:
+        # Uživatel 1 prodává všechny knihy, každou s jiným kupujícím
+        conn.execute("UPDATE books SET seller_id = 1")
+        conn.executemany("INSERT INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, 1)",
+                         [(i, i + 1) for i in range(1, args.threads + 1)])
+        conn.executemany("INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
+                         [(c, 1 if m % 2 else c + 1, f"Zpráva {m} v konverzaci {c}")
+                          for m in range(args.messages) for c in range(1, args.threads + 1)])
+
+    with db.connection() as conn:
+        legacy_rate = calls_per_second(lambda: legacy_user_conversations(conn, 1), args.calls)
+    summary_rate = calls_per_second(lambda: db.get_user_conversations(1), args.calls)
+    print(f"Uživatel s {args.threads} konverzacemi po {args.messages} zprávách")
+    print(f"{'původní (1 + 2N dotazů)':<28}{1000 / legacy_rate:>9.2f} ms")
+    print(f"{'souhrny (1 dotaz)':<28}{1000 / summary_rate:>9.2f} ms")
+    print(f"Zrychlení {summary_rate / legacy_rate:.1f}x")
+    db.close()
+
+
+def bench_receipts(args):
+    """Potvrzení přečtení dlouhého vlákna: zápis po zprávách vs. jeden UPDATE"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_receipts.db')
+    db = Database(db_path)
+    seed_database(db, users=2, books=1, conversations=0, messages=0)
+    conversation_id = seed_conversation(db)
+
+    timings = []
+    for per_message in (True, False):
+        with db.connection() as conn:
+            conn.execute("DELETE FROM messages")
+            conn.executemany("INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
+                             [(conversation_id, 1, f"Zpráva {m}") for m in range(args.messages)])
+            message_ids = [row[0] for row in conn.execute("SELECT id FROM messages ORDER BY id")]
+
+        start = time.perf_counter()
+        if per_message:
+            for message_id in message_ids:
+                with db.connection() as conn:
+                    conn.execute("UPDATE messages SET is_read = TRUE WHERE id = ?", (message_id,))
+        else:
+            db.mark_messages_read(conversation_id, 2, message_ids[-1])
+        timings.append((time.perf_counter() - start) * 1000)
+
+        counts, total = db.get_unread_counts(2)
+        print(f"{'po zprávách' if per_message else 'jeden UPDATE':<14}{timings[-1]:>10.2f} ms"
+              f"   nepřečteno po zápisu: {total}")
+    print(f"Zrychlení {timings[0] / timings[1]:.1f}x pro {args.messages} zpráv")
+    db.close()
+
+
+def bench_chat(args):
+    """Zpoždění zprávy od odeslání po vykreslení v otevřeném chatu.
+
+    poll = původní ChatScreen (kontrola změn každé 2 s), push = db.events
+    lokální databáze, server = long-poll přes PLIN053_server. Uživatel 2
+    píše v náhodných intervalech, chat uživatele 1 běží v hlavním vlákně
+    přes Clock jako v aplikaci a zprávu vykreslí jako Label.
+    """
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_chat.db')
+    db = Database(db_path)
+    seed_database(db, users=2, books=1, conversations=0, messages=0)
+    conversation_id = seed_conversation(db)
+    rnd = random.Random(42)
+    Label(text='Zahřátí')  # První Label načítá písma, do měření nepatří
+
+    print(f"{'režim':<8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'dotazy příjemce/s':>20}")
+    for mode in args.modes.split(','):
+        server = None
+        if mode == 'server':
+            server = DatabaseServer(db, port=0, maintenance_interval=0)
+            url = server.start_background()
+            sender, receiver = RemoteDatabase(url), RemoteDatabase(url)
+            sender.login_user('user2@knihomat.cz', 'heslo123')
+            receiver.login_user('user1@knihomat.cz', 'heslo123')
+        elif mode in ('poll', 'push'):
+            sender = receiver = db
+        else:
+            print(f"Neznámý režim: {mode}")
+            return 2
+
+        sent, latencies = {}, []
+        polls = [0]
+        last_id = [max((message.id for message in db.get_messages(conversation_id)), default=0)]
+
+        def render(message):
+            Label(text=f"{message.sender_name}: {message.message}", size_hint_y=None, height=40)
+            latencies.append(time.perf_counter() - sent[message.message])
+
+        def fetch_new():
+            for message in receiver.get_messages_since(conversation_id, last_id[0]):
+                render(message)
+                last_id[0] = message.id
+
+        def on_event(event):
+            if event is not None and event.conversation_id == conversation_id:
+                Clock.schedule_once(lambda dt: render(event.message))
+
+        if mode == 'poll':
+            # Token změn jako v původním refresh_messages
+            token = [db.get_change_token('messages')]
+
+            def poll_changes(dt):
+                polls[0] += 1
+                current = receiver.get_change_token('messages')
+                if current != token[0]:
+                    token[0] = current
+                    fetch_new()
+
+            poll_event = Clock.schedule_interval(poll_changes, args.poll_interval)
+        else:
+            receiver.events.subscribe(1, on_event)
+        requests_before = server.requests if server else 0
+
+        def send_all():
+            for i in range(args.messages):
+                time.sleep(rnd.uniform(0, 2 * args.interval))
+                text = f"Zpráva {mode} {i}"
+                sent[text] = time.perf_counter()
+                sender.send_message(conversation_id, 2, text)
+
+        sender_thread = threading.Thread(target=send_all)
+        start = time.perf_counter()
+        sender_thread.start()
+        deadline = start + args.messages * args.interval * 2 + args.poll_interval + 30
+        while len(latencies) < args.messages and time.perf_counter() < deadline:
+            Clock.tick()
+        elapsed = time.perf_counter() - start
+        sender_thread.join()
+
+        if mode == 'poll':
+            poll_event.cancel()
+            receiver_requests = polls[0]
+        else:
+            receiver.events.unsubscribe(1, on_event)
+            # Long-polly příjemce = požadavky serveru bez odeslaných zpráv
+            receiver_requests = server.requests - requests_before - args.messages if server else 0
+        if server:
+            sender.close()
+            receiver.close()
+            server.stop_background()
+
+        values = sorted(latency * 1000 for latency in latencies)
+        missing = args.messages - len(values)
+        print(f"{mode:<8}{percentile(values, 0.50):>10.1f}{percentile(values, 0.95):>10.1f}"
+              f"{(values[-1] if values else 0):>10.1f}{receiver_requests / elapsed:>20.2f}"
+              + (f"   nedoručeno {missing}" if missing else ''))
+    db.close()
+    return 0
+
+
+def bench_history(args):
+    """Otevření dlouhého chatu: celá historie vs. poslední stránka.
+
+    Každá zpráva se vykreslí jako Label jako v ChatScreen. Listování
+    nahoru načítá starší stránky přes before_id, widgetů zůstává
+    nejvýš --keep (starší stránky se přidávají, nejnovější uvolňují).
+    """
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_history.db')
+    db = Database(db_path)
+    seed_database(db, users=2, books=1, conversations=0, messages=0)
+    conversation_id = seed_conversation(db)
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
+                         [(conversation_id, 1 + m % 2, f"Zpráva {m} v dlouhé konverzaci")
+                          for m in range(args.messages)])
+    Label(text='zahřátí').texture_update()  # Načtení fontu se nepočítá do první varianty
+
+    def render(messages):
+        labels = []
+        for message in messages:
+            label = Label(text=f"{message.sender_name}: {message.message}")
+            label.texture_update()
+            labels.append(label)
+        return labels
+
+    start = time.perf_counter()
+    widgets = render(db.get_messages(conversation_id))
+    full_ms = (time.perf_counter() - start) * 1000
+    full_count = len(widgets)
+    del widgets
+    gc.collect()  # Úklid widgetů celé historie by jinak zatížil měření stránek
+
+    start = time.perf_counter()
+    messages, cursor = db.get_messages_page(conversation_id, page_size=args.page_size)
+    widgets = render(messages)
+    page_ms = (time.perf_counter() - start) * 1000
+    page_count = len(widgets)
+
+    # Listování až na začátek konverzace
+    page_times = []
+    max_widgets = len(widgets)
+    while cursor:
+        start = time.perf_counter()
+        messages, cursor = db.get_messages_page(conversation_id, before_id=cursor, page_size=args.page_size)
+        widgets[:0] = render(messages)
+        del widgets[args.keep:]
+        page_times.append((time.perf_counter() - start) * 1000)
+        max_widgets = max(max_widgets, len(widgets))
+
+    print(f"Konverzace s {args.messages} zprávami, stránka {args.page_size}")
+    print(f"{'celá historie':<22}{full_ms:>10.1f} ms{full_count:>8} widgetů")
+    print(f"{'poslední stránka':<22}{page_ms:>10.1f} ms{page_count:>8} widgetů")
+    page_times.sort()
+    print(f"{'starší stránka':<22}{percentile(page_times, 0.50):>10.1f} ms (p50)"
+          f"{percentile(page_times, 0.95):>8.1f} ms (p95), nejvýš {max_widgets} widgetů")
+    db.close()
+    return 0
+
+
+def bench_outbox(args):
+    """Zápisy zpráv přímo (commit na zprávu) vs. přes outbox (dávky na pozadí).
+
+    U přímých zápisů čeká volající na commit v hlavní databázi, u outboxu
+    jen na uložení do outboxu - to je doba, po které obrazovka zprávu
+    zobrazí. Počet transakcí hlavní databáze = počet volání apply_writes.
+    S --server se zapisuje přes PLIN053_server jako ve sdíleném režimu.
+    """
+    work_dir = tempfile.mkdtemp()
+    db = Database(args.db or os.path.join(work_dir, 'knihomat_outbox.db'))
+    seed_database(db, users=2, books=1, conversations=0, messages=0)
+    conversation_id = seed_conversation(db)
+    server = target = None
+    if args.server:
+        server = DatabaseServer(db, port=0, maintenance_interval=0)
+        target = RemoteDatabase(server.start_background())
+        target.login_user('user1@knihomat.cz', 'heslo123')
+    target = target or db
+
+    def pause():
+        if args.interval:
+            time.sleep(random.expovariate(1 / args.interval))
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.writes):
+        call_start = time.perf_counter()
+        target.send_message(conversation_id, 1, f"Přímá zpráva {i}")
+        latencies.append((time.perf_counter() - call_start) * 1000)
+        pause()
+    direct_total = time.perf_counter() - start
+    direct = sorted(latencies)
+
+    outbox = Outbox(target, os.path.join(work_dir, 'outbox.db'))
+    done = threading.Event()
+    written = []
+
+    def on_result(entry, result):
+        written.append(result[0])
+        if len(written) == args.writes:
+            done.set()
+
+    outbox.add_listener(on_result)
+    calls_before = db.get_query_stats().get('apply_writes', {}).get('calls', 0)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.writes):
+        call_start = time.perf_counter()
+        outbox.send_message(conversation_id, 1, f"Zpráva z outboxu {i}")
+        latencies.append((time.perf_counter() - call_start) * 1000)
+        pause()
+    done.wait(60)
+    outbox_total = time.perf_counter() - start
+    batches = db.get_query_stats()['apply_writes']['calls'] - calls_before
+    outbox.close()
+    queued = sorted(latencies)
+
+    if server:
+        target.close()
+        server.stop_background()
+
+    print(f"{args.writes} zpráv{' přes server' if server else ''}, průměrná pauza {args.interval * 1000:.0f} ms")
+    print(f"{'':<10}{'p50 ms':>10}{'p95 ms':>10}{'celkem s':>10}{'transakcí':>11}")
+    print(f"{'přímo':<10}{percentile(direct, 0.50):>10.2f}{percentile(direct, 0.95):>10.2f}"
+          f"{direct_total:>10.2f}{args.writes:>11}")
+    print(f"{'outbox':<10}{percentile(queued, 0.50):>10.2f}{percentile(queued, 0.95):>10.2f}"
+          f"{outbox_total:>10.2f}{batches:>11}"
+          + (f"   zapsáno {sum(written)}/{args.writes}" if sum(written) != args.writes else ''))
+    db.close()
+    return 0
+
+
+# Sloupce, které zobrazuje seznam knih na hlavní obrazovce
+BOOK_LIST_FIELDS = ('id', 'title', 'author', 'price', 'condition', 'seller_name')
+
+
+def fetch_footprint(conn, sql, row_factory):
+    """Načtení všech řádků, vrací (počet, bajty na řádek, µs na řádek)"""
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    # Čas bez tracemalloc (to sledování alokací výrazně zpomaluje)
+    start = time.perf_counter()
+    count = len(cursor.execute(sql).fetchall())
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    rows = cursor.execute(sql).fetchall()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rows
+    return count, retained / max(count, 1), elapsed * 1e6 / max(count, 1)
+
+
+def bench_records(args):
+    """Paměť a čas na řádek velkého výsledku podle typu řádků (row factory)"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'knihomat_records.db')
+    db = Database(db_path, instrument=False)
+    generate_dataset(db, users=max(args.books // 20, 2), books=args.books)
+
+    sql = '''
+        SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name, b.created_at
+        FROM books b JOIN users u ON b.seller_id = u.id
+    '''
+    names = ('id', 'title', 'author', 'price', 'condition', 'description', 'seller_name', 'created_at')
+    factories = {
+        'n-tice': None,
+        'sqlite3.Row': sqlite3.Row,
+        'dict': lambda cursor, row: dict(zip(names, row)),
+        'Book': record_factory(Book),
+        'Book (projekce seznamu)': record_factory(Book, fields=BOOK_LIST_FIELDS),
+    }
+
+    print(f"{'typ řádku':<26}{'řádků':>9}{'B/řádek':>10}{'µs/řádek':>10}")
+    with db.connection() as conn:
+        # Zahřátí stránek databáze, aby první varianta neplatila čtení z disku
+        conn.execute(sql).fetchall()
+        for name, factory in factories.items():
+            count, size, duration = fetch_footprint(conn, sql, factory)
+            print(f"{name:<26}{count:>9}{size:>10.0f}{duration:>10.2f}")
+    db.close()
+
+
+def suite_calls(db, sizes, rnd):
+    """Volání každé metody Database s různými platnými argumenty (podle čísla volání).
+
+    Čtecí metody jsou první, zapisující až po nich. Argumenty se střídají,
+    aby se neměřila jen mezipaměť jednoho záznamu.
+    """
+    users, books = sizes['users'], sizes['books']
+    conversations, orders = max(sizes['conversations'], 1), max(sizes['orders'], 1)
+    with db.connection() as conn:
+        unsold = conn.execute(
+            "SELECT id, seller_id FROM books WHERE is_sold = FALSE ORDER BY id DESC LIMIT 2000").fetchall()
+        last_message_id = conn.execute(
+            "SELECT MAX(id) FROM messages").fetchone()[0] or 0
+        chats = conn.execute(
+            "SELECT id, buyer_id FROM conversations ORDER BY id DESC LIMIT 2000").fetchall()
+    rnd.shuffle(unsold)
+    half = len(unsold) // 2
+    to_buy, to_delete = unsold[:half], unsold[half:]
+    first_page = db.get_books_page()
+
+    def user(i):
+        return rnd.randint(1, users)
+
+    def book(i):
+        return rnd.randint(1, books)
+
+    def conversation(i):
+        return rnd.randint(1, conversations)
+
+    def buy(i):
+        book_id, seller_id = to_buy[i % len(to_buy)]
+        return db.create_order(book_id, seller_id % users + 1, 'Husova 12, Brno', '+420 777 123 456')
+
+    def contact(i):
+        book_id, seller_id = to_buy[i % len(to_buy)]
+        return db.create_or_get_conversation(book_id, seller_id % users + 1, seller_id)
+
+    def send(i):
+        # Zprávu může poslat jen účastník konverzace
+        conversation_id, buyer_id = chats[i % len(chats)]
+        return db.send_message(conversation_id, buyer_id, 'Dobrý den, platí nabídka?')
+
+    def delete(i):
+        book_id, seller_id = to_delete[i % len(to_delete)]
+        return db.delete_book(book_id, seller_id)
+
+    # Dotazy se střídají pevně, aby měl každý běh stejnou směs
+    queries = ['Čapek', 'Krakatit', 'Babička', 'Hrabal']
+    new_books = [('Benchmark', 'Karel Čapek', 100, 'Dobrý', 'Hromadný import', 1)] * 100
+    return {
+        'login_user': lambda i: db.login_user(f'user{user(i)}@knihomat.cz', 'heslo123'),
+        'get_all_books': lambda i: db.get_all_books(),
+        'search_books': lambda i: db.search_books(queries[i % len(queries)]),
+        'search_books_like': lambda i: db.search_books_like(queries[i % len(queries)]),
+        'get_books_page': lambda i: db.get_books_page(),
+        'get_books_page (kurzor)': lambda i: db.get_books_page(first_page[1]),
+        'search_books_page': lambda i: db.search_books_page(queries[i % len(queries)]),
+        'get_messages': lambda i: db.get_messages(conversation(i)),
+        'get_messages_since': lambda i: db.get_messages_since(
+            conversation(i), rnd.randint(0, last_message_id)),
+        'get_messages_page': lambda i: db.get_messages_page(conversation(i)),
+        'get_user_conversations': lambda i: db.get_user_conversations(user(i)),
+        'get_unread_counts': lambda i: db.get_unread_counts(user(i)),
+        'get_conversation_info': lambda i: db.get_conversation_info(conversation(i)),
+        'get_seller_id_by_book': lambda i: db.get_seller_id_by_book(book(i)),
+        'get_user_orders (kupující)': lambda i: db.get_user_orders(user(i), as_buyer=True),
+        'get_user_orders (prodávající)': lambda i: db.get_user_orders(user(i), as_buyer=False),
+        'get_book_details': lambda i: db.get_book_details(book(i)),
+        'get_user_books': lambda i: db.get_user_books(user(i)),
+        'get_user_books_page': lambda i: db.get_user_books_page(user(i), ('all', 'available', 'sold')[i % 3]),
+        'get_user_book_counts': lambda i: db.get_user_book_counts(user(i)),
+        'register_user': lambda i: db.register_user('Nový Uživatel', f'novy{i}@knihomat.cz', 'heslo123'),
+        'add_book': lambda i: db.add_book('Válka s mloky', 'Karel Čapek', 150, 'Dobrý', 'Benchmark', user(i)),
+        'bulk_add_books (100)': lambda i: db.bulk_add_books([new_books]),
+        'create_or_get_conversation': contact,
+        'send_message': send,
+        'mark_messages_read': lambda i: db.mark_messages_read(conversation(i), user(i), last_message_id),
+        'create_order': buy,
+        'update_order_status': lambda i: db.update_order_status(
+            rnd.randint(1, orders), rnd.choice(['confirmed', 'shipped', 'completed'])),
+        'update_book_status': lambda i: db.update_book_status(*to_delete[i % len(to_delete)], False),
+        'delete_book': delete,
+    }
+
+
+def measure(call, repeat, budget):
+    """Časy opakovaných volání (ms) - nejvýš repeat volání nebo budget sekund"""
+    timings = []
+    rows = 0
+    deadline = time.perf_counter() + budget
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = call(i)
+        timings.append((time.perf_counter() - start) * 1000)
+        rows = count_result_rows(result)
+        if i >= 2 and time.perf_counter() > deadline:
+            break
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'median_ms': round(percentile(timings, 0.5), 4),
+        'p95_ms': round(percentile(timings, 0.95), 4),
+        'min_ms': round(timings[0], 4),
+        'rows': rows,
+    }
+
+
+def prepare_dataset(scale, seed, data_dir):
+    """Cesta k vygenerované databázi dané velikosti (vytvoří se jen poprvé)"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'knihomat_{scale}_{seed}.db')
+    if not os.path.exists(path):
+        print(f"Generuji data {scale}...")
+        start = time.perf_counter()
+        tmp_path = path + '.tmp'
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(tmp_path + suffix):
+                os.remove(tmp_path + suffix)
+        db = Database(tmp_path, instrument=False)
+        generate_dataset(db, seed=seed, **SCALES[scale])
+        db.close()
+        os.replace(tmp_path, path)
+        print(f"Data {scale} vygenerována za {time.perf_counter() - start:.1f} s")
+    return path
+
+
+def bench_suite(args):
+    """Časy všech metod Database nad syntetickými daty zvolených velikostí"""
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'sqlite_version': sqlite3.sqlite_version,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'scales': {},
+    }
+    work_dir = tempfile.mkdtemp()
+    for scale in args.scales.split(','):
+        if scale not in SCALES:
+            print(f"Neznámá velikost dat: {scale} (možnosti: {', '.join(SCALES)})")
+            return 1
+        # Zápisy při měření mění data -> každé měření nad čerstvou kopií
+        work_path = os.path.join(work_dir, f'knihomat_{scale}.db')
+        shutil.copyfile(prepare_dataset(scale, args.seed, args.data_dir), work_path)
+
+        db = Database(work_path)
+        sizes = SCALES[scale]
+        scale_results = {'rows': dict(sizes), 'methods': {}}
+        print(f"\n{scale}: {sizes}")
+        print(f"{'metoda':<32}{'volání':>8}{'medián ms':>12}{'p95 ms':>10}{'řádky':>9}")
+        for name, call in suite_calls(db, sizes, random.Random(args.seed)).items():
+            stats = measure(call, args.repeat, args.budget)
+            scale_results['methods'][name] = stats
+            print(f"{name:<32}{stats['calls']:>8}{stats['median_ms']:>12.3f}{stats['p95_ms']:>10.3f}"
+                  f"{stats['rows']:>9}")
+        db.close()
+        os.remove(work_path)
+        results['scales'][scale] = scale_results
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nVýsledky uloženy do {args.output}")
+    return 0
+
+
+def compare_results(baseline, current, tolerance, min_ms):
+    """Porovnání mediánů dvou běhů suite - vrací seznam (scale, metoda, před, po, stav)"""
+    rows = []
+    for scale, scale_results in current['scales'].items():
+        base_methods = baseline['scales'].get(scale, {}).get('methods', {})
+        for name, stats in scale_results['methods'].items():
+            if name not in base_methods:
+                rows.append((scale, name, None, stats['median_ms'], 'nová'))
+                continue
+            before, after = base_methods[name]['median_ms'], stats['median_ms']
+            if after > before * (1 + tolerance) and after - before > min_ms:
+                status = 'REGRESE'
+            elif after < before * (1 - tolerance) and before - after > min_ms:
+                status = 'zlepšení'
+            else:
+                status = 'OK'
+            rows.append((scale, name, before, after, status))
+    return rows
+
+
+def bench_compare(args):
+    """Porovnání výsledků suite s uloženou baseline, při regresi vrací 1"""
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+
+    rows = compare_results(baseline, current, args.tolerance, args.min_ms)
+    print(f"{'data':<6}{'metoda':<32}{'baseline ms':>12}{'nyní ms':>10}{'změna':>9}  stav")
+    for scale, name, before, after, status in rows:
+        change = f"{(after / before - 1) * 100:+.0f} %" if before else '-'
+        before_text = f"{before:.3f}" if before is not None else '-'
+        print(f"{scale:<6}{name:<32}{before_text:>12}{after:>10.3f}{change:>9}  {status}")
+
+    regressions = sum(row[4] == 'REGRESE' for row in rows)
+    if regressions:
+        print(f"\n{regressions} metod je pomalejších než baseline o více než {args.tolerance * 100:.0f} %!")
+        return 1
+    print("\nBez regresí.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarky databáze Knihomatu')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pool_parser = subparsers.add_parser('pool', help='pool spojení vs. spojení pro každé volání')
+    pool_parser.add_argument('--calls', type=int, default=1000)
+    pool_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    pool_parser.set_defaults(func=bench_pool)
+
+    search_parser = subparsers.add_parser('search', help='vyhledávání LIKE vs. FTS5')
+    search_parser.add_argument('--books', type=int, default=100000)
+    search_parser.add_argument('--calls', type=int, default=5)
+    search_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    search_parser.set_defaults(func=bench_search)
+
+    checkout_parser = subparsers.add_parser('checkout', help='souběžné nákupy z více procesů')
+    checkout_parser.add_argument('--processes', type=int, default=8)
+    checkout_parser.add_argument('--books', type=int, default=500)
+    checkout_parser.add_argument('--legacy', action='store_true', help='původní neatomická implementace')
+    checkout_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    checkout_parser.set_defaults(func=bench_checkout)
+
+    conversation_parser = subparsers.add_parser('conversation', help='souběžné vytváření konverzací')
+    conversation_parser.add_argument('--processes', type=int, default=8)
+    conversation_parser.add_argument('--conversations', type=int, default=200)
+    conversation_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    conversation_parser.set_defaults(func=bench_conversation)
+
+    inbox_parser = subparsers.add_parser('inbox', help='seznam konverzací uživatele s mnoha vlákny')
+    inbox_parser.add_argument('--threads', type=int, default=300)
+    inbox_parser.add_argument('--messages', type=int, default=20)
+    inbox_parser.add_argument('--calls', type=int, default=50)
+    inbox_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    inbox_parser.set_defaults(func=bench_inbox)
+
+    receipts_parser = subparsers.add_parser('receipts', help='potvrzení přečtení po zprávách vs. hromadně')
+    receipts_parser.add_argument('--messages', type=int, default=500)
+    receipts_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    receipts_parser.set_defaults(func=bench_receipts)
+
+    chat_parser = subparsers.add_parser('chat', help='zpoždění zprávy od odeslání po vykreslení')
+    chat_parser.add_argument('--messages', type=int, default=30)
+    chat_parser.add_argument('--interval', type=float, default=0.3, help='průměrná pauza mezi zprávami (s)')
+    chat_parser.add_argument('--poll-interval', type=float, default=2.0, help='interval původního dotazování (s)')
+    chat_parser.add_argument('--modes', default='poll,push,server')
+    chat_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    chat_parser.set_defaults(func=bench_chat)
+
+    history_parser = subparsers.add_parser('history', help='otevření dlouhého chatu po stránkách')
+    history_parser.add_argument('--messages', type=int, default=5000)
+    history_parser.add_argument('--page-size', type=int, default=MESSAGES_PAGE_SIZE)
+    history_parser.add_argument('--keep', type=int, default=150, help='nejvýš tolik zobrazených zpráv')
+    history_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    history_parser.set_defaults(func=bench_history)
+
+    outbox_parser = subparsers.add_parser('outbox', help='zápisy zpráv přímo vs. přes outbox')
+    outbox_parser.add_argument('--writes', type=int, default=500)
+    outbox_parser.add_argument('--interval', type=float, default=0.0, help='průměrná pauza mezi zápisy (s)')
+    outbox_parser.add_argument('--server', action='store_true', help='zápisy přes HTTP server')
+    outbox_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    outbox_parser.set_defaults(func=bench_outbox)
+
+    records_parser = subparsers.add_parser('records', help='paměť na řádek podle typu záznamů')
+    records_parser.add_argument('--books', type=int, default=100000)
+    records_parser.add_argument('--db', help='cesta k databázi (výchozí: dočasný soubor)')
+    records_parser.set_defaults(func=bench_records)
+
+    suite_parser = subparsers.add_parser('suite', help='časy všech metod Database nad syntetickými daty')
+    suite_parser.add_argument('--scales', default='1k', help=f"velikosti dat oddělené čárkou ({', '.join(SCALES)})")
+    suite_parser.add_argument('--repeat', type=int, default=50, help='nejvýš tolik volání každé metody')
+    suite_parser.add_argument('--budget', type=float, default=2.0, help='nejvýš tolik sekund na metodu')
+    suite_parser.add_argument('--seed', type=int, default=42)
+    suite_parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'knihomat_datasets'),
+                              help='adresář pro vygenerované databáze (znovu použité)')
+    suite_parser.add_argument('--output', help='uložit výsledky do JSON souboru')
+    suite_parser.set_defaults(func=bench_suite)
+
+    compare_parser = subparsers.add_parser('compare', help='porovnání výsledků suite s baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.25, help='povolené zpomalení (0.25 = 25 %%)')
+    compare_parser.add_argument('--min-ms', type=float, default=0.05, help='menší rozdíly jsou šum')
+    compare_parser.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
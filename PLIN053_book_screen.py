@@ -5,11 +5,17 @@ from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.scrollview import ScrollView
+from kivy.clock import Clock
 
-from PLIN053_utils import show_popup, get_current_user, get_database
+from PLIN053_utils import (show_popup, get_current_user, get_database, get_async_database, get_read_receipts,
+                           get_outbox)
+from PLIN053_database import parse_price
 
 # Instance databáze
 db = get_database()
+async_db = get_async_database()
+outbox = get_outbox()
+read_receipts = get_read_receipts()
 
 class HomeScreen(Screen):
     """Hlavní obrazovka s nabídkou knih"""
@@ -26,13 +32,13 @@ class HomeScreen(Screen):
 
         nav_layout = BoxLayout(size_hint_x=0.6, spacing=5)
 
-        messages_btn = Button(text='Zprávy', size_hint_x=0.5)
-        messages_btn.bind(on_press=lambda x: setattr(self.manager, 'current', 'conversations'))
+        self.messages_btn = Button(text='Zprávy', size_hint_x=0.5)
+        self.messages_btn.bind(on_press=lambda x: setattr(self.manager, 'current', 'conversations'))
 
         profile_btn = Button(text='Profil', size_hint_x=0.5)
         profile_btn.bind(on_press=lambda x: setattr(self.manager, 'current', 'profile'))
 
-        nav_layout.add_widget(messages_btn)
+        nav_layout.add_widget(self.messages_btn)
         nav_layout.add_widget(profile_btn)
         header.add_widget(nav_layout)
 
@@ -45,43 +51,85 @@ class HomeScreen(Screen):
         search_layout.add_widget(self.search_input)
         search_layout.add_widget(search_btn)
 
-        # Seznam knih (scroll view)
+        # Seznam knih (scroll view) - další stránky se načítají při posunu dolů
         scroll = ScrollView(size_hint_y=0.8)
+        scroll.bind(scroll_y=self.on_scroll)
         self.books_layout = BoxLayout(orientation='vertical', spacing=10, size_hint_y=None)
         self.books_layout.bind(minimum_height=self.books_layout.setter('height'))
 
         scroll.add_widget(self.books_layout)
 
+        # Stav stránkování
+        self.search_query = None
+        self.next_cursor = None
+        # Stav dat při posledním načtení (pro přeskočení zbytečného načítání)
+        self.books_token = None
+        self.unread_token = None
+
         layout.add_widget(header)
         layout.add_widget(search_layout)
         layout.add_widget(scroll)
 
         self.add_widget(layout)
 
+        # Počet nepřečtených zpráv na tlačítku Zprávy
+        Clock.schedule_interval(self.refresh_unread, 5)
+        read_receipts.add_listener(self.load_unread)
+
     def on_enter(self):
         """Zavolá se při vstupu na obrazovku"""
         current_user = get_current_user()
         if current_user:
             self.welcome_label.text = f"Vítejte, {current_user['name']}!"
+        self.load_unread()
+
+        # Stav knih se zjišťuje na pozadí (u vzdálené databáze je to požadavek)
+        async_db.get_change_token('books', 'users', callback=self.check_books,
+                                  error_callback=lambda e: self.check_books(None), tag='home_books_token')
+
+    def check_books(self, token):
+        """Pokud se knihy od posledního načtení nezměnily, seznam zůstává"""
+        if token is not None and token == self.books_token:
+            return
+        self.books_token = token
         self.load_books()
 
-    def load_books(self):
-        """Načtení knih z databáze"""
-        self.books_layout.clear_widgets()
-        books = db.get_all_books()
+    def load_unread(self):
+        """Načtení počtu nepřečtených zpráv (jeden dotaz na souhrny konverzací)"""
+        if not get_current_user():
+            self.messages_btn.text = 'Zprávy'
+            return
+        async_db.get_change_token('messages', 'conversations', callback=self.load_unread_counts,
+                                  error_callback=lambda e: self.load_unread_counts(None), tag='home_unread')
 
-        if not books:
-            no_books = Label(text='Zatím žádné knihy k prodeji', size_hint_y=None, height=60)
-            self.books_layout.add_widget(no_books)
+    def load_unread_counts(self, token):
+        """Dotaz na nepřečtené zprávy se stavem zpráv zjištěným před ním"""
+        current_user = get_current_user()
+        if not current_user:
             return
+        self.unread_token = token
+        async_db.get_unread_counts(current_user['id'], callback=self.show_unread, tag='home_unread')
 
-        for book in books:
-            book_id, title, author, price, condition, description, seller_name = book
+    def show_unread(self, result):
+        """Zobrazení počtu nepřečtených zpráv na tlačítku Zprávy"""
+        counts, total = result
+        self.messages_btn.text = f'Zprávy ({total})' if total else 'Zprávy'
 
-            book_text = f"{title} - {author}\n{price} Kč | {condition} | Prodává: {seller_name}"
-            book_btn = Button(text=book_text, size_hint_y=None, height=80, text_size=(None, None))
-            book_btn.bind(on_press=lambda x, book_data=book: self.view_book_detail(book_data))
-            self.books_layout.add_widget(book_btn)
+    def refresh_unread(self, dt):
+        """Pravidelná kontrola nových zpráv, jen pokud se zprávy změnily"""
+        if self.manager and self.manager.current == self.name and get_current_user():
+            async_db.get_change_token('messages', 'conversations', callback=self.check_unread,
+                                      tag='home_unread_token')
+
+    def check_unread(self, token):
+        """Nové načtení nepřečtených zpráv, jen pokud se od minula změnily"""
+        if token is None or token != self.unread_token:
+            self.load_unread_counts(token)
+
+    def load_books(self):
+        """Načtení první stránky knih z databáze (na pozadí)"""
+        self.search_query = None
+        async_db.get_books_page(callback=self.show_first_page, tag='home_books')
 
     def search_books(self, instance):
         """Vyhledání knih"""
@@ -90,18 +138,52 @@ class HomeScreen(Screen):
             self.load_books()
             return
 
+        # Novější vyhledávání zruší dosud nedokončené starší
+        self.search_query = query
+        async_db.search_books_page(query, callback=self.show_first_page, tag='home_books')
+
+    def show_first_page(self, result):
+        """Zobrazení první stránky seznamu nebo výsledků vyhledávání"""
+        books, self.next_cursor = result
         self.books_layout.clear_widgets()
-        books = db.search_books(query)
 
         if not books:
-            no_books = Label(text=f'Žádné knihy nenalezeny pro "{query}"', size_hint_y=None, height=60)
-            self.books_layout.add_widget(no_books)
+            if self.search_query:
+                text = f'Žádné knihy nenalezeny pro "{self.search_query}"'
+            else:
+                text = 'Zatím žádné knihy k prodeji'
+            self.books_layout.add_widget(Label(text=text, size_hint_y=None, height=60))
             return
 
-        for book in books:
-            book_id, title, author, price, condition, description, seller_name = book
+        self.add_book_buttons(books)
 
-            book_text = f"{title} - {author}\n{price} Kč | {condition} | Prodává: {seller_name}"
+    def load_next_page(self):
+        """Načtení další stránky knih (seznamu nebo výsledků vyhledávání)"""
+        if not self.next_cursor:
+            return
+
+        # Kurzor se vynuluje, aby se stejná stránka nenačítala vícekrát
+        cursor, self.next_cursor = self.next_cursor, None
+        if self.search_query:
+            async_db.search_books_page(self.search_query, cursor,
+                                       callback=self.show_next_page, tag='home_books')
+        else:
+            async_db.get_books_page(cursor, callback=self.show_next_page, tag='home_books')
+
+    def show_next_page(self, result):
+        """Připojení další stránky na konec seznamu"""
+        books, self.next_cursor = result
+        self.add_book_buttons(books)
+
+    def on_scroll(self, scroll, scroll_y):
+        """Při posunu na konec seznamu se načte další stránka"""
+        if scroll_y <= 0 and self.next_cursor:
+            self.load_next_page()
+
+    def add_book_buttons(self, books):
+        """Přidání tlačítek knih na konec seznamu"""
+        for book in books:
+            book_text = f"{book.title} - {book.author}\n{book.price} Kč | {book.condition} | Prodává: {book.seller_name}"
             book_btn = Button(text=book_text, size_hint_y=None, height=80, text_size=(None, None))
             book_btn.bind(on_press=lambda x, book_data=book: self.view_book_detail(book_data))
             self.books_layout.add_widget(book_btn)
@@ -157,17 +239,17 @@ class BookDetailScreen(Screen):
         if not self.book_data:
             return
 
-        book_id, title, author, price, condition, description, seller_name = self.book_data
+        book = self.book_data
 
         self.book_info.clear_widgets()
 
-        self.book_info.add_widget(Label(text=title, font_size=20))
-        self.book_info.add_widget(Label(text=f'Autor: {author}'))
-        self.book_info.add_widget(Label(text=f'Stav: {condition}'))
-        self.book_info.add_widget(Label(text=f'Cena: {price} Kč', font_size=18))
-        self.book_info.add_widget(Label(text=f'Prodává: {seller_name}'))
-        if description:
-            self.book_info.add_widget(Label(text=f'Popis: {description}'))
+        self.book_info.add_widget(Label(text=book.title, font_size=20))
+        self.book_info.add_widget(Label(text=f'Autor: {book.author}'))
+        self.book_info.add_widget(Label(text=f'Stav: {book.condition}'))
+        self.book_info.add_widget(Label(text=f'Cena: {book.price} Kč', font_size=18))
+        self.book_info.add_widget(Label(text=f'Prodává: {book.seller_name}'))
+        if book.description:
+            self.book_info.add_widget(Label(text=f'Popis: {book.description}'))
 
     def buy_book(self, instance):
         """Zahájení procesu nákupu knihy"""
@@ -181,17 +263,24 @@ class BookDetailScreen(Screen):
             show_popup("Chyba", "Chyba při načítání dat knihy!")
             return
 
-        book_id = self.book_data[0]
-        seller_id = db.get_seller_id_by_book(book_id)
+        book_id = self.book_data.id
+        async_db.get_book_details(
+            book_id, callback=lambda book_details: self.start_purchase(book_id, book_details),
+            tag='book_detail')
+
+    def start_purchase(self, book_id, book_details):
+        """Kontrola knihy a přechod na obrazovku nákupu"""
+        current_user = get_current_user()
+        if not current_user:
+            return
 
         # Kontrola, zda uživatel nekupuje vlastní knihu
-        if seller_id == current_user['id']:
+        if book_details and book_details.seller_id == current_user['id']:
             show_popup("Info", "Nemůžete koupit vlastní knihu!")
             return
 
         # Kontrola, zda kniha ještě není prodaná
-        book_details = db.get_book_details(book_id)
-        if book_details and book_details[9]:  # is_sold je na indexu 9
+        if book_details and book_details.is_sold:
             show_popup("Info", "Tato kniha již byla prodána!")
             return
 
@@ -211,8 +300,16 @@ class BookDetailScreen(Screen):
             show_popup("Chyba", "Chyba při načítání dat knihy!")
             return
 
-        book_id = self.book_data[0]
-        seller_id = db.get_seller_id_by_book(book_id)
+        book_id = self.book_data.id
+        async_db.get_seller_id_by_book(
+            book_id, callback=lambda seller_id: self.open_conversation(book_id, seller_id),
+            tag='book_detail')
+
+    def open_conversation(self, book_id, seller_id):
+        """Vytvoření nebo získání konverzace s prodávajícím"""
+        current_user = get_current_user()
+        if not current_user:
+            return
 
         if not seller_id:
             show_popup("Chyba", "Nepodařilo se najít prodávajícího!")
@@ -224,8 +321,11 @@ class BookDetailScreen(Screen):
             return
 
         # Vytvoření nebo získání konverzace
-        conversation_id = db.create_or_get_conversation(book_id, current_user['id'], seller_id)
+        async_db.create_or_get_conversation(
+            book_id, current_user['id'], seller_id, callback=self.show_conversation, tag='book_detail')
 
+    def show_conversation(self, conversation_id):
+        """Přechod na chat s vytvořenou konverzací"""
         if conversation_id:
             # Přechod na chat
             chat_screen = self.manager.get_screen('chat')
@@ -305,22 +405,17 @@ class AddBookScreen(Screen):
             return
 
         try:
-            price = float(price_text)
-            if price <= 0:
-                raise ValueError()
+            price = parse_price(price_text)
         except ValueError:
             show_popup("Chyba", "Zadejte platnou cenu!")
             return
 
-        # Uložení do databáze
-        success, message = db.add_book(title, author, price, condition, description, current_user['id'])
-
-        if success:
-            show_popup("Úspěch", message)
-            self.clear_form()
-            self.manager.current = 'home'
-        else:
-            show_popup("Chyba", message)
+        # Uložení do outboxu, do databáze knihu zapíše vlákno na pozadí.
+        # Moje knihy ji zobrazí hned, nabídka až po zápisu.
+        outbox.add_book(title, author, price, condition, description, current_user['id'])
+        show_popup("Úspěch", "Kniha byla přidána!")
+        self.clear_form()
+        self.manager.current = 'my_books'
 
     def clear_form(self):
         """Vymazání formuláře"""
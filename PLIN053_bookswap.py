@@ -1,4 +1,7 @@
+import os
+
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager
 
 from PLIN053_login_screen import LoginScreen, RegisterScreen
@@ -7,6 +10,11 @@ from PLIN053_profile_screen import ProfileScreen
 from PLIN053_chat_screen import ConversationsScreen, ChatScreen
 from PLIN053_purchase_screen import PurchaseScreen, OrdersScreen
 from PLIN053_my_books import MyBooksScreen
+from PLIN053_database import Database
+from PLIN053_utils import get_database, get_async_database, get_read_receipts, get_outbox
+
+# Za kolik sekund po startu aplikace se spustí údržba databáze
+MAINTENANCE_DELAY = 30
 
 class BookSellingApp(App):
 
@@ -30,5 +38,31 @@ class BookSellingApp(App):
 
         return sm
 
+    def on_start(self):
+        # Archivace starých dat a vrácení volného místa na pozadí,
+        # až aplikace nebude zaneprázdněná startem (databázi na serveru
+        # udržuje server sám)
+        if isinstance(get_database(), Database):
+            Clock.schedule_once(self.run_maintenance, MAINTENANCE_DELAY)
+
+    def run_maintenance(self, dt=None):
+        get_async_database().run_maintenance(tag='maintenance')
+
+    def on_stop(self):
+        # Zápis odložených potvrzení přečtení, ukončení vláken na pozadí
+        # a uzavření spojení k databázi (neodeslané zápisy z outboxu
+        # zůstávají uložené a odejdou po příštím spuštění)
+        get_read_receipts().flush(wait=True)
+        get_outbox().close()
+        get_async_database().shutdown()
+        db = get_database()
+        # Statistiky dotazů z běhu aplikace (pro sběr z testovacích zařízení)
+        if isinstance(db, Database):
+            try:
+                db.dump_query_stats(os.path.join(self.user_data_dir, 'query_stats.json'))
+            except OSError as e:
+                print(f"Chyba při ukládání statistik dotazů: {str(e)}")
+        db.close()
+
 if __name__ == '__main__':
     BookSellingApp().run()
\ No newline at end of file
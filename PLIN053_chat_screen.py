@@ -1,3 +1,5 @@
+from collections import deque
+
 from kivy.uix.screenmanager import Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
@@ -6,10 +8,21 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.scrollview import ScrollView
 from kivy.clock import Clock
 
-from PLIN053_utils import show_popup, get_current_user, get_database
+from PLIN053_utils import (show_popup, get_current_user, get_database, get_async_database, get_read_receipts,
+                           get_outbox)
 
 # Instance databáze
 db = get_database()
+async_db = get_async_database()
+read_receipts = get_read_receipts()
+outbox = get_outbox()
+
+# Nové zprávy chodí přes db.events, dotazování je jen pojistka
+# (zápisy mimo tento proces, výpadek spojení se serverem)
+FALLBACK_POLL_INTERVAL = 15
+
+# Nejvýš tolik zpráv drží chat jako widgety, vzdálenější stránky se uvolní
+MAX_CHAT_MESSAGES = 150
 
 class ConversationsScreen(Screen):
     """Obrazovka se seznamem konverzací"""
@@ -41,18 +54,29 @@ class ConversationsScreen(Screen):
 
         self.add_widget(layout)
 
+        # Po zápisu potvrzení přečtení se aktualizují počty nepřečtených
+        read_receipts.add_listener(self.on_messages_read)
+
     def on_enter(self):
         """Načtení konverzací při vstup na obrazovku"""
         self.load_conversations()
 
+    def on_messages_read(self):
+        if self.manager and self.manager.current == self.name:
+            self.load_conversations()
+
     def load_conversations(self):
         """Načtení všech konverzací uživatele"""
         current_user = get_current_user()
         if not current_user:
             return
 
+        async_db.get_user_conversations(
+            current_user['id'], callback=self.show_conversations, tag='conversations')
+
+    def show_conversations(self, conversations):
+        """Zobrazení načtených konverzací"""
         self.conversations_layout.clear_widgets()
-        conversations = db.get_user_conversations(current_user['id'])
 
         if not conversations:
             no_conversations = Label(text='Zatím žádné konverzace', size_hint_y=None, height=60)
@@ -60,13 +84,15 @@ class ConversationsScreen(Screen):
             return
 
         for conversation in conversations:
-            conv_id, book_title, book_author, other_user, user_role, created_at = conversation
-
-            role_text = "Kupujete" if user_role == "buyer" else "Prodáváte"
-            conv_text = f"{book_title} - {book_author}\n{role_text} | {other_user}"
-
-            conv_btn = Button(text=conv_text, size_hint_y=None, height=80, text_size=(None, None))
-            conv_btn.bind(on_press=lambda x, c_id=conv_id: self.open_conversation(c_id))
+            role_text = "Kupujete" if conversation.user_role == "buyer" else "Prodáváte"
+            conv_text = f"{conversation.book_title} - {conversation.book_author}\n{role_text} | {conversation.other_user}"
+            if conversation.unread_count:
+                conv_text += f" | Nepřečtené: {conversation.unread_count}"
+            if conversation.last_message:
+                conv_text += f"\n{conversation.last_message}"
+
+            conv_btn = Button(text=conv_text, size_hint_y=None, height=100, text_size=(None, None))
+            conv_btn.bind(on_press=lambda x, c_id=conversation.id: self.open_conversation(c_id))
             self.conversations_layout.add_widget(conv_btn)
 
     def open_conversation(self, conversation_id):
@@ -83,6 +109,23 @@ class ChatScreen(Screen):
         super().__init__(**kwargs)
         self.conversation_id = None
         self.conversation_info = None
+        # ID poslední zobrazené zprávy pro každou konverzaci
+        self.last_message_ids = {}
+        # Stav tabulky zpráv při poslední kontrole
+        self.messages_token = None
+        # Uživatel, pro kterého je obrazovka přihlášená k db.events
+        self.subscribed_user_id = None
+        # Zobrazené zprávy (id, widget) od nejstarší po nejnovější
+        self.message_widgets = deque()
+        # Kurzory historie: starší zprávy před older_cursor, novější za
+        # newer_cursor (None = dole jsou nejnovější zprávy konverzace)
+        self.older_cursor = None
+        self.newer_cursor = None
+        self.loading_history = False
+        self.refresh_pending = False
+        # Odesílané zprávy z outboxu (klíč -> widget), zobrazené pod ostatními
+        self.pending_labels = {}
+        outbox.add_listener(self.on_outbox_result)
 
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
@@ -97,11 +140,12 @@ class ChatScreen(Screen):
         header.add_widget(back_btn)
         header.add_widget(self.header_info)
 
-        # Oblast pro zprávy
-        scroll = ScrollView(size_hint_y=0.7)
+        # Oblast pro zprávy - starší stránky se načítají při posunu nahoru
+        self.scroll = ScrollView(size_hint_y=0.7)
+        self.scroll.bind(scroll_y=self.on_scroll)
         self.messages_layout = BoxLayout(orientation='vertical', spacing=5, size_hint_y=None)
         self.messages_layout.bind(minimum_height=self.messages_layout.setter('height'))
-        scroll.add_widget(self.messages_layout)
+        self.scroll.add_widget(self.messages_layout)
 
         # Vstupní pole pro novou zprávu
         input_layout = BoxLayout(size_hint_y=0.2, spacing=10)
@@ -114,59 +158,264 @@ class ChatScreen(Screen):
         input_layout.add_widget(send_btn)
 
         layout.add_widget(header)
-        layout.add_widget(scroll)
+        layout.add_widget(self.scroll)
         layout.add_widget(input_layout)
 
         self.add_widget(layout)
 
-        # Pravidelná aktualizace zpráv
-        Clock.schedule_interval(self.refresh_messages, 2)
+        # Záložní aktualizace zpráv
+        Clock.schedule_interval(self.refresh_messages, FALLBACK_POLL_INTERVAL)
 
     def set_conversation(self, conversation_id):
         """Nastavení konverzace pro zobrazení"""
         self.conversation_id = conversation_id
 
         # Načtení informací o konverzaci
-        self.conversation_info = db.get_conversation_info(conversation_id)
-
-        if self.conversation_info:
-            conv_id, book_title, book_author, book_price, seller_name, buyer_name, book_id = self.conversation_info
-            self.header_info.text = f"{book_title} - {book_author}"
+        self.conversation_info = None
+        self.header_info.text = 'Chat'
+        async_db.get_conversation_info(
+            conversation_id, callback=lambda info: self.show_conversation_info(conversation_id, info),
+            tag='chat_info')
 
         # Načtení zpráv
         self.load_messages()
 
+    def show_conversation_info(self, conversation_id, info):
+        """Zobrazení informací o konverzaci v hlavičce"""
+        if conversation_id != self.conversation_id:
+            return
+
+        self.conversation_info = info
+        if self.conversation_info:
+            self.header_info.text = f"{info.book_title} - {info.book_author}"
+
     def load_messages(self):
-        """Načtení všech zpráv v konverzaci"""
+        """Načtení poslední stránky zpráv v konverzaci"""
         if not self.conversation_id:
             return
 
         self.messages_layout.clear_widgets()
-        messages = db.get_messages(self.conversation_id)
+        self.message_widgets.clear()
+        self.pending_labels.clear()
+        self.older_cursor = None
+        self.newer_cursor = None
+        self.last_message_ids[self.conversation_id] = 0
 
-        for message in messages:
-            msg_id, msg_text, created_at, sender_id, sender_name = message
+        # Zprávy, které ještě čekají v outboxu
+        current_user = get_current_user()
+        if current_user:
+            for entry in outbox.pending(current_user['id'], 'send_message'):
+                if entry.args['conversation_id'] == self.conversation_id:
+                    self.show_pending_message(entry)
+
+        self.load_history(callback=self.show_latest_page)
+
+    def load_history(self, callback, **cursor):
+        """Načtení stránky historie (bez kurzoru nejnovější, jinak before_id/after_id)"""
+        conversation_id = self.conversation_id
+        self.loading_history = True
+        async_db.get_messages_page(
+            conversation_id, **cursor,
+            callback=lambda result: callback(conversation_id, result),
+            error_callback=self.history_failed, tag='chat_history')
+
+    def history_failed(self, error):
+        self.loading_history = False
+        print(f"Chyba při načítání historie zpráv: {str(error)}")
+
+    def show_latest_page(self, conversation_id, result):
+        """Zobrazení nejnovějších zpráv po otevření chatu"""
+        if conversation_id != self.conversation_id:
+            return
+
+        messages, self.older_cursor = result
+        self.loading_history = False
+        self.show_new_messages(conversation_id, messages)
+        self.scroll.scroll_y = 0  # Nejnovější zprávy jsou dole
+
+        # Zprávy doručené během načítání stránky
+        if self.refresh_pending:
+            self.refresh_pending = False
+            self.append_new_messages()
 
-            current_user = get_current_user()
-            # Určení, jestli je zpráva od aktuálního uživatele
-            is_my_message = current_user and sender_id == current_user['id']
+    def on_scroll(self, scroll, scroll_y):
+        """Na horním okraji se načte starší stránka, na dolním novější (pokud byla uvolněna)"""
+        if self.loading_history or not self.conversation_id:
+            return
+        if scroll_y >= 1 and self.older_cursor:
+            self.load_history(callback=self.show_older_page, before_id=self.older_cursor)
+        elif scroll_y <= 0 and self.newer_cursor:
+            self.load_history(callback=self.show_newer_page, after_id=self.newer_cursor)
+
+    def show_older_page(self, conversation_id, result):
+        """Vložení starší stránky nad zobrazené zprávy"""
+        if conversation_id != self.conversation_id:
+            return
 
-            # Vytvoření zprávy s informací o odesílateli
-            if is_my_message:
-                message_text = f"Já: {msg_text}"
-                # Můžete přidat jiné styling pro vlastní zprávy
+        messages, self.older_cursor = result
+        self.loading_history = False
+        current_user = get_current_user()
+        spacing = self.messages_layout.spacing
+        added = 0
+        for message in reversed(messages):
+            label = self.create_message_label(message, current_user)
+            self.messages_layout.add_widget(label, index=len(self.messages_layout.children))
+            self.message_widgets.appendleft((message.id, label))
+            added += label.height + spacing
+
+        removed = self.evict_messages(from_top=False)
+        self.keep_scroll_position(-removed, added - removed)
+
+    def show_newer_page(self, conversation_id, result):
+        """Připojení novější stránky pod zobrazené zprávy (po uvolnění dolních stránek)"""
+        if conversation_id != self.conversation_id:
+            return
+
+        messages, self.newer_cursor = result
+        self.loading_history = False
+        added = self.add_message_labels(messages)
+        if self.newer_cursor is None and self.message_widgets:
+            # Dole jsou zase nejnovější zprávy -> znovu platí doručování
+            self.last_message_ids[conversation_id] = self.message_widgets[-1][0]
+            self.append_new_messages()
+        removed = self.evict_messages(from_top=True)
+        self.keep_scroll_position(added, added - removed)
+
+    def add_message_labels(self, messages):
+        """Připojení zpráv na konec seznamu, vrací přidanou výšku"""
+        current_user = get_current_user()
+        spacing = self.messages_layout.spacing
+        added = 0
+        for message in messages:
+            label = self.create_message_label(message, current_user)
+            # Nad odesílané zprávy, ty zůstávají dole
+            self.messages_layout.add_widget(label, index=len(self.pending_labels))
+            self.message_widgets.append((message.id, label))
+            added += label.height + spacing
+        return added
+
+    def evict_messages(self, from_top):
+        """Uvolnění zpráv nad MAX_CHAT_MESSAGES z opačného konce, vrací odebranou výšku"""
+        spacing = self.messages_layout.spacing
+        removed = 0
+        while len(self.message_widgets) > MAX_CHAT_MESSAGES:
+            message_id, label = self.message_widgets.popleft() if from_top else self.message_widgets.pop()
+            self.messages_layout.remove_widget(label)
+            removed += label.height + spacing
+        if removed:
+            if from_top:
+                self.older_cursor = self.message_widgets[0][0]
             else:
-                message_text = f"{sender_name}: {msg_text}"
+                self.newer_cursor = self.message_widgets[-1][0]
+        return removed
+
+    def keep_scroll_position(self, change_below, change_total):
+        """Zachování zobrazených zpráv na místě po změně obsahu.
+
+        change_below je změna výšky obsahu pod zobrazenou částí,
+        change_total celková změna výšky seznamu zpráv.
+        """
+        viewport = self.scroll.height
+        height = self.messages_layout.height
+        offset = self.scroll.scroll_y * max(height - viewport, 0)
+        scroll_range = height + change_total - viewport
+        self.scroll.scroll_y = min(1.0, max(0.0, (offset + change_below) / scroll_range)) if scroll_range > 0 else 1.0
+
+    def append_new_messages(self):
+        """Přidání pouze zpráv novějších než poslední zobrazená"""
+        if not self.conversation_id:
+            return
+        if self.loading_history:
+            # Nové zprávy se doplní po načtení stránky historie
+            self.refresh_pending = True
+            return
+        if self.newer_cursor is not None:
+            # Nejnovější zprávy nejsou zobrazené, doplní je posun dolů
+            return
+
+        conversation_id = self.conversation_id
+        last_id = self.last_message_ids.get(conversation_id, 0)
+        async_db.get_messages_since(
+            conversation_id, last_id,
+            callback=lambda messages: self.show_new_messages(conversation_id, messages),
+            tag='chat_messages')
+
+    def show_new_messages(self, conversation_id, messages):
+        """Připojení načtených zpráv, pokud je konverzace stále otevřená"""
+        if conversation_id != self.conversation_id:
+            return
 
-            message_label = Label(
-                text=message_text,
-                size_hint_y=None,
-                height=40,
-                text_size=(None, None),
-                halign='left' if not is_my_message else 'right'
-            )
+        # Zprávy mohly mezitím přibýt jiným požadavkem
+        last_id = self.last_message_ids.get(conversation_id, 0)
+        messages = [message for message in messages if message.id > last_id]
+        if not messages or self.newer_cursor is not None:
+            return
+
+        # Kdo je dole, zůstane u nejnovějších zpráv, jinak se čtené místo neposune
+        at_bottom = self.scroll.scroll_y <= 0
+        added = self.add_message_labels(messages)
+        removed = self.evict_messages(from_top=True)
+        if not at_bottom:
+            self.keep_scroll_position(added, added - removed)
+
+        self.last_message_ids[conversation_id] = messages[-1].id
+        current_user = get_current_user()
 
-            self.messages_layout.add_widget(message_label)
+        # Zobrazené zprávy jsou přečtené (zápis se odloží a sloučí)
+        if current_user:
+            read_receipts.mark(conversation_id, current_user['id'], messages[-1].id)
+
+    def on_enter(self):
+        """Příjem nových zpráv přes db.events, dokud je chat otevřený"""
+        current_user = get_current_user()
+        if current_user and self.subscribed_user_id is None:
+            self.subscribed_user_id = current_user['id']
+            db.events.subscribe(self.subscribed_user_id, self.on_message_event)
+
+    def on_message_event(self, event):
+        """Nová zpráva z db.events (volá se z vlákna na pozadí)"""
+        Clock.schedule_once(lambda dt: self.show_pushed_message(event))
+
+    def show_pushed_message(self, event):
+        """Připojení doručené zprávy bez dotazu do databáze"""
+        if event is None:
+            # Zprávy se mohly ztratit (výpadek spojení) -> načtení dotazem
+            self.append_new_messages()
+            return
+        if event.conversation_id != self.conversation_id or self.newer_cursor is not None:
+            return
+        if self.loading_history:
+            self.append_new_messages()  # Doplní se po načtení stránky historie
+            return
+
+        last_id = self.last_message_ids.get(self.conversation_id, 0)
+        if event.message.id <= last_id:
+            return
+        if (event.previous_id or 0) == last_id:
+            self.show_new_messages(self.conversation_id, [event.message])
+        else:
+            # Chybí zpráva mezi poslední zobrazenou a doručenou
+            self.append_new_messages()
+
+    def create_message_label(self, message, current_user):
+        """Vytvoření widgetu pro jednu zprávu"""
+        # Určení, jestli je zpráva od aktuálního uživatele
+        is_my_message = current_user and message.sender_id == current_user['id']
+
+        # Vytvoření zprávy s informací o odesílateli
+        if is_my_message:
+            message_text = f"Já: {message.message}"
+            # Můžete přidat jiné styling pro vlastní zprávy
+        else:
+            message_text = f"{message.sender_name}: {message.message}"
+
+        return Label(
+            text=message_text,
+            size_hint_y=None,
+            height=40,
+            text_size=(None, None),
+            halign='left' if not is_my_message else 'right'
+        )
 
     def send_message(self, instance):
         """Odeslání nové zprávy"""
@@ -179,19 +428,63 @@ class ChatScreen(Screen):
         if not message_text:
             return
 
-        # Odeslání zprávy do databáze
-        success = db.send_message(self.conversation_id, current_user['id'], message_text)
-
-        if success:
-            self.message_input.text = ""  # Vymazání inputu
-            self.load_messages()  # Znovu načtení zpráv
-        else:
+        # Zpráva se uloží do outboxu a hned zobrazí, do databáze ji pošle vlákno na pozadí
+        entry = outbox.send_message(self.conversation_id, current_user['id'], message_text)
+        self.message_input.text = ""  # Vymazání inputu
+        self.show_pending_message(entry)
+        self.scroll.scroll_y = 0
+
+    def show_pending_message(self, entry):
+        """Zobrazení zprávy z outboxu na konci chatu jako odesílané"""
+        label = Label(
+            text=f"Já: {entry.args['message']} (odesílá se)",
+            size_hint_y=None,
+            height=40,
+            text_size=(None, None),
+            color=(1, 1, 1, 0.6),
+            halign='right'
+        )
+        self.messages_layout.add_widget(label)
+        self.pending_labels[entry.key] = label
+
+    def on_outbox_result(self, entry, result):
+        """Výsledek zápisu z outboxu (volá se z vlákna na pozadí)"""
+        if entry.method == 'send_message':
+            Clock.schedule_once(lambda dt: self.message_sent(entry, result))
+
+    def message_sent(self, entry, result):
+        """Výsledek odeslání zprávy - odesílanou nahradí uložená zpráva"""
+        label = self.pending_labels.pop(entry.key, None)
+        if label is not None:
+            self.messages_layout.remove_widget(label)
+
+        success, value = result
+        if not success:
             show_popup("Chyba", "Nepodařilo se odeslat zprávu!")
+        elif entry.args['conversation_id'] == self.conversation_id and self.subscribed_user_id is None:
+            # Vlastní zprávu doručí db.events, bez přihlášení se doplní dotazem
+            self.append_new_messages()
 
     def refresh_messages(self, dt):
-        """Pravidelná aktualizace zpráv (pro real-time chat)"""
+        """Záložní kontrola nových zpráv, které nedoručily db.events"""
         if self.conversation_id and self.manager.current == 'chat':
-            self.load_messages()
+            async_db.get_change_token('messages', callback=self.check_messages, tag='chat_token')
+
+    def check_messages(self, token):
+        """Bez nových zápisů do zpráv není co načítat"""
+        if not self.conversation_id or self.manager.current != 'chat':
+            return
+        if token is not None and token == self.messages_token:
+            return
+        self.messages_token = token
+        self.append_new_messages()
+
+    def on_leave(self):
+        """Při odchodu z chatu se potvrzení přečtení zapíšou hned"""
+        if self.subscribed_user_id is not None:
+            db.events.unsubscribe(self.subscribed_user_id, self.on_message_event)
+            self.subscribed_user_id = None
+        read_receipts.flush()
 
     def go_back(self, instance):
         """Návrat na seznam konverzací"""
@@ -1,14 +1,1040 @@
 import sqlite3
+import functools
 import hashlib
+import json
 import os
-from datetime import datetime
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from kivy.utils import platform
 
-class Database:
+from PLIN053_records import Book, BookDetail, Conversation, Message, MessageEvent, Order, Record, record_factory
+
+# Výkonnostní profily SQLite aplikované na každé nové spojení.
+# Android má méně paměti a pomalejší úložiště než počítač.
+# auto_vacuum musí být před journal_mode - u nové databáze se tak nastaví
+# ještě před zápisem první stránky (u starší až po VACUUM, viz enable_auto_vacuum)
+PRAGMA_PROFILES = {
+    'desktop': {
+        'auto_vacuum': 'INCREMENTAL',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,        # záporná hodnota = KiB (64 MiB)
+        'mmap_size': 268435456,      # 256 MiB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,        # ms
+    },
+    'android': {
+        'auto_vacuum': 'INCREMENTAL',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -8192,         # 8 MiB
+        'mmap_size': 33554432,       # 32 MiB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+
+def default_profile_name():
+    """Název výchozího profilu pro aktuální platformu"""
+    return 'android' if platform == 'android' else 'desktop'
+
+
+def resolve_pragmas(profile=None, overrides=None):
+    """Sestavení PRAGMA nastavení z názvu profilu (nebo slovníku) a úprav"""
+    if profile is None:
+        profile = default_profile_name()
+    if isinstance(profile, str):
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"Neznámý PRAGMA profil: {profile}")
+        profile = PRAGMA_PROFILES[profile]
+
+    pragmas = dict(profile)
+    pragmas.update(overrides or {})
+
+    for name in pragmas:
+        if not name.isidentifier():
+            raise ValueError(f"Neplatný název PRAGMA: {name}")
+    return pragmas
+
+
+# Sekundární indexy pro časté dotazy (název, SQL).
+# Každý dotaz v Database musí mít svůj index - viz PLIN053_db_tools.py plans
+INDEXES = [
+    # get_all_books, search_books: WHERE is_sold = ? ORDER BY created_at DESC
+    ('idx_books_is_sold_created',
+     'CREATE INDEX IF NOT EXISTS idx_books_is_sold_created ON books (is_sold, created_at)'),
+    # get_user_books: WHERE seller_id = ? ORDER BY created_at DESC
+    ('idx_books_seller_created',
+     'CREATE INDEX IF NOT EXISTS idx_books_seller_created ON books (seller_id, created_at)'),
+    # get_messages: WHERE conversation_id = ? ORDER BY created_at
+    ('idx_messages_conversation_created',
+     'CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages (conversation_id, created_at)'),
+    # get_user_conversations: WHERE buyer_id = ? OR seller_id = ?
+    ('idx_conversations_buyer_created',
+     'CREATE INDEX IF NOT EXISTS idx_conversations_buyer_created ON conversations (buyer_id, created_at)'),
+    ('idx_conversations_seller_created',
+     'CREATE INDEX IF NOT EXISTS idx_conversations_seller_created ON conversations (seller_id, created_at)'),
+    # get_user_orders: WHERE buyer_id = ? / seller_id = ? ORDER BY created_at DESC
+    ('idx_orders_buyer_created',
+     'CREATE INDEX IF NOT EXISTS idx_orders_buyer_created ON orders (buyer_id, created_at)'),
+    ('idx_orders_seller_created',
+     'CREATE INDEX IF NOT EXISTS idx_orders_seller_created ON orders (seller_id, created_at)'),
+]
+
+
+# Migrace schématu. Každá funkce převádí databázi z verze N-1 na verzi N,
+# aktuální verze je uložena v PRAGMA user_version. Existující migrace
+# se nesmí měnit - změny schématu vždy jako nová funkce na konci seznamu.
+
+def _migration_initial_schema(cursor):
+    """Verze 1: základní tabulky (odpovídá databázím bez user_version)"""
+    # Tabulka uživatelů
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabulka knih
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            price REAL NOT NULL,
+            condition TEXT NOT NULL,
+            description TEXT,
+            seller_id INTEGER NOT NULL,
+            is_sold BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (seller_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Tabulka konverzací
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            buyer_id INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id),
+            FOREIGN KEY (buyer_id) REFERENCES users (id),
+            FOREIGN KEY (seller_id) REFERENCES users (id),
+            UNIQUE(book_id, buyer_id, seller_id)
+        )
+    ''')
+
+    # Tabulka zpráv
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            sender_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_read BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id),
+            FOREIGN KEY (sender_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Tabulka objednávek
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            buyer_id INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL,
+            order_status TEXT DEFAULT 'pending',
+            total_price REAL NOT NULL,
+            buyer_address TEXT,
+            buyer_phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id),
+            FOREIGN KEY (buyer_id) REFERENCES users (id),
+            FOREIGN KEY (seller_id) REFERENCES users (id)
+        )
+    ''')
+
+
+def _migration_indexes(cursor):
+    """Verze 2: sekundární indexy pro časté dotazy"""
+    for index_name, index_sql in INDEXES:
+        cursor.execute(index_sql)
+
+
+def _migration_books_fts(cursor):
+    """Verze 3: fulltextový index knih (FTS5) udržovaný triggery"""
+    try:
+        # remove_diacritics 2 -> "Capek" najde i "Čapek"
+        cursor.execute('''
+            CREATE VIRTUAL TABLE books_fts USING fts5(
+                title, author, description,
+                content='books', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite bez FTS5 -> search_books používá LIKE
+        print(f"FTS5 není dostupné: {str(e)}")
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author, description)
+            VALUES (new.id, new.title, new.author, new.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, description)
+            VALUES ('delete', old.id, old.title, old.author, old.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER books_fts_au AFTER UPDATE OF title, author, description ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, description)
+            VALUES ('delete', old.id, old.title, old.author, old.description);
+            INSERT INTO books_fts (rowid, title, author, description)
+            VALUES (new.id, new.title, new.author, new.description);
+        END
+    ''')
+
+    # Zaindexování již existujících knih
+    cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+def _migration_messages_by_id(cursor):
+    """Verze 4: index pro načítání nových zpráv konverzace (id > poslední)"""
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id, id)'
+    )
+
+
+# Tabulky, jejichž změny sledují čítače v table_versions
+TRACKED_TABLES = ['users', 'books', 'conversations', 'messages', 'orders']
+
+
+def _migration_table_versions(cursor):
+    """Verze 5: čítače změn jednotlivých tabulek udržované triggery"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+    for table in TRACKED_TABLES:
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+
+def _migration_conversation_summaries(cursor):
+    """Verze 6: souhrny konverzací pro seznam konverzací udržované triggery.
+
+    Každý účastník konverzace má jeden řádek s poslední zprávou, časem
+    poslední aktivity a počtem nepřečtených zpráv od druhé strany.
+    """
+    cursor.execute('''
+        CREATE TABLE conversation_summaries (
+            conversation_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            other_user_id INTEGER NOT NULL,
+            user_role TEXT NOT NULL,
+            last_message_id INTEGER,
+            last_message TEXT,
+            last_activity TIMESTAMP NOT NULL,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (conversation_id, user_id),
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        ) WITHOUT ROWID
+    ''')
+    # get_user_conversations: WHERE user_id = ? ORDER BY last_activity DESC
+    cursor.execute(
+        'CREATE INDEX idx_conversation_summaries_user_activity '
+        'ON conversation_summaries (user_id, last_activity)'
+    )
+
+    cursor.execute('''
+        CREATE TRIGGER conversation_summaries_conversation_ai AFTER INSERT ON conversations BEGIN
+            INSERT OR IGNORE INTO conversation_summaries
+                (conversation_id, user_id, other_user_id, user_role, last_activity)
+            VALUES (new.id, new.buyer_id, new.seller_id, 'buyer', new.created_at),
+                   (new.id, new.seller_id, new.buyer_id, 'seller', new.created_at);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER conversation_summaries_conversation_ad AFTER DELETE ON conversations BEGIN
+            DELETE FROM conversation_summaries WHERE conversation_id = old.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER conversation_summaries_message_ai AFTER INSERT ON messages BEGIN
+            UPDATE conversation_summaries
+            SET last_message_id = new.id,
+                last_message = substr(new.message, 1, 80),
+                last_activity = new.created_at,
+                unread_count = unread_count + (user_id != new.sender_id AND NOT new.is_read)
+            WHERE conversation_id = new.conversation_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER conversation_summaries_message_read AFTER UPDATE OF is_read ON messages
+        WHEN new.is_read != old.is_read BEGIN
+            UPDATE conversation_summaries
+            SET unread_count = unread_count + CASE WHEN new.is_read THEN -1 ELSE 1 END
+            WHERE conversation_id = new.conversation_id AND user_id != new.sender_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER conversation_summaries_message_ad AFTER DELETE ON messages BEGIN
+            UPDATE conversation_summaries
+            SET unread_count = unread_count - (user_id != old.sender_id AND NOT old.is_read)
+            WHERE conversation_id = old.conversation_id;
+            UPDATE conversation_summaries
+            SET (last_message_id, last_message, last_activity) = (
+                SELECT m.id, substr(m.message, 1, 80), m.created_at FROM messages m
+                WHERE m.conversation_id = old.conversation_id ORDER BY m.id DESC LIMIT 1)
+            WHERE conversation_id = old.conversation_id AND last_message_id = old.id
+              AND EXISTS (SELECT 1 FROM messages WHERE conversation_id = old.conversation_id);
+            UPDATE conversation_summaries
+            SET last_message_id = NULL, last_message = NULL,
+                last_activity = (SELECT created_at FROM conversations WHERE id = old.conversation_id)
+            WHERE conversation_id = old.conversation_id AND last_message_id = old.id;
+        END
+    ''')
+
+    # Souhrny již existujících konverzací (OR IGNORE: konverzace sama se sebou)
+    cursor.execute('''
+        INSERT OR IGNORE INTO conversation_summaries
+            (conversation_id, user_id, other_user_id, user_role, last_message_id, last_message,
+             last_activity, unread_count)
+        SELECT c.id, p.user_id, p.other_user_id, p.user_role, m.id, substr(m.message, 1, 80),
+               COALESCE(m.created_at, c.created_at),
+               (SELECT COUNT(*) FROM messages u
+                WHERE u.conversation_id = c.id AND u.sender_id != p.user_id AND NOT u.is_read)
+        FROM conversations c
+        JOIN (SELECT id, buyer_id AS user_id, seller_id AS other_user_id, 'buyer' AS user_role FROM conversations
+              UNION ALL
+              SELECT id, seller_id, buyer_id, 'seller' FROM conversations) p ON p.id = c.id
+        LEFT JOIN messages m ON m.id = (SELECT MAX(id) FROM messages WHERE conversation_id = c.id)
+    ''')
+
+
+def _migration_archive_tables(cursor):
+    """Verze 7: archiv starých prodaných knih a uzavřených objednávek.
+
+    Archivní tabulky mají stejné id jako původní řádky (AUTOINCREMENT
+    id nikdy nepoužije znovu). Objednávka si v archivu nese název
+    a autora knihy, aby nebyla závislá na tom, kde kniha zrovna je.
+    """
+    cursor.execute('''
+        CREATE TABLE books_archive (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            price REAL NOT NULL,
+            condition TEXT NOT NULL,
+            description TEXT,
+            seller_id INTEGER NOT NULL,
+            is_sold BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE orders_archive (
+            id INTEGER PRIMARY KEY,
+            book_id INTEGER NOT NULL,
+            buyer_id INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL,
+            order_status TEXT NOT NULL,
+            total_price REAL NOT NULL,
+            buyer_address TEXT,
+            buyer_phone TEXT,
+            created_at TIMESTAMP,
+            completed_at TIMESTAMP,
+            book_title TEXT NOT NULL,
+            book_author TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # get_user_books / get_user_orders nad archivem stejně jako nad živými tabulkami
+    cursor.execute('CREATE INDEX idx_books_archive_seller_created ON books_archive (seller_id, created_at)')
+    cursor.execute('CREATE INDEX idx_orders_archive_buyer_created ON orders_archive (buyer_id, created_at)')
+    cursor.execute('CREATE INDEX idx_orders_archive_seller_created ON orders_archive (seller_id, created_at)')
+    # archive_old_data: WHERE order_status IN ('completed', 'cancelled') AND created_at < ?
+    # (uzavření objednávky je vždy až po jejím vytvoření)
+    # a kontrola, že na prodanou knihu neodkazuje živá objednávka
+    cursor.execute('CREATE INDEX idx_orders_status_created ON orders (order_status, created_at)')
+    cursor.execute('CREATE INDEX idx_orders_book ON orders (book_id)')
+
+
+def _migration_seller_status_index(cursor):
+    """Verze 8: index pro knihy prodávajícího filtrované podle stavu"""
+    # get_user_books_page: WHERE seller_id = ? AND is_sold = ? ORDER BY created_at DESC, id DESC
+    # a get_user_book_counts jen z indexu (bez čtení řádků knih)
+    cursor.execute('CREATE INDEX idx_books_seller_sold_created ON books (seller_id, is_sold, created_at)')
+
+
+def _migration_applied_writes(cursor):
+    """Verze 9: klíče zápisů z outboxu aplikace.
+
+    Dávka, jejíž potvrzení se ke klientovi nedostalo, přijde znovu se
+    stejnými klíči - zapsaný zápis se podle klíče neprovede podruhé
+    a klient dostane původní výsledek (id nového řádku nebo zprávu).
+    Sloupec value je bez typu, drží číslo i text.
+    """
+    cursor.execute('''
+        CREATE TABLE applied_writes (
+            key TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            method TEXT NOT NULL,
+            success BOOLEAN NOT NULL,
+            value,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # run_maintenance: mazání klíčů starších než APPLIED_WRITES_DAYS
+    cursor.execute('CREATE INDEX idx_applied_writes_created ON applied_writes (created_at)')
+
+
+MIGRATIONS = [
+    _migration_initial_schema,
+    _migration_indexes,
+    _migration_books_fts,
+    _migration_messages_by_id,
+    _migration_table_versions,
+    _migration_conversation_summaries,
+    _migration_archive_tables,
+    _migration_seller_status_index,
+    _migration_applied_writes,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# UPDATE/INSERT ... RETURNING je dostupné od SQLite 3.35
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Výchozí počet knih na jednu stránku seznamu
+BOOKS_PAGE_SIZE = 20
+
+# Výchozí počet zpráv na jednu stránku historie chatu
+MESSAGES_PAGE_SIZE = 30
+
+# Zápisy, které aplikace může odložit do outboxu a poslat dávkou (apply_writes)
+OUTBOX_METHODS = ('send_message', 'add_book', 'update_book_status')
+
+# Klíče zápisů z outboxu se drží tolik dní (starší dávka by se zapsala znovu)
+APPLIED_WRITES_DAYS = 30
+
+# Volání metody Database delší než tento limit jde do logu pomalých dotazů
+SLOW_QUERY_MS = 50.0
+
+# Prodané knihy a uzavřené objednávky starší než tento počet dní jdou do archivu
+ARCHIVE_AFTER_DAYS = 180
+
+# Údržba v aplikaci převede na auto_vacuum jen databázi do této velikosti,
+# větší se převádí offline (PLIN053_db_tools.py vacuum)
+AUTO_VACUUM_MAX_BYTES = 4 * 1024 * 1024
+
+# Počet řádků přesunutých do archivu v jedné transakci
+ARCHIVE_BATCH_SIZE = 500
+
+# Počet stránek uvolněných jedním PRAGMA incremental_vacuum
+VACUUM_STEP_PAGES = 256
+
+# Filtry seznamu knih prodávajícího -> hodnota is_sold (None = bez filtru)
+USER_BOOK_FILTERS = {'all': None, 'available': False, 'sold': True}
+
+# Row factory pro záznamy vracené z Database (sloupce v pořadí dotazů)
+BOOK_ROWS = record_factory(Book)
+USER_BOOK_COLUMNS = ('id', 'title', 'author', 'price', 'condition', 'description', 'is_sold', 'created_at')
+BOOK_DETAIL_ROWS = record_factory(BookDetail)
+CONVERSATION_ROWS = record_factory(Conversation)
+CONVERSATION_INFO_ROWS = record_factory(
+    Conversation, ('id', 'book_title', 'book_author', 'book_price', 'seller_name', 'buyer_name', 'book_id'))
+MESSAGE_ROWS = record_factory(Message)
+ORDER_ROWS = record_factory(Order)
+
+# Horní meze přihrádek histogramu latencí (ms), poslední přihrádka je bez meze
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def parse_price(price_text):
+    """Převod zadané ceny na kladné číslo (jinak ValueError)"""
+    text = str(price_text).replace('Kč', '').replace(' ', '').replace(',', '.')
+    price = float(text)
+    if not 0 < price < float('inf'):
+        raise ValueError(f"Neplatná cena: {price_text}")
+    return price
+
+
+def build_fts_query(query):
+    """Převod textu z vyhledávání na FTS5 dotaz (všechna slova jako prefixy)"""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def get_schema_version(conn):
+    """Verze schématu uložená v databázi"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn, target_version=None):
+    """Aplikace chybějících migrací v jedné transakci, vrací novou verzi"""
+    if target_version is None:
+        target_version = SCHEMA_VERSION
+
+    conn.commit()
+    # BEGIN IMMEDIATE -> jiný proces nemůže migrovat současně
+    begin_write(conn)
+    try:
+        version = get_schema_version(conn)
+        if version > SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(
+                f"Databáze má novější schéma ({version}) než aplikace ({SCHEMA_VERSION})")
+
+        cursor = conn.cursor()
+        for migration in MIGRATIONS[version:target_version]:
+            migration(cursor)
+
+        if target_version > version:
+            cursor.execute(f"PRAGMA user_version = {int(target_version)}")
+            version = target_version
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return version
+
+
+class PooledConnection(sqlite3.Connection):
+    """Spojení z poolu s mezipamětí čítačů změn tabulek"""
+
+    # ((data_version, total_changes), {tabulka: verze}) z posledního čtení
+    table_versions_cache = None
+
+
+class ConnectionPool:
+    """Omezený pool dlouho žijících spojení k SQLite databázi.
+
+    Každé vlákno si při práci drží nejvýš jedno spojení (vnořené použití
+    vrací stejné spojení), po dokončení se spojení vrací do poolu
+    a nezavírá se.
+    """
+
+    def __init__(self, db_name, max_connections=4, timeout=10.0, pragmas=None,
+                 trace_callback=None, on_wait=None, on_error=None):
+        self.db_name = db_name
+        self.pragmas = pragmas or {}
+        self.trace_callback = trace_callback
+        self.on_wait = on_wait
+        self.on_error = on_error
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+
+    def _open(self):
+        """Otevření nového spojení s aplikací PRAGMA profilu"""
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout, check_same_thread=False,
+                               factory=PooledConnection)
+        try:
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+        except Exception:
+            conn.close()
+            raise
+        if self.trace_callback:
+            conn.set_trace_callback(self.trace_callback)
+        return conn
+
+    def _acquire(self):
+        """Vypůjčení spojení z poolu (případně čekání na volné)"""
+        waited_since = None
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Pool spojení je uzavřený")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.max_connections:
+                    self._created += 1
+                    conn = None
+                    break
+                if waited_since is None:
+                    waited_since = time.perf_counter()
+                if not self._lock.wait(self.timeout):
+                    raise sqlite3.OperationalError("Vypršel čas při čekání na volné spojení")
+
+        if waited_since is not None and self.on_wait:
+            self.on_wait(time.perf_counter() - waited_since)
+        if conn is not None:
+            return conn
+
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._lock.notify()
+            raise
+
+    def _release(self, conn, broken=False):
+        """Vrácení spojení do poolu"""
+        with self._lock:
+            if broken or self._closed:
+                self._created -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """Kontextový manažer vracející spojení pro aktuální vlákno.
+
+        Při úspěšném dokončení se transakce potvrdí, při výjimce se vrátí
+        zpět. Spojení se vždy vrací do poolu, i při předčasném návratu.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Vnořené použití ve stejném vlákně -> stejné spojení
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            # Metody Database chyby většinou zachytí a jen vypíšou,
+            # tady ji ještě uvidí měření
+            if self.on_error:
+                self.on_error(e)
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                broken = True
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn, broken)
+
+    def close_all(self):
+        """Zavření všech nevypůjčených spojení"""
+        with self._lock:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._created -= len(self._idle)
+            self._idle = []
+            self._lock.notify_all()
+
+
+class QueryCache:
+    """Omezená LRU mezipaměť výsledků dotazů s TTL.
+
+    Každá položka si pamatuje token změn (Database.get_change_token)
+    platný při načtení. Pokud se token mezitím změnil (zápis v tomto
+    i jiném procesu), položka se nevrátí, takže mezipaměť nemůže vydat
+    zastaralý stav knihy.
+    """
+
+    def __init__(self, max_size=256, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, token):
+        """Vrací (nalezeno, hodnota)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_token, expires_at, tags = entry
+                if token is not None and entry_token == token and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, token, tags=()):
+        """Uložení výsledku načteného při stavu token"""
+        if token is None:
+            return
+        with self._lock:
+            self._entries[key] = (value, token, time.monotonic() + self.ttl, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, tag):
+        """Odstranění všech položek označených daným tagem"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if tag in entry[3]]:
+                del self._entries[key]
+
+    def clear(self):
+        """Vyprázdnění mezipaměti"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Statistiky zásahů a výpadků"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+
+class MessageBus:
+    """Okamžité doručení nových zpráv účastníkům konverzace v rámci procesu.
+
+    Database.send_message po potvrzení zápisu rozešle MessageEvent
+    callbackům přihlášeným pro odesílatele a příjemce, chat tak nemusí
+    zprávy zjišťovat opakovanými dotazy. Callbacky běží ve vlákně, které
+    zprávu zapsalo. Přihlášení s user_id None dostává zprávy všech
+    uživatelů (server je přeposílá klientům).
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, callback):
+        """Callback(event) pro nové zprávy v konverzacích uživatele"""
+        with self._lock:
+            self._subscribers.setdefault(user_id, []).append(callback)
+
+    def unsubscribe(self, user_id, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(user_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(user_id, None)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event):
+        """Rozeslání události účastníkům (chyba callbacku neovlivní ostatní)"""
+        with self._lock:
+            callbacks = list(self._subscribers.get(None, ()))
+            for user_id in event.participants:
+                callbacks.extend(self._subscribers.get(user_id, ()))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Chyba při doručení zprávy: {str(e)}")
+
+
+def count_result_rows(result):
+    """Počet řádků ve výsledku metody Database (pro statistiky)"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, Record):
+        return 1
+    if isinstance(result, tuple) and result:
+        if isinstance(result[0], list):
+            # Stránka (knihy, kurzor)
+            return len(result[0])
+        if not isinstance(result[0], bool):
+            # Jeden řádek, např. detail knihy
+            return 1
+    return 0
+
+
+def is_busy_error(error):
+    """Chyba SQLite kvůli zámku databáze (SQLITE_BUSY / SQLITE_LOCKED)"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    # Python < 3.11 kód chyby nehlásí, zbývá text SQLite
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error))
+
+
+def begin_write(conn):
+    """Zahájení zápisu přes BEGIN IMMEDIATE (čekání na zámek tak změří QueryStats).
+
+    Při vnořeném použití spojení už transakce běží a zámek drží volající.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def redact_sql(sql):
+    """SQL bez textových hodnot (hesla, zprávy) pro uložení do logu"""
+    return re.sub(r"'(?:[^']|'')*'", "?", ' '.join(sql.split()))
+
+
+class MethodStats:
+    """Souhrnné údaje o voláních jedné metody Database"""
+
+    __slots__ = ('calls', 'errors', 'busy', 'total_ms', 'max_ms', 'rows', 'lock_wait_ms', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.busy = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.lock_wait_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def percentile(self, fraction):
+        """Odhad percentilu latence z histogramu (horní mez přihrádky)"""
+        if not self.calls:
+            return 0.0
+        threshold = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'busy': self.busy,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows,
+            'lock_wait_ms': round(self.lock_wait_ms, 3),
+            'histogram': dict(zip([f'<={bound}' for bound in LATENCY_BUCKETS_MS] + ['>'],
+                                  self.buckets)),
+        }
+
+
+class CallFrame:
+    """Rozpracované volání metody Database v jednom vlákně"""
+
+    __slots__ = ('start', 'lock_wait', 'statements', 'begin_at', 'failed', 'busy')
 
     def __init__(self):
+        self.start = time.perf_counter()
+        self.lock_wait = 0.0
+        self.statements = []
+        self.begin_at = None
+        self.failed = False
+        self.busy = False
+
+
+class QueryStats:
+    """Měření volání metod Database.
+
+    Pro každou metodu počítá volání, chyby (výjimky - i ty, které metoda
+    zachytí a jen vypíše), z nich zvlášť zamčenou databázi (busy),
+    vrácené řádky, histogram latencí a čas čekání na zámek (volné
+    spojení z poolu a získání zámku při BEGIN IMMEDIATE). Volání delší než
+    slow_threshold_ms se ukládají do omezeného logu pomalých dotazů
+    i s provedenými SQL příkazy.
+    """
+
+    # Nejvýš tolik SQL příkazů na jedno volání a záznamů v logu pomalých dotazů
+    MAX_STATEMENTS = 20
+    MAX_SLOW_QUERIES = 100
+
+    def __init__(self, slow_threshold_ms=SLOW_QUERY_MS, enabled=True):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.enabled = enabled
+        self._methods = {}
+        self._slow = deque(maxlen=self.MAX_SLOW_QUERIES)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def begin(self):
+        """Začátek měřeného volání v aktuálním vlákně"""
+        frame = CallFrame()
+        self._stack().append(frame)
+        return frame
+
+    def end(self, name, frame, result=None, error=False):
+        """Konec volání - vrací záznam pro log pomalých dotazů nebo None"""
+        elapsed_ms = (time.perf_counter() - frame.start) * 1000
+        stack = self._stack()
+        if stack and stack[-1] is frame:
+            stack.pop()
+
+        with self._lock:
+            stats = self._methods.get(name)
+            if stats is None:
+                stats = self._methods[name] = MethodStats()
+            stats.calls += 1
+            stats.errors += error or frame.failed
+            stats.busy += frame.busy
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += count_result_rows(result)
+            stats.lock_wait_ms += frame.lock_wait * 1000
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    break
+            else:
+                index = len(LATENCY_BUCKETS_MS)
+            stats.buckets[index] += 1
+
+        if elapsed_ms < self.slow_threshold_ms:
+            return None
+        entry = {
+            'method': name,
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'duration_ms': round(elapsed_ms, 3),
+            'lock_wait_ms': round(frame.lock_wait * 1000, 3),
+            'error': error or frame.failed,
+            'statements': [],
+        }
+        with self._lock:
+            self._slow.append(entry)
+        return entry
+
+    def add_lock_wait(self, seconds):
+        """Připočtení čekání na zámek všem rozpracovaným voláním vlákna"""
+        for frame in self._stack():
+            frame.lock_wait += seconds
+
+    def add_error(self, error):
+        """Chyba uvnitř spojení z poolu - započte se všem rozpracovaným voláním vlákna"""
+        busy = is_busy_error(error)
+        stack = self._stack()
+        if stack and stack[-1].begin_at is not None:
+            # BEGIN IMMEDIATE zámek nezískal - čekání trvalo až do chyby
+            self.add_lock_wait(time.perf_counter() - stack[-1].begin_at)
+            stack[-1].begin_at = None
+        for frame in stack:
+            frame.failed = True
+            frame.busy = frame.busy or busy
+
+    def error_counts(self):
+        """Celkový počet chybných volání a z nich volání se zamčenou databází"""
+        with self._lock:
+            return (sum(stats.errors for stats in self._methods.values()),
+                    sum(stats.busy for stats in self._methods.values()))
+
+    def trace(self, sql):
+        """Trace callback spojení - zaznamenává SQL a čekání na BEGIN IMMEDIATE"""
+        stack = getattr(self._local, 'stack', None)
+        if not stack or sql.startswith('--'):
+            # Mimo měřené volání nebo příkaz uvnitř triggeru
+            return
+        frame = stack[-1]
+        if frame.begin_at is not None:
+            # Další příkaz po BEGIN IMMEDIATE -> zámek byl získán
+            self.add_lock_wait(time.perf_counter() - frame.begin_at)
+            frame.begin_at = None
+        if sql.startswith('BEGIN IMMEDIATE') or sql.startswith('BEGIN EXCLUSIVE'):
+            frame.begin_at = time.perf_counter()
+        # Příkazy triggerů hlásí sqlite3 znovu textem vnějšího příkazu
+        if len(frame.statements) < self.MAX_STATEMENTS and (
+                not frame.statements or frame.statements[-1] != sql):
+            frame.statements.append(sql)
+
+    def snapshot(self):
+        """Statistiky všech metod jako slovník"""
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._methods.items())}
+
+    def slow_queries(self):
+        """Záznamy z logu pomalých dotazů (od nejstaršího)"""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        """Vynulování všech statistik"""
+        with self._lock:
+            self._methods.clear()
+            self._slow.clear()
+
+
+def instrumented(method):
+    """Dekorátor veřejných metod Database - měření přes Database.stats"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self.stats
+        if not stats.enabled:
+            return method(self, *args, **kwargs)
+
+        frame = stats.begin()
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException:
+            entry = stats.end(name, frame, error=True)
+            if entry:
+                self._explain_slow_call(entry, frame.statements)
+            raise
+        entry = stats.end(name, frame, result)
+        if entry:
+            self._explain_slow_call(entry, frame.statements)
+        return result
+
+    return wrapper
+
+
+class Database:
+
+    def __init__(self, db_name=None, profile=None, pragmas=None, instrument=True,
+                 slow_threshold_ms=SLOW_QUERY_MS, max_connections=4):
         # cesta k databázi pro různé platformy
-        if platform == 'android':
+        if db_name:
+            self.db_name = db_name
+        elif platform == 'android':
             # Pro Android -> použití app storage
             from kivy.app import App
             app = App.get_running_app()
@@ -25,130 +1051,174 @@ class Database:
         db_dir = os.path.dirname(self.db_name)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
-            
-        self.init_database()
 
-    def init_database(self):
-        """Vytvoření tabulek v databázi"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        # PRAGMA profil podle platformy (lze zvolit jiný nebo upravit hodnoty)
+        self.profile = profile if isinstance(profile, str) else (
+            'custom' if profile else default_profile_name())
+        self.pragmas = resolve_pragmas(profile, pragmas)
 
-        # Tabulka uživatelů
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # Měření volání metod (latence, řádky, čekání na zámek, pomalé dotazy)
+        self.stats = QueryStats(slow_threshold_ms, enabled=instrument)
 
-        # Tabulka knih
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                price REAL NOT NULL,
-                condition TEXT NOT NULL,
-                description TEXT,
-                seller_id INTEGER NOT NULL,
-                is_sold BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (seller_id) REFERENCES users (id)
-            )
-        ''')
+        # Sdílená dlouho žijící spojení místo sqlite3.connect v každé metodě
+        self.pool = ConnectionPool(
+            self.db_name, max_connections=max_connections, pragmas=self.pragmas,
+            trace_callback=self.stats.trace if instrument else None,
+            on_wait=self.stats.add_lock_wait, on_error=self.stats.add_error)
 
-        # Tabulka konverzací
-        cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS conversations (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        book_id INTEGER NOT NULL,
-                        buyer_id INTEGER NOT NULL,
-                        seller_id INTEGER NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (book_id) REFERENCES books (id),
-                        FOREIGN KEY (buyer_id) REFERENCES users (id),
-                        FOREIGN KEY (seller_id) REFERENCES users (id),
-                        UNIQUE(book_id, buyer_id, seller_id)
-                    )
-                ''')
+        # Mezipaměť detailů knih a konverzací
+        self.cache = QueryCache()
 
-        # Tabulka zpráv
-        cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        conversation_id INTEGER NOT NULL,
-                        sender_id INTEGER NOT NULL,
-                        message TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_read BOOLEAN DEFAULT FALSE,
-                        FOREIGN KEY (conversation_id) REFERENCES conversations (id),
-                        FOREIGN KEY (sender_id) REFERENCES users (id)
-                    )
-                ''')
-        
-        #tabulka objednávek
-        cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        book_id INTEGER NOT NULL,
-                        buyer_id INTEGER NOT NULL,
-                        seller_id INTEGER NOT NULL,
-                        order_status TEXT DEFAULT 'pending',
-                        total_price REAL NOT NULL,
-                        buyer_address TEXT,
-                        buyer_phone TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        completed_at TIMESTAMP,
-                        FOREIGN KEY (book_id) REFERENCES books (id),
-                        FOREIGN KEY (buyer_id) REFERENCES users (id),
-                        FOREIGN KEY (seller_id) REFERENCES users (id)
-                    )
-                ''')
+        # Okamžité doručení nových zpráv otevřeným chatům
+        self.events = MessageBus()
+            
+        self.init_database()
 
-        conn.commit()
-        conn.close()
+    def connection(self):
+        """Spojení z poolu jako kontextový manažer (commit/rollback automaticky)"""
+        return self.pool.connection()
+
+    def close(self):
+        """Uzavření všech spojení k databázi"""
+        self.pool.close_all()
+
+    def get_pragma_settings(self):
+        """Skutečně platná PRAGMA nastavení spojení (pro diagnostiku)"""
+        settings = {'profile': self.profile}
+        with self.connection() as conn:
+            for name in self.pragmas:
+                row = conn.execute(f"PRAGMA {name}").fetchone()
+                settings[name] = row[0] if row else None
+        return settings
+
+    def _table_versions(self, conn):
+        """Čítače změn všech sledovaných tabulek.
+
+        Dokud se na spojení nezmění PRAGMA data_version (zápis z jiného
+        spojení nebo procesu) ani total_changes (zápis přes toto spojení),
+        vrací se hodnoty z mezipaměti bez dotazu do table_versions.
+        """
+        snapshot = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        cached = conn.table_versions_cache
+        if cached and cached[0] == snapshot:
+            return cached[1]
+
+        versions = dict(conn.execute("SELECT table_name, version FROM table_versions").fetchall())
+        conn.table_versions_cache = (snapshot, versions)
+        return versions
+
+    def get_change_token(self, *tables):
+        """Token stavu tabulek - změní se po každém zápisu do některé z nich"""
+        try:
+            with self.connection() as conn:
+                versions = self._table_versions(conn)
+            return tuple(versions.get(table, 0) for table in tables)
+        except Exception as e:
+            print(f"Chyba při zjišťování změn: {str(e)}")
+            return None
+
+    def get_cache_stats(self):
+        """Statistiky mezipaměti dotazů (zásahy, výpadky, velikost)"""
+        return self.cache.stats()
+
+    def get_query_stats(self):
+        """Statistiky volání metod (počty, p50/p95/p99, řádky, čekání na zámek).
+
+        lock_wait_ms je čekání na volné spojení z poolu a na zámek zápisu.
+        Ten se měří u BEGIN IMMEDIATE, kterým proto začínají všechny
+        zapisující metody - u odložené transakce by čekání na zámek
+        zůstalo schované v čase prvního zápisu.
+        """
+        return self.stats.snapshot()
+
+    def get_slow_queries(self):
+        """Log pomalých volání s jejich SQL příkazy a plány dotazů"""
+        return self.stats.slow_queries()
+
+    def reset_query_stats(self):
+        """Vynulování statistik volání a logu pomalých dotazů"""
+        self.stats.reset()
+
+    def dump_query_stats(self, path):
+        """Uložení statistik a logu pomalých dotazů do JSON souboru"""
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'platform': platform,
+            'profile': self.profile,
+            'sqlite_version': sqlite3.sqlite_version,
+            'slow_threshold_ms': self.stats.slow_threshold_ms,
+            'cache': self.get_cache_stats(),
+            'methods': self.get_query_stats(),
+            'slow_queries': self.get_slow_queries(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+    def _explain_slow_call(self, entry, statements):
+        """Doplnění SQL příkazů pomalého volání o EXPLAIN QUERY PLAN"""
+        try:
+            with self.connection() as conn:
+                for sql in statements:
+                    plan = None
+                    if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+                        try:
+                            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                        except sqlite3.Error:
+                            pass
+                    entry['statements'].append({'sql': redact_sql(sql), 'plan': plan})
+        except Exception as e:
+            print(f"Chyba při zjišťování plánu dotazu: {str(e)}")
+
+    def has_changed(self, token, *tables):
+        """Změnila se některá z tabulek od získání tokenu?"""
+        return token is None or self.get_change_token(*tables) != token
+
+    def init_database(self):
+        """Vytvoření nebo aktualizace schématu databáze (migrace)"""
+        with self.connection() as conn:
+            # Rychlá cesta: aktuální schéma -> jediné čtení PRAGMA user_version
+            if get_schema_version(conn) == SCHEMA_VERSION:
+                return
+            apply_migrations(conn)
 
     def hash_password(self, password):
         """Zahashování hesla"""
         return hashlib.sha256(password.encode()).hexdigest()
 
+    @instrumented
     def register_user(self, name, email, password):
         """Registrace nového uživatele"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
             password_hash = self.hash_password(password)
-            cursor.execute(
-                "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
-                (name, email, password_hash)
-            )
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                begin_write(conn)
+                cursor.execute(
+                    "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
+                    (name, email, password_hash)
+                )
 
-            conn.commit()
-            conn.close()
             return True, "Registrace úspěšná!"
         except sqlite3.IntegrityError:
             return False, "Email už je zaregistrovaný!"
         except Exception as e:
             return False, f"Chyba: {str(e)}"
 
+    @instrumented
     def login_user(self, email, password):
         """Přihlášení uživatele"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
 
-            password_hash = self.hash_password(password)
-            cursor.execute(
-                "SELECT id, name, email FROM users WHERE email = ? AND password_hash = ?",
-                (email, password_hash)
-            )
+                password_hash = self.hash_password(password)
+                cursor.execute(
+                    "SELECT id, name, email FROM users WHERE email = ? AND password_hash = ?",
+                    (email, password_hash)
+                )
 
-            user = cursor.fetchone()
-            conn.close()
+                user = cursor.fetchone()
 
             if user:
                 return True, {"id": user[0], "name": user[1], "email": user[2]}
@@ -157,389 +1227,1135 @@ class Database:
         except Exception as e:
             return False, f"Chyba: {str(e)}"
 
+    @instrumented
     def add_book(self, title, author, price, condition, description, seller_id):
         """Přidání knihy do databáze"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                begin_write(conn)
+                success, book_id = self._write_add_book(
+                    conn.cursor(), seller_id, title, author, price, condition, description)
 
-            cursor.execute(
-                "INSERT INTO books (title, author, price, condition, description, seller_id) VALUES (?, ?, ?, ?, ?, ?)",
-                (title, author, price, condition, description, seller_id)
-            )
-
-            conn.commit()
-            conn.close()
+            self.cache.invalidate(('book', book_id))
             return True, "Kniha byla přidána!"
         except Exception as e:
             return False, f"Chyba: {str(e)}"
 
+    def _write_add_book(self, cursor, seller_id, title, author, price, condition, description):
+        """INSERT knihy v transakci volajícího, vrací (True, id knihy)"""
+        cursor.execute(
+            "INSERT INTO books (title, author, price, condition, description, seller_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (title, author, price, condition, description, seller_id)
+        )
+        return True, cursor.lastrowid
+
+    @instrumented
+    def bulk_add_books(self, batches, progress=None):
+        """Hromadné vložení knih v jedné krátké transakci.
+
+        batches je iterovatelný zdroj seznamů n-tic (title, author, price,
+        condition, description, seller_id). Dávky se nejdřív odloží do
+        dočasného souboru připojeného ke spojení, takže čtení a zpracování
+        zdroje (CSV, pool procesů) nedrží zámek zápisu databáze. Teprve
+        potom se v transakci BEGIN IMMEDIATE knihy přesunou jedním
+        INSERT ... SELECT, triggery pro vkládání se mezitím pozastaví
+        a fulltextový index nových knih i čítač změn se doplní jednou
+        na konci.
+        Vrací počet vložených knih.
+        """
+        inserted = 0
+        fd, spool_path = tempfile.mkstemp(prefix='knihomat_import_', suffix='.db')
+        os.close(fd)
+        try:
+            with self.connection() as conn:
+                conn.execute("ATTACH DATABASE ? AS spool", (spool_path,))
+                try:
+                    # Odkládací soubor se po importu smaže, nemusí přežít pád
+                    conn.execute("PRAGMA spool.journal_mode = OFF")
+                    conn.execute("PRAGMA spool.synchronous = OFF")
+                    conn.execute(
+                        "CREATE TABLE spool.import_books (title, author, price, condition, description, seller_id)")
+                    for batch in batches:
+                        conn.executemany("INSERT INTO spool.import_books VALUES (?, ?, ?, ?, ?, ?)", batch)
+                        conn.commit()
+                        inserted += len(batch)
+                        if progress:
+                            progress(inserted)
+
+                    self._insert_spooled_books(conn)
+                    conn.commit()
+                finally:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    conn.execute("DETACH DATABASE spool")
+        finally:
+            os.remove(spool_path)
+
+        self.cache.clear()
+        return inserted
+
+    def _insert_spooled_books(self, conn):
+        """Přesun odložených knih do books (jediný krátký zápis do databáze)"""
+        begin_write(conn)
+
+        # Pozastavení triggerů volaných pro každý vložený řádek
+        triggers = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'books' "
+            "AND name IN ('books_fts_ai', 'books_version_insert')"
+        ).fetchall()
+        for name, sql in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+
+        # Nové knihy dostanou id vyšší než všechny dosavadní (zámek je držený)
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+        conn.execute('''
+            INSERT INTO books (title, author, price, condition, description, seller_id)
+            SELECT title, author, price, condition, description, seller_id
+            FROM spool.import_books ORDER BY rowid
+        ''')
+
+        for name, sql in triggers:
+            conn.execute(sql)
+
+        # Fulltextový index jen pro nové knihy a čítač změn jednou za import
+        if any(name == 'books_fts_ai' for name, sql in triggers):
+            conn.execute(
+                "INSERT INTO books_fts (rowid, title, author, description) "
+                "SELECT id, title, author, description FROM books WHERE id > ?", (last_id,))
+        conn.execute("UPDATE table_versions SET version = version + 1 WHERE table_name = 'books'")
+
+    @instrumented
     def get_all_books(self):
         """Získání všech knih z databáze"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = BOOK_ROWS
 
-            cursor.execute('''
-                SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name
-                FROM books b
-                JOIN users u ON b.seller_id = u.id
-                WHERE b.is_sold = FALSE
-                ORDER BY b.created_at DESC
-            ''')
+                cursor.execute('''
+                    SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name
+                    FROM books b
+                    JOIN users u ON b.seller_id = u.id
+                    WHERE b.is_sold = FALSE
+                    ORDER BY b.created_at DESC
+                ''')
 
-            books = cursor.fetchall()
-            conn.close()
+                books = cursor.fetchall()
             return books
         except Exception as e:
             print(f"Chyba při načítání knih: {str(e)}")
             return []
 
+    @instrumented
     def search_books(self, query):
-        """Vyhledání knih podle názvu nebo autora"""
+        """Vyhledání knih podle názvu, autora nebo popisu (řazeno podle relevance)"""
+        fts_query = build_fts_query(query)
+        if fts_query:
+            try:
+                with self.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.row_factory = BOOK_ROWS
+
+                    # bm25 váhy: název > autor > popis
+                    cursor.execute('''
+                        SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name
+                        FROM books_fts
+                        JOIN books b ON b.id = books_fts.rowid
+                        JOIN users u ON b.seller_id = u.id
+                        WHERE books_fts MATCH ? AND b.is_sold = FALSE
+                        ORDER BY bm25(books_fts, 10.0, 5.0, 1.0), b.created_at DESC
+                    ''', (fts_query,))
+
+                    return cursor.fetchall()
+            except sqlite3.OperationalError as e:
+                # Chybí FTS5 -> pomalejší vyhledávání přes LIKE
+                print(f"Fulltextové vyhledávání selhalo: {str(e)}")
+
+        return self.search_books_like(query)
+
+    @instrumented
+    def search_books_like(self, query):
+        """Vyhledání knih podle názvu nebo autora přes LIKE (bez FTS5)"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name
-                FROM books b
-                JOIN users u ON b.seller_id = u.id
-                WHERE (b.title LIKE ? OR b.author LIKE ?) AND b.is_sold = FALSE
-                ORDER BY b.created_at DESC
-            ''', (f'%{query}%', f'%{query}%'))
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = BOOK_ROWS
 
-            books = cursor.fetchall()
-            conn.close()
+                cursor.execute('''
+                    SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name
+                    FROM books b
+                    JOIN users u ON b.seller_id = u.id
+                    WHERE (b.title LIKE ? OR b.author LIKE ?) AND b.is_sold = FALSE
+                    ORDER BY b.created_at DESC
+                ''', (f'%{query}%', f'%{query}%'))
+
+                books = cursor.fetchall()
             return books
         except Exception as e:
             print(f"Chyba při vyhledávání: {str(e)}")
             return []
 
-    def create_or_get_conversation(self, book_id, buyer_id, seller_id):
-        """Vytvoření nebo získání konverzace"""
+    def _fetch_books_page(self, conn, from_clause, where_clause, params, cursor, page_size, fields=None):
+        """Jedna stránka knih seřazená podle (created_at, id) sestupně.
+
+        Místo OFFSET se pokračuje za kurzorem (created_at, id) poslední
+        zobrazené knihy, takže nově přidané knihy stránkování neposunou.
+        """
+        params = list(params)
+        if cursor:
+            where_clause += " AND (b.created_at, b.id) < (?, ?)"
+            params.extend(cursor)
+
+        rows_cursor = conn.cursor()
+        # id a created_at jsou potřeba pro kurzor další stránky
+        rows_cursor.row_factory = BOOK_ROWS if fields is None else record_factory(
+            Book, fields={*fields, 'id', 'created_at'})
+        rows = rows_cursor.execute(f'''
+            SELECT b.id, b.title, b.author, b.price, b.condition, b.description, u.name, b.created_at
+            {from_clause}
+            JOIN users u ON b.seller_id = u.id
+            WHERE {where_clause}
+            ORDER BY b.created_at DESC, b.id DESC
+            LIMIT ?
+        ''', (*params, page_size + 1)).fetchall()
+
+        # Načtení o jeden řádek víc -> víme, jestli existuje další stránka
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = (rows[-1].created_at, rows[-1].id) if has_more else None
+        return rows, next_cursor
+
+    @instrumented
+    def get_books_page(self, cursor=None, page_size=BOOKS_PAGE_SIZE, fields=None):
+        """Stránka knih k prodeji, vrací (knihy, kurzor další stránky nebo None)"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                return self._fetch_books_page(
+                    conn, "FROM books b", "b.is_sold = FALSE", (), cursor, page_size, fields)
+        except Exception as e:
+            print(f"Chyba při načítání knih: {str(e)}")
+            return [], None
+
+    @instrumented
+    def search_books_page(self, query, cursor=None, page_size=BOOKS_PAGE_SIZE, fields=None):
+        """Stránka výsledků vyhledávání (od nejnovějších), vrací (knihy, kurzor)"""
+        fts_query = build_fts_query(query)
+        if fts_query:
+            try:
+                with self.connection() as conn:
+                    # Nejdřív nalezené knihy, teprve nad nimi kurzor a řazení.
+                    # CROSS JOIN drží pořadí - jinak SQLite prochází index
+                    # všech knih k prodeji a pro každou zkouší MATCH.
+                    return self._fetch_books_page(
+                        conn,
+                        "FROM (SELECT rowid AS id FROM books_fts WHERE books_fts MATCH ?) m "
+                        "CROSS JOIN books b ON b.id = m.id",
+                        "b.is_sold = FALSE",
+                        (fts_query,), cursor, page_size, fields)
+            except sqlite3.OperationalError as e:
+                print(f"Fulltextové vyhledávání selhalo: {str(e)}")
 
-            # najít existující konverzaci
-            cursor.execute(
-                "SELECT id FROM conversations WHERE book_id = ? AND buyer_id = ? AND seller_id = ?",
-                (book_id, buyer_id, seller_id)
-            )
+        try:
+            with self.connection() as conn:
+                return self._fetch_books_page(
+                    conn, "FROM books b",
+                    "(b.title LIKE ? OR b.author LIKE ?) AND b.is_sold = FALSE",
+                    (f'%{query}%', f'%{query}%'), cursor, page_size, fields)
+        except Exception as e:
+            print(f"Chyba při vyhledávání: {str(e)}")
+            return [], None
 
-            conversation = cursor.fetchone()
+    @instrumented
+    def create_or_get_conversation(self, book_id, buyer_id, seller_id):
+        """Vytvoření nebo získání konverzace jedním příkazem (upsert).
 
-            if conversation:
-                conversation_id = conversation[0]
-            else:
-                # Vytvořit novou konverzaci
-                cursor.execute(
-                    "INSERT INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, ?)",
-                    (book_id, buyer_id, seller_id)
-                )
-                conversation_id = cursor.lastrowid
-                conn.commit()
+        Prodávající musí být prodávajícím knihy a kupující někdo jiný.
+        """
+        if buyer_id == seller_id or self.get_seller_id_by_book(book_id) != seller_id:
+            print("Chyba při vytváření konverzace: Prodávající neodpovídá knize!")
+            return None
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                begin_write(conn)
+
+                if HAS_RETURNING:
+                    # Nová konverzace vrátí své id, existující nevrátí nic
+                    cursor.execute('''
+                        INSERT INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, ?)
+                        ON CONFLICT (book_id, buyer_id, seller_id) DO NOTHING
+                        RETURNING id
+                    ''', (book_id, buyer_id, seller_id))
+                    conversation = cursor.fetchone()
+                else:
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, ?)",
+                        (book_id, buyer_id, seller_id)
+                    )
+                    conversation = None
 
-            conn.close()
-            return conversation_id
+                if not conversation:
+                    # Konverzace už existovala (zámek je stále držený)
+                    cursor.execute(
+                        "SELECT id FROM conversations WHERE book_id = ? AND buyer_id = ? AND seller_id = ?",
+                        (book_id, buyer_id, seller_id)
+                    )
+                    conversation = cursor.fetchone()
+
+            return conversation[0] if conversation else None
         except Exception as e:
             print(f"Chyba při vytváření konverzace: {str(e)}")
             return None
 
+    @instrumented
     def send_message(self, conversation_id, sender_id, message):
         """Odeslání zprávy"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            cursor.execute(
-                "INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
-                (conversation_id, sender_id, message)
-            )
-
-            conn.commit()
-            conn.close()
+            with self.connection() as conn:
+                begin_write(conn)
+                success, message_id = self._write_send_message(conn.cursor(), sender_id, conversation_id, message)
+            if not success:
+                print(f"Chyba při odesílání zprávy: {message_id}")
+                return False
+
+            # Zpráva je potvrzená -> doručení otevřeným chatům účastníků
+            if self.events.has_subscribers():
+                self._publish_message(message_id)
             return True
         except Exception as e:
             print(f"Chyba při odesílání zprávy: {str(e)}")
             return False
 
+    def _write_send_message(self, cursor, sender_id, conversation_id, message):
+        """INSERT zprávy v transakci volajícího, vrací (úspěch, id zprávy nebo zpráva)"""
+        # Cizí klíče SQLite nevynucuje - konverzace a účastník se ověří zde
+        cursor.execute("SELECT buyer_id, seller_id FROM conversations WHERE id = ?", (conversation_id,))
+        participants = cursor.fetchone()
+        if not participants:
+            return False, "Konverzace neexistuje!"
+        if sender_id not in participants:
+            return False, "Nejste účastníkem této konverzace!"
+
+        cursor.execute(
+            "INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
+            (conversation_id, sender_id, message)
+        )
+        return True, cursor.lastrowid
+
+    def _publish_message(self, message_id):
+        """Rozeslání uložené zprávy přes MessageBus (jeden dotaz podle id)"""
+        try:
+            with self.connection() as conn:
+                row = conn.execute('''
+                    SELECT m.id, m.message, m.created_at, m.sender_id, u.name,
+                           c.id, c.buyer_id, c.seller_id,
+                           (SELECT MAX(p.id) FROM messages p
+                            WHERE p.conversation_id = m.conversation_id AND p.id < m.id)
+                    FROM messages m
+                    JOIN users u ON m.sender_id = u.id
+                    JOIN conversations c ON m.conversation_id = c.id
+                    WHERE m.id = ?
+                ''', (message_id,)).fetchone()
+        except Exception as e:
+            print(f"Chyba při doručování zprávy: {str(e)}")
+            return
+        if row:
+            self.events.publish(MessageEvent(row[5], Message(*row[:5]), row[8], (row[6], row[7])))
+
+    @instrumented
     def get_messages(self, conversation_id):
         """Získání zpráv z konverzace"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT m.id, m.message, m.created_at, m.sender_id, u.name
-                FROM messages m
-                JOIN users u ON m.sender_id = u.id
-                WHERE m.conversation_id = ?
-                ORDER BY m.created_at ASC
-            ''', (conversation_id,))
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = MESSAGE_ROWS
 
-            messages = cursor.fetchall()
-            conn.close()
+                cursor.execute('''
+                    SELECT m.id, m.message, m.created_at, m.sender_id, u.name
+                    FROM messages m
+                    JOIN users u ON m.sender_id = u.id
+                    WHERE m.conversation_id = ?
+                    ORDER BY m.created_at ASC
+                ''', (conversation_id,))
+
+                messages = cursor.fetchall()
             return messages
         except Exception as e:
             print(f"Chyba při načítání zpráv: {str(e)}")
             return []
 
+    @instrumented
+    def get_messages_since(self, conversation_id, last_id=0):
+        """Získání zpráv z konverzace novějších než zpráva s ID last_id"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = MESSAGE_ROWS
+
+                cursor.execute('''
+                    SELECT m.id, m.message, m.created_at, m.sender_id, u.name
+                    FROM messages m
+                    JOIN users u ON m.sender_id = u.id
+                    WHERE m.conversation_id = ? AND m.id > ?
+                    ORDER BY m.id ASC
+                ''', (conversation_id, last_id))
+
+                messages = cursor.fetchall()
+            return messages
+        except Exception as e:
+            print(f"Chyba při načítání nových zpráv: {str(e)}")
+            return []
+
+    @instrumented
+    def get_messages_page(self, conversation_id, before_id=None, after_id=None, page_size=MESSAGES_PAGE_SIZE):
+        """Stránka historie chatu, vrací (zprávy vzestupně podle id, kurzor nebo None).
+
+        Bez kurzorů vrací nejnovější zprávy, s before_id starší zprávy před
+        ním a s after_id novější zprávy za ním. Kurzor je id, od kterého
+        pokračuje další stránka stejným směrem (None = v tom směru už nic není).
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = MESSAGE_ROWS
+
+                if after_id is not None:
+                    condition, params, order = "AND m.id > ?", (after_id,), "ASC"
+                elif before_id is not None:
+                    condition, params, order = "AND m.id < ?", (before_id,), "DESC"
+                else:
+                    condition, params, order = "", (), "DESC"
+
+                cursor.execute(f'''
+                    SELECT m.id, m.message, m.created_at, m.sender_id, u.name
+                    FROM messages m
+                    JOIN users u ON m.sender_id = u.id
+                    WHERE m.conversation_id = ? {condition}
+                    ORDER BY m.id {order}
+                    LIMIT ?
+                ''', (conversation_id, *params, page_size + 1))
+
+                messages = cursor.fetchall()
+
+            # Načtení o jednu zprávu víc -> víme, jestli existuje další stránka
+            has_more = len(messages) > page_size
+            messages = messages[:page_size]
+            if order == "DESC":
+                messages.reverse()
+                next_cursor = messages[0].id if has_more else None
+            else:
+                next_cursor = messages[-1].id if has_more else None
+            return messages, next_cursor
+        except Exception as e:
+            print(f"Chyba při načítání historie zpráv: {str(e)}")
+            return [], None
+
+    @instrumented
+    def mark_messages_read(self, conversation_id, user_id, up_to_id):
+        """Označení zpráv druhé strany až po zprávu up_to_id jako přečtených.
+
+        Jeden UPDATE pro celý úsek konverzace, vrací počet označených zpráv.
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                begin_write(conn)
+
+                cursor.execute('''
+                    UPDATE messages SET is_read = TRUE
+                    WHERE conversation_id = ? AND id <= ? AND sender_id != ? AND is_read = FALSE
+                ''', (conversation_id, up_to_id, user_id))
+
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Chyba při označování zpráv jako přečtených: {str(e)}")
+            return 0
+
+    @instrumented
+    def get_unread_counts(self, user_id):
+        """Nepřečtené zprávy uživatele, vrací ({id konverzace: počet}, celkem)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    SELECT conversation_id, unread_count FROM conversation_summaries
+                    WHERE user_id = ? AND unread_count > 0
+                ''', (user_id,))
+
+                counts = dict(cursor.fetchall())
+            return counts, sum(counts.values())
+        except Exception as e:
+            print(f"Chyba při načítání nepřečtených zpráv: {str(e)}")
+            return {}, 0
+
+    @instrumented
     def get_user_conversations(self, user_id):
-        """Získání všech konverzací uživatele"""
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT DISTINCT c.id, b.title, b.author, 
-                       CASE WHEN c.buyer_id = ? THEN seller_u.name ELSE buyer_u.name END as other_user_name,
-                       CASE WHEN c.buyer_id = ? THEN 'buyer' ELSE 'seller' END as user_role,
-                       c.created_at
-                FROM conversations c
-                JOIN books b ON c.book_id = b.id
-                JOIN users seller_u ON c.seller_id = seller_u.id
-                JOIN users buyer_u ON c.buyer_id = buyer_u.id
-                WHERE c.buyer_id = ? OR c.seller_id = ?
-                ORDER BY c.created_at DESC
-            ''', (user_id, user_id, user_id, user_id))
-
-            conversations = cursor.fetchall()
-            conn.close()
+        """Získání všech konverzací uživatele (od poslední aktivity).
+
+        Vrací (id, název knihy, autor, druhý účastník, role, vytvořeno,
+        poslední zpráva, poslední aktivita, nepřečteno) - jedno čtení
+        souhrnů konverzací přes index (user_id, last_activity). Kniha
+        může být i v archivu.
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = CONVERSATION_ROWS
+
+                cursor.execute('''
+                    SELECT c.id, COALESCE(b.title, a.title), COALESCE(b.author, a.author), u.name,
+                           s.user_role, c.created_at, s.last_message, s.last_activity, s.unread_count
+                    FROM conversation_summaries s
+                    JOIN conversations c ON c.id = s.conversation_id
+                    LEFT JOIN books b ON c.book_id = b.id
+                    LEFT JOIN books_archive a ON c.book_id = a.id
+                    JOIN users u ON u.id = s.other_user_id
+                    WHERE s.user_id = ? AND (b.id IS NOT NULL OR a.id IS NOT NULL)
+                    ORDER BY s.last_activity DESC, s.conversation_id DESC
+                ''', (user_id,))
+
+                conversations = cursor.fetchall()
             return conversations
         except Exception as e:
             print(f"Chyba při načítání konverzací: {str(e)}")
             return []
 
+    @instrumented
     def get_conversation_info(self, conversation_id):
-        """Získání informací o konverzaci"""
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+        """Získání informací o konverzaci (s mezipamětí)"""
+        key = ('conversation_info', conversation_id)
+        token = self.get_change_token('conversations', 'books', 'users')
+        found, info = self.cache.get(key, token)
+        if found:
+            return info
 
-            cursor.execute('''
-                SELECT c.id, b.title, b.author, b.price, seller_u.name, buyer_u.name, c.book_id
-                FROM conversations c
-                JOIN books b ON c.book_id = b.id
-                JOIN users seller_u ON c.seller_id = seller_u.id
-                JOIN users buyer_u ON c.buyer_id = buyer_u.id
-                WHERE c.id = ?
-            ''', (conversation_id,))
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = CONVERSATION_INFO_ROWS
 
-            info = cursor.fetchone()
-            conn.close()
+                cursor.execute('''
+                    SELECT c.id, b.title, b.author, b.price, seller_u.name, buyer_u.name, c.book_id
+                    FROM conversations c
+                    JOIN (SELECT id, title, author, price FROM books
+                          UNION ALL
+                          SELECT id, title, author, price FROM books_archive) b ON c.book_id = b.id
+                    JOIN users seller_u ON c.seller_id = seller_u.id
+                    JOIN users buyer_u ON c.buyer_id = buyer_u.id
+                    WHERE c.id = ?
+                ''', (conversation_id,))
+
+                info = cursor.fetchone()
+
+            tags = [('conversation', conversation_id)]
+            if info:
+                tags.append(('book', info.book_id))
+            self.cache.put(key, info, token, tags)
             return info
         except Exception as e:
             print(f"Chyba při načítání informací o konverzaci: {str(e)}")
             return None
 
+    @instrumented
     def get_seller_id_by_book(self, book_id):
-        """Získání ID prodávajícího podle ID knihy"""
+        """Získání ID prodávajícího podle ID knihy (s mezipamětí)"""
+        key = ('seller_id', book_id)
+        token = self.get_change_token('books')
+        found, seller_id = self.cache.get(key, token)
+        if found:
+            return seller_id
+
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
 
-            cursor.execute("SELECT seller_id FROM books WHERE id = ?", (book_id,))
-            result = cursor.fetchone()
-            conn.close()
+                cursor.execute('''
+                    SELECT seller_id FROM books WHERE id = ?
+                    UNION ALL
+                    SELECT seller_id FROM books_archive WHERE id = ?
+                ''', (book_id, book_id))
+                result = cursor.fetchone()
+
+            seller_id = result[0] if result else None
+            self.cache.put(key, seller_id, token, [('book', book_id)])
+            return seller_id
+        except Exception as e:
+            print(f"Chyba při získávání seller_id: {str(e)}")
+            return None
+
+    @instrumented
+    def get_conversation_participants(self, conversation_id):
+        """Účastníci konverzace jako (buyer_id, seller_id), None pokud neexistuje"""
+        try:
+            with self.connection() as conn:
+                return conn.execute(
+                    "SELECT buyer_id, seller_id FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+        except Exception as e:
+            print(f"Chyba při získávání účastníků konverzace: {str(e)}")
+            return None
 
+    @instrumented
+    def get_order_seller_id(self, order_id):
+        """Získání ID prodávajícího objednávky, None pokud neexistuje"""
+        try:
+            with self.connection() as conn:
+                result = conn.execute("SELECT seller_id FROM orders WHERE id = ?", (order_id,)).fetchone()
             return result[0] if result else None
         except Exception as e:
-            print(f"Chyba při získávání seller_id: {str(e)}")
+            print(f"Chyba při získávání prodávajícího objednávky: {str(e)}")
             return None
     
+    @instrumented
     def create_order(self, book_id, buyer_id, buyer_address, buyer_phone):
-        """Vytvoření objednávky"""
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+        """Vytvoření objednávky.
 
-            # Získání informací o knize
-            cursor.execute("SELECT seller_id, price, is_sold FROM books WHERE id = ?", (book_id,))
-            book_info = cursor.fetchone()
-            
-            if not book_info:
-                return False, "Kniha nebyla nalezena!"
-            
-            seller_id, price, is_sold = book_info
-            
-            if is_sold:
-                return False, "Kniha již byla prodána!"
-            
-            if seller_id == buyer_id:
-                return False, "Nemůžete koupit vlastní knihu!"
-
-            # Vytvoření objednávky
-            cursor.execute('''
-                INSERT INTO orders (book_id, buyer_id, seller_id, total_price, buyer_address, buyer_phone)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (book_id, buyer_id, seller_id, price, buyer_address, buyer_phone))
-
-            order_id = cursor.lastrowid
+        Kniha se zabere podmíněným UPDATE (jen pokud ještě není prodaná)
+        a objednávka se vloží v téže krátké transakci BEGIN IMMEDIATE,
+        takže dva kupující nemohou koupit stejnou knihu.
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                begin_write(conn)
+
+                # Zabrání knihy - uspěje nejvýš jeden kupující
+                if HAS_RETURNING:
+                    cursor.execute('''
+                        UPDATE books SET is_sold = TRUE
+                        WHERE id = ? AND is_sold = FALSE AND seller_id != ?
+                        RETURNING seller_id, price
+                    ''', (book_id, buyer_id))
+                    claimed = cursor.fetchall()
+                else:
+                    cursor.execute('''
+                        UPDATE books SET is_sold = TRUE
+                        WHERE id = ? AND is_sold = FALSE AND seller_id != ?
+                    ''', (book_id, buyer_id))
+                    claimed = []
+                    if cursor.rowcount == 1:
+                        cursor.execute("SELECT seller_id, price FROM books WHERE id = ?", (book_id,))
+                        claimed = cursor.fetchall()
+
+                if not claimed:
+                    # Zjištění důvodu neúspěchu
+                    cursor.execute("SELECT seller_id, is_sold FROM books WHERE id = ?", (book_id,))
+                    book_info = cursor.fetchone()
+
+                    if not book_info:
+                        return False, "Kniha nebyla nalezena!"
+                    if book_info[1]:
+                        return False, "Kniha již byla prodána!"
+                    return False, "Nemůžete koupit vlastní knihu!"
+
+                seller_id, price = claimed[0]
+
+                # Vytvoření objednávky
+                cursor.execute('''
+                    INSERT INTO orders (book_id, buyer_id, seller_id, total_price, buyer_address, buyer_phone)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (book_id, buyer_id, seller_id, price, buyer_address, buyer_phone))
 
-            # Označení knihy jako prodané
-            cursor.execute("UPDATE books SET is_sold = TRUE WHERE id = ?", (book_id,))
+                order_id = cursor.lastrowid
 
-            conn.commit()
-            conn.close()
-            
+            self.cache.invalidate(('book', book_id))
             return True, f"Objednávka #{order_id} byla úspěšně vytvořena!"
             
         except Exception as e:
             return False, f"Chyba při vytváření objednávky: {str(e)}"
 
+    @instrumented
     def get_user_orders(self, user_id, as_buyer=True):
-        """Získání objednávek uživatele"""
+        """Získání objednávek uživatele (včetně archivovaných)"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            if as_buyer:
-                # Objednávky jako kupující
-                cursor.execute('''
-                    SELECT o.id, b.title, b.author, o.total_price, o.order_status, 
-                        o.created_at, u.name as seller_name
-                    FROM orders o
-                    JOIN books b ON o.book_id = b.id
-                    JOIN users u ON o.seller_id = u.id
-                    WHERE o.buyer_id = ?
-                    ORDER BY o.created_at DESC
-                ''', (user_id,))
-            else:
-                # Objednávky jako prodávající
-                cursor.execute('''
-                    SELECT o.id, b.title, b.author, o.total_price, o.order_status, 
-                        o.created_at, u.name as buyer_name, o.buyer_address, o.buyer_phone
-                    FROM orders o
-                    JOIN books b ON o.book_id = b.id
-                    JOIN users u ON o.buyer_id = u.id
-                    WHERE o.seller_id = ?
-                    ORDER BY o.created_at DESC
-                ''', (user_id,))
-
-            orders = cursor.fetchall()
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = ORDER_ROWS
+
+                if as_buyer:
+                    # Objednávky jako kupující
+                    cursor.execute('''
+                        SELECT o.id AS id, b.title, b.author, o.total_price, o.order_status, 
+                            o.created_at AS created_at, u.name as seller_name
+                        FROM orders o
+                        JOIN books b ON o.book_id = b.id
+                        JOIN users u ON o.seller_id = u.id
+                        WHERE o.buyer_id = ?
+                        UNION ALL
+                        SELECT a.id, a.book_title, a.book_author, a.total_price, a.order_status,
+                            a.created_at, u.name
+                        FROM orders_archive a
+                        JOIN users u ON a.seller_id = u.id
+                        WHERE a.buyer_id = ?
+                        ORDER BY created_at DESC, id DESC
+                    ''', (user_id, user_id))
+                else:
+                    # Objednávky jako prodávající
+                    cursor.execute('''
+                        SELECT o.id AS id, b.title, b.author, o.total_price, o.order_status, 
+                            o.created_at AS created_at, u.name as buyer_name, o.buyer_address, o.buyer_phone
+                        FROM orders o
+                        JOIN books b ON o.book_id = b.id
+                        JOIN users u ON o.buyer_id = u.id
+                        WHERE o.seller_id = ?
+                        UNION ALL
+                        SELECT a.id, a.book_title, a.book_author, a.total_price, a.order_status,
+                            a.created_at, u.name, a.buyer_address, a.buyer_phone
+                        FROM orders_archive a
+                        JOIN users u ON a.buyer_id = u.id
+                        WHERE a.seller_id = ?
+                        ORDER BY created_at DESC, id DESC
+                    ''', (user_id, user_id))
+
+                orders = cursor.fetchall()
             return orders
             
         except Exception as e:
             print(f"Chyba při načítání objednávek: {str(e)}")
             return []
 
+    @instrumented
     def update_order_status(self, order_id, new_status):
         """Aktualizace stavu objednávky"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                begin_write(conn)
 
-            cursor.execute("UPDATE orders SET order_status = ? WHERE id = ?", (new_status, order_id))
+                cursor.execute("UPDATE orders SET order_status = ? WHERE id = ?", (new_status, order_id))
             
-            if new_status == 'completed':
-                cursor.execute("UPDATE orders SET completed_at = CURRENT_TIMESTAMP WHERE id = ?", (order_id,))
+                if new_status == 'completed':
+                    cursor.execute("UPDATE orders SET completed_at = CURRENT_TIMESTAMP WHERE id = ?", (order_id,))
 
-            conn.commit()
-            conn.close()
             return True
             
         except Exception as e:
             print(f"Chyba při aktualizaci objednávky: {str(e)}")
             return False
 
+    @instrumented
     def get_book_details(self, book_id):
-        """Získání detailů knihy pro nákup"""
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+        """Získání detailů knihy pro nákup (s mezipamětí, i z archivu)"""
+        key = ('book_details', book_id)
+        token = self.get_change_token('books', 'users')
+        found, book = self.cache.get(key, token)
+        if found:
+            return book
 
-            cursor.execute('''
-                SELECT b.id, b.title, b.author, b.price, b.condition, b.description, 
-                    u.name, u.email, b.seller_id, b.is_sold
-                FROM books b
-                JOIN users u ON b.seller_id = u.id
-                WHERE b.id = ?
-            ''', (book_id,))
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = BOOK_DETAIL_ROWS
 
-            book = cursor.fetchone()
-            conn.close()
+                cursor.execute('''
+                    SELECT b.id, b.title, b.author, b.price, b.condition, b.description, 
+                        u.name, u.email, b.seller_id, b.is_sold
+                    FROM (SELECT id, title, author, price, condition, description, seller_id, is_sold
+                          FROM books
+                          UNION ALL
+                          SELECT id, title, author, price, condition, description, seller_id, is_sold
+                          FROM books_archive) b
+                    JOIN users u ON b.seller_id = u.id
+                    WHERE b.id = ?
+                ''', (book_id,))
+
+                book = cursor.fetchone()
+
+            self.cache.put(key, book, token, [('book', book_id)])
             return book
             
         except Exception as e:
             print(f"Chyba při načítání detailů knihy: {str(e)}")
             return None
         
-    def get_user_books(self, user_id):
-        """Získání všech knih uživatele"""
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+    @instrumented
+    def get_user_books(self, user_id, fields=None):
+        """Získání všech knih uživatele (včetně archivovaných prodaných).
 
-            cursor.execute('''
-                SELECT b.id, b.title, b.author, b.price, b.condition, b.description, 
-                    b.is_sold, b.created_at
-                FROM books b
-                WHERE b.seller_id = ?
-                ORDER BY b.created_at DESC
-            ''', (user_id,))
+        fields omezí sloupce uložené v záznamech (např. MY_BOOKS_FIELDS).
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = record_factory(Book, USER_BOOK_COLUMNS, fields)
 
-            books = cursor.fetchall()
-            conn.close()
+                cursor.execute('''
+                    SELECT b.id AS id, b.title, b.author, b.price, b.condition, b.description, 
+                        b.is_sold, b.created_at AS created_at
+                    FROM books b
+                    WHERE b.seller_id = ?
+                    UNION ALL
+                    SELECT a.id, a.title, a.author, a.price, a.condition, a.description,
+                        a.is_sold, a.created_at
+                    FROM books_archive a
+                    WHERE a.seller_id = ?
+                    ORDER BY created_at DESC, id DESC
+                ''', (user_id, user_id))
+
+                books = cursor.fetchall()
             return books
             
         except Exception as e:
             print(f"Chyba při načítání uživatelových knih: {str(e)}")
             return []
 
+    @instrumented
+    def get_user_books_page(self, user_id, status='all', cursor=None, page_size=BOOKS_PAGE_SIZE, fields=None):
+        """Stránka knih prodávajícího podle filtru ('all', 'available', 'sold').
+
+        Filtr i stránkování za kurzorem (created_at, id) běží v SQL, takže
+        se načte jen zobrazovaná stránka. Archivované knihy jsou prodané,
+        připojí se jen k filtrům 'all' a 'sold'. S fields se vyberou jen
+        tyto sloupce. Vrací (knihy, kurzor další stránky nebo None).
+        """
+        if status not in USER_BOOK_FILTERS:
+            raise ValueError(f"Neznámý filtr knih: {status}")
+
+        # id a created_at jsou potřeba pro kurzor další stránky
+        columns = tuple(name for name in USER_BOOK_COLUMNS
+                        if fields is None or name in fields or name in ('id', 'created_at'))
+        where_clause = "seller_id = ?"
+        params = [user_id]
+        if cursor:
+            where_clause += " AND (created_at, id) < (?, ?)"
+            params.extend(cursor)
+
+        hot_where, hot_params = where_clause, list(params)
+        if USER_BOOK_FILTERS[status] is not None:
+            hot_where += " AND is_sold = ?"
+            hot_params.append(USER_BOOK_FILTERS[status])
+        branches = [f"SELECT {', '.join(columns)} FROM books WHERE {hot_where}"]
+        branch_params = hot_params
+        if status != 'available':
+            branches.append(f"SELECT {', '.join(columns)} FROM books_archive WHERE {where_clause}")
+            branch_params += params
+
+        try:
+            with self.connection() as conn:
+                rows_cursor = conn.cursor()
+                rows_cursor.row_factory = record_factory(Book, columns)
+                rows = rows_cursor.execute(f'''
+                    {' UNION ALL '.join(branches)}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                ''', (*branch_params, page_size + 1)).fetchall()
+
+            # Načtení o jeden řádek víc -> víme, jestli existuje další stránka
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            next_cursor = (rows[-1].created_at, rows[-1].id) if has_more else None
+            return rows, next_cursor
+        except Exception as e:
+            print(f"Chyba při načítání uživatelových knih: {str(e)}")
+            return [], None
+
+    @instrumented
+    def get_user_book_counts(self, user_id):
+        """Počty knih prodávajícího pro tlačítka filtrů jedním dotazem.
+
+        Vrací {'all': ..., 'available': ..., 'sold': ...} včetně archivu.
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    SELECT COUNT(*), COALESCE(SUM(NOT is_sold), 0)
+                    FROM (SELECT is_sold FROM books WHERE seller_id = ?
+                          UNION ALL
+                          SELECT is_sold FROM books_archive WHERE seller_id = ?)
+                ''', (user_id, user_id))
+
+                total, available = cursor.fetchone()
+            return {'all': total, 'available': available, 'sold': total - available}
+        except Exception as e:
+            print(f"Chyba při počítání uživatelových knih: {str(e)}")
+            return {'all': 0, 'available': 0, 'sold': 0}
+
+    @instrumented
     def delete_book(self, book_id, user_id):
         """Smazání knihy (pouze vlastník může smazat)"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                begin_write(conn)
 
-            # Kontrola, jestli je uživatel vlastníkem knihy
-            cursor.execute("SELECT seller_id, is_sold FROM books WHERE id = ?", (book_id,))
-            result = cursor.fetchone()
+                # Kontrola, jestli je uživatel vlastníkem knihy (archivovaná je vždy prodaná)
+                cursor.execute('''
+                    SELECT seller_id, is_sold FROM books WHERE id = ?
+                    UNION ALL
+                    SELECT seller_id, is_sold FROM books_archive WHERE id = ?
+                ''', (book_id, book_id))
+                result = cursor.fetchone()
             
-            if not result:
-                return False, "Kniha nebyla nalezena!"
+                if not result:
+                    return False, "Kniha nebyla nalezena!"
             
-            seller_id, is_sold = result
+                seller_id, is_sold = result
             
-            if seller_id != user_id:
-                return False, "Nemůžete smazat cizí knihu!"
+                if seller_id != user_id:
+                    return False, "Nemůžete smazat cizí knihu!"
             
-            if is_sold:
-                return False, "Nelze smazat prodanou knihu!"
+                if is_sold:
+                    return False, "Nelze smazat prodanou knihu!"
 
-            # Smazání knihy
-            cursor.execute("DELETE FROM books WHERE id = ?", (book_id,))
+                # Smazání knihy
+                cursor.execute("DELETE FROM books WHERE id = ?", (book_id,))
             
-            conn.commit()
-            conn.close()
+            self.cache.invalidate(('book', book_id))
             return True, "Kniha byla smazána!"
             
         except Exception as e:
             return False, f"Chyba při mazání knihy: {str(e)}"
 
+    @instrumented
     def update_book_status(self, book_id, user_id, is_sold):
         """Změna stavu knihy (prodáno/k prodeji)"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                begin_write(conn)
+                result = self._write_update_book_status(conn.cursor(), user_id, book_id, is_sold)
 
-            # Kontrola vlastnictví
-            cursor.execute("SELECT seller_id FROM books WHERE id = ?", (book_id,))
-            result = cursor.fetchone()
+            self.cache.invalidate(('book', book_id))
+            return result
             
-            if not result or result[0] != user_id:
-                return False, "Nemůžete upravit cizí knihu!"
+        except Exception as e:
+            return False, f"Chyba při změně stavu: {str(e)}"
 
-            cursor.execute("UPDATE books SET is_sold = ? WHERE id = ?", (is_sold, book_id))
-            
-            conn.commit()
-            conn.close()
-            
-            status_text = "prodáno" if is_sold else "k prodeji"
-            return True, f"Stav knihy změněn na: {status_text}"
-            
+    def _write_update_book_status(self, cursor, user_id, book_id, is_sold):
+        """Změna stavu knihy v transakci volajícího, vrací (úspěch, zpráva)"""
+        # Kontrola vlastnictví
+        cursor.execute('''
+            SELECT seller_id, FALSE FROM books WHERE id = ?
+            UNION ALL
+            SELECT seller_id, TRUE FROM books_archive WHERE id = ?
+        ''', (book_id, book_id))
+        result = cursor.fetchone()
+
+        if not result or result[0] != user_id:
+            return False, "Nemůžete upravit cizí knihu!"
+
+        if result[1]:
+            return False, "Archivovanou knihu už nelze upravit!"
+
+        cursor.execute("UPDATE books SET is_sold = ? WHERE id = ?", (is_sold, book_id))
+        status_text = "prodáno" if is_sold else "k prodeji"
+        return True, f"Stav knihy změněn na: {status_text}"
+
+    @instrumented
+    def apply_writes(self, user_id, writes):
+        """Dávka zápisů z outboxu aplikace v jedné transakci.
+
+        writes je seznam (klíč, metoda, argumenty) - metoda z OUTBOX_METHODS,
+        argumenty jsou slovník jejích parametrů bez id uživatele (to je
+        vždy user_id). Zápis s už použitým klíčem se neprovede znovu.
+        Odmítnutý zápis (cizí kniha, neexistující konverzace) dávku
+        nezastaví. Vrací {klíč: (úspěch, id nového řádku nebo zpráva)},
+        None pokud se dávku nepodařilo zapsat (klient ji zopakuje).
+        """
+        results = {}
+        message_ids = []
+        book_ids = []
+        try:
+            with self.connection() as conn:
+                begin_write(conn)
+                cursor = conn.cursor()
+                keys = [write[0] for write in writes]
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    cursor.execute(
+                        f"SELECT key, success, value FROM applied_writes WHERE key IN ({', '.join('?' * len(chunk))})",
+                        chunk)
+                    results.update((key, (bool(success), value)) for key, success, value in cursor.fetchall())
+
+                for key, method, args in writes:
+                    if key in results:
+                        continue
+                    if method not in OUTBOX_METHODS:
+                        result = (False, f"Neznámý zápis: {method}")
+                    else:
+                        # Savepoint -> chybný zápis se vrátí sám, ostatní v dávce zůstanou
+                        cursor.execute("SAVEPOINT outbox_write")
+                        try:
+                            result = getattr(self, f'_write_{method}')(cursor, user_id, **args)
+                        except (sqlite3.IntegrityError, TypeError, ValueError) as e:
+                            cursor.execute("ROLLBACK TO outbox_write")
+                            result = (False, f"Chyba: {str(e)}")
+                        cursor.execute("RELEASE outbox_write")
+
+                    cursor.execute(
+                        "INSERT INTO applied_writes (key, user_id, method, success, value) VALUES (?, ?, ?, ?, ?)",
+                        (key, user_id, method, result[0], result[1]))
+                    results[key] = result
+                    if result[0] and method == 'send_message':
+                        message_ids.append(result[1])
+                    elif result[0]:
+                        book_ids.append(result[1] if method == 'add_book' else args.get('book_id'))
+        except Exception as e:
+            print(f"Chyba při zápisu dávky z outboxu: {str(e)}")
+            return None
+
+        for book_id in book_ids:
+            self.cache.invalidate(('book', book_id))
+        if message_ids and self.events.has_subscribers():
+            for message_id in message_ids:
+                self._publish_message(message_id)
+        return results
+
+    @instrumented
+    def archive_old_data(self, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+        """Přesun starých uzavřených objednávek a prodaných knih do archivu.
+
+        Objednávka se posuzuje podle času uzavření (completed_at, bez něj
+        created_at), kniha podle času vystavení. Kniha jde do archivu,
+        jen pokud na ni neodkazuje žádná živá objednávka - prodaná kniha
+        tak čeká, až se archivuje i její objednávka.
+
+        Řádky se přesouvají po dávkách v krátkých transakcích BEGIN
+        IMMEDIATE, aby mezi nimi mohla aplikace zapisovat. Archiv je ve
+        stejném souboru, takže soubor se tím nezmenší - uvolněné stránky
+        živých tabulek zaplní archivní řádky. Zmenšují se živé tabulky
+        a jejich indexy. Vrací počty přesunutých řádků.
+        """
+        moved = {'orders': 0, 'books': 0}
+        # CURRENT_TIMESTAMP ve výchozích hodnotách sloupců je v UTC
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self.connection() as conn:
+                # Nejdřív objednávky, aby se uvolnily jejich knihy
+                while True:
+                    begin_write(conn)
+                    ids = [row[0] for row in conn.execute('''
+                        SELECT id FROM orders
+                        WHERE order_status IN ('completed', 'cancelled') AND created_at < ?
+                          AND COALESCE(completed_at, created_at) < ?
+                        LIMIT ?
+                    ''', (cutoff, cutoff, batch_size))]
+                    if not ids:
+                        conn.commit()
+                        break
+                    marks = ', '.join('?' * len(ids))
+                    conn.execute(f'''
+                        INSERT INTO orders_archive
+                            (id, book_id, buyer_id, seller_id, order_status, total_price, buyer_address,
+                             buyer_phone, created_at, completed_at, book_title, book_author)
+                        SELECT o.id, o.book_id, o.buyer_id, o.seller_id, o.order_status, o.total_price,
+                               o.buyer_address, o.buyer_phone, o.created_at, o.completed_at,
+                               COALESCE(b.title, a.title, ''), COALESCE(b.author, a.author, '')
+                        FROM orders o
+                        LEFT JOIN books b ON b.id = o.book_id
+                        LEFT JOIN books_archive a ON a.id = o.book_id
+                        WHERE o.id IN ({marks})
+                    ''', ids)
+                    conn.execute(f"DELETE FROM orders WHERE id IN ({marks})", ids)
+                    conn.commit()
+                    moved['orders'] += len(ids)
+
+                # Prodané knihy - procházení podle (created_at, id), knihy
+                # s živou objednávkou se přeskočí a příště už nečtou
+                position = ('', 0)
+                while True:
+                    begin_write(conn)
+                    rows = conn.execute('''
+                        SELECT id, created_at, NOT EXISTS (SELECT 1 FROM orders o WHERE o.book_id = b.id)
+                        FROM books b
+                        WHERE is_sold = TRUE AND created_at < ? AND (created_at, id) > (?, ?)
+                        ORDER BY created_at, id
+                        LIMIT ?
+                    ''', (cutoff, *position, batch_size)).fetchall()
+                    if not rows:
+                        conn.commit()
+                        break
+                    position = (rows[-1][1], rows[-1][0])
+                    ids = [row[0] for row in rows if row[2]]
+                    if ids:
+                        marks = ', '.join('?' * len(ids))
+                        conn.execute(f'''
+                            INSERT INTO books_archive
+                                (id, title, author, price, condition, description, seller_id, is_sold, created_at)
+                            SELECT id, title, author, price, condition, description, seller_id, is_sold, created_at
+                            FROM books WHERE id IN ({marks})
+                        ''', ids)
+                        conn.execute(f"DELETE FROM books WHERE id IN ({marks})", ids)
+                    conn.commit()
+                    moved['books'] += len(ids)
+        except Exception as e:
+            print(f"Chyba při archivaci dat: {str(e)}")
+
+        if moved['orders'] or moved['books']:
+            self.cache.clear()
+        return moved
+
+    @instrumented
+    def incremental_vacuum(self, max_pages=None):
+        """Vrácení volných stránek databáze systému po malých krocích.
+
+        Každý krok je samostatný krátký zápis, takže nezdržuje ostatní
+        spojení. Funguje jen s PRAGMA auto_vacuum = INCREMENTAL, vrací
+        počet uvolněných stránek.
+        """
+        freed = 0
+        try:
+            with self.connection() as conn:
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    return 0
+                while max_pages is None or freed < max_pages:
+                    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    step = min(free_pages, VACUUM_STEP_PAGES)
+                    if max_pages is not None:
+                        step = min(step, max_pages - freed)
+                    if step <= 0:
+                        break
+                    # execute() provede jen první krok příkazu (= jednu stránku),
+                    # executescript() ho doběhne celý
+                    conn.executescript(f"PRAGMA incremental_vacuum({int(step)})")
+                    freed += step
+        except Exception as e:
+            print(f"Chyba při uvolňování místa v databázi: {str(e)}")
+        return freed
+
+    def enable_auto_vacuum(self, max_bytes=None):
+        """Převod databáze vytvořené před zapnutím auto_vacuum.
+
+        Převod je plný VACUUM - přepíše celý soubor pod výhradním zámkem.
+        Databáze větší než max_bytes se přeskočí (None = bez limitu, jen
+        pro offline nástroje). Vrací True, pokud se databáze převedla.
+        """
+        try:
+            with self.connection() as conn:
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    return False
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                if max_bytes is not None and page_count * page_size > max_bytes:
+                    return False
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                return True
+        except Exception as e:
+            print(f"Chyba při zapínání auto_vacuum: {str(e)}")
+            return False
+
+    def run_maintenance(self, older_than_days=ARCHIVE_AFTER_DAYS):
+        """Údržba databáze na pozadí: archivace starých dat a vrácení volného místa.
+
+        Starší databázi bez auto_vacuum převede jen do AUTO_VACUUM_MAX_BYTES,
+        větší se převádí offline (PLIN053_db_tools.py vacuum) a do té doby
+        archivace běží bez vracení místa.
+        """
+        report = {'archived': self.archive_old_data(older_than_days),
+                  'vacuumed': self.enable_auto_vacuum(AUTO_VACUUM_MAX_BYTES)}
+        report['expired_writes'] = self.expire_applied_writes()
+        report['freed_pages'] = self.incremental_vacuum()
+        return report
+
+    def expire_applied_writes(self, older_than_days=APPLIED_WRITES_DAYS):
+        """Smazání starých klíčů zápisů z outboxu, vrací počet smazaných"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self.connection() as conn:
+                return conn.execute("DELETE FROM applied_writes WHERE created_at < ?", (cutoff,)).rowcount
         except Exception as e:
-            return False, f"Chyba při změně stavu: {str(e)}"
\ No newline at end of file
+            print(f"Chyba při mazání starých klíčů zápisů: {str(e)}")
+            return 0
\ No newline at end of file
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Generátor syntetických dat Knihomatu pro benchmarky.
+
+Stejné parametry a seed vytvoří vždy stejnou databázi. Spuštění např.:
+    python PLIN053_dataset.py knihomat_100k.db --scale 100k
+    python PLIN053_dataset.py knihomat_test.db --users 20 --books 500
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Kivy jinak zpracovává argumenty příkazové řádky sám
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from PLIN053_database import Database
+
+# Velikosti dat podle počtu knih (1k / 100k / 1M řádků)
+SCALES = {
+    '1k': {'users': 100, 'books': 1000, 'conversations': 300, 'messages': 3000, 'orders': 200},
+    '100k': {'users': 5000, 'books': 100000, 'conversations': 20000, 'messages': 200000, 'orders': 20000},
+    '1m': {'users': 50000, 'books': 1000000, 'conversations': 200000, 'messages': 2000000, 'orders': 200000},
+}
+
+# Všechny stavy objednávky, které aplikace zobrazuje
+ORDER_STATUSES = ('pending', 'confirmed', 'shipped', 'completed', 'cancelled')
+
+# Heslo všech vygenerovaných uživatelů (email userN@knihomat.cz)
+PASSWORD = 'heslo123'
+
+FIRST_NAMES = ['Jan', 'Petr', 'Jiří', 'Pavel', 'Tomáš', 'Martin', 'Lukáš', 'Jakub', 'Ondřej', 'Vojtěch',
+               'Jana', 'Marie', 'Eva', 'Hana', 'Lucie', 'Kateřina', 'Tereza', 'Veronika', 'Barbora', 'Zuzana']
+LAST_NAMES = ['Novák', 'Svoboda', 'Novotný', 'Dvořák', 'Černý', 'Procházka', 'Kučera', 'Veselý',
+              'Horák', 'Němec', 'Pokorný', 'Marek', 'Pospíšil', 'Hájek', 'Jelínek', 'Růžička']
+CITIES = ['Praha', 'Brno', 'Ostrava', 'Plzeň', 'Liberec', 'Olomouc', 'České Budějovice',
+          'Hradec Králové', 'Pardubice', 'Zlín', 'Jihlava', 'Karlovy Vary']
+STREETS = ['Husova', 'Masarykova', 'Palackého', 'Komenského', 'Nádražní', 'Školní', 'Zahradní',
+           'Jiráskova', 'Havlíčkova', 'Smetanova']
+
+AUTHORS = ['Karel Čapek', 'Božena Němcová', 'Jaroslav Hašek', 'Zdeněk Jirotka', 'Ladislav Fuks',
+           'Bohumil Hrabal', 'Milan Kundera', 'Josef Škvorecký', 'Jan Neruda', 'Karel Jaromír Erben',
+           'Alois Jirásek', 'Vladislav Vančura', 'Jaroslav Seifert', 'Ota Pavel', 'Arnošt Lustig',
+           'Fjodor Michajlovič Dostojevskij', 'Antoine de Saint-Exupéry', 'George Orwell']
+TITLE_WORDS = ['Válka', 's mloky', 'Krakatit', 'Babička', 'Osudy', 'dobrého vojáka', 'Švejka',
+               'Saturnin', 'Spalovač', 'mrtvol', 'Dějiny', 'Matematika', 'pro gymnázia', 'Příběhy',
+               'Zahrada', 'Zločin', 'a trest', 'Malý', 'princ', 'Kytice', 'Povídky', 'malostranské',
+               'Obsluhoval', 'jsem', 'anglického krále', 'Smrt', 'krásných srnců', 'Zbabělci', 'Farma zvířat']
+CONDITIONS = ['Nová', 'Jako nová', 'Velmi dobrý', 'Dobrý', 'Opotřebovaná']
+DESCRIPTIONS = ['Vydání z roku {year}, pevná vazba.', 'Brožovaná, drobné oděrky na hřbetu.',
+                'Kniha je bez poznámek a podtrhávání.', 'Povinná četba, několik poznámek tužkou.',
+                'Sbírka z knihovny po babičce, věnování na první straně.', 'Učebnice, ročník {year}.']
+MESSAGES = ['Dobrý den, je kniha ještě k dispozici?', 'Ano, pořád ji mám.',
+            'Šlo by to o trochu levněji?', 'Mohu ji poslat Zásilkovnou.', 'Kdy by se vám hodilo předání?',
+            'Jaký je přesně stav obálky?', 'Děkuji, objednávám.', 'Můžu poslat ještě fotku?',
+            'Posílám číslo účtu.', 'Kniha dorazila, díky!']
+
+# Data se rozloží do období před tímto okamžikem (kvůli reprodukovatelnosti pevné)
+END_TIME = datetime(2025, 6, 30, 18, 0, 0)
+SPAN = timedelta(days=730)
+
+
+def timestamp(position, total):
+    """Čas úměrný pozici řádku v celém období (vzestupně s id)"""
+    moment = END_TIME - SPAN + SPAN * ((position + 1) / max(total, 1))
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def chunks(rows, size):
+    """Rozdělení generátoru řádků na seznamy po size"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_dataset(db, users, books, conversations=0, messages=0, orders=0, seed=42,
+                     batch_size=10000, progress=None):
+    """Naplnění prázdné databáze reprodukovatelnými daty.
+
+    Objednávky pokrývají všechny stavy z ORDER_STATUSES, knihy
+    z nezrušených objednávek jsou prodané. Vrací slovník se skutečnými
+    počty řádků v tabulkách.
+    """
+    with db.connection() as conn:
+        if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+            raise ValueError("Databáze pro generování dat musí být prázdná")
+
+    rnd = random.Random(seed)
+    report = progress or (lambda table, count: None)
+    password_hash = db.hash_password(PASSWORD)
+
+    def user_rows():
+        for i in range(1, users + 1):
+            name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+            yield name, f"user{i}@knihomat.cz", password_hash, timestamp(i, users)
+
+    with db.connection() as conn:
+        for batch in chunks(user_rows(), batch_size):
+            conn.executemany(
+                "INSERT INTO users (name, email, password_hash, created_at) VALUES (?, ?, ?, ?)", batch)
+    report('users', users)
+
+    # Knihy přes hromadný import (fulltextový index se přestaví jednou)
+    sellers = [rnd.randint(1, users) for _ in range(books)]
+    prices = [rnd.randint(3, 180) * 5 for _ in range(books)]
+
+    def book_rows():
+        for i in range(books):
+            words = rnd.sample(TITLE_WORDS, rnd.randint(1, 3))
+            description = rnd.choice(DESCRIPTIONS).format(year=rnd.randint(1950, 2024))
+            yield (' '.join(words), rnd.choice(AUTHORS), prices[i],
+                   rnd.choice(CONDITIONS), description, sellers[i])
+
+    db.bulk_add_books(chunks(book_rows(), batch_size))
+    with db.connection() as conn:
+        conn.execute(
+            "UPDATE books SET created_at = datetime(?, printf('+%d seconds', id * ? / ?))",
+            ((END_TIME - SPAN).strftime('%Y-%m-%d %H:%M:%S'), int(SPAN.total_seconds()), max(books, 1)))
+    report('books', books)
+
+    # Konverzace vždy mezi prodávajícím knihy a jiným uživatelem
+    triples = set()
+    attempts = 0
+    while len(triples) < conversations and users > 1 and attempts < conversations * 10:
+        attempts += 1
+        book_id = rnd.randint(1, books)
+        seller_id = sellers[book_id - 1]
+        buyer_id = rnd.randint(1, users)
+        if buyer_id != seller_id:
+            triples.add((book_id, buyer_id, seller_id))
+    triples = sorted(triples)
+    rnd.shuffle(triples)
+
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO conversations (book_id, buyer_id, seller_id, created_at) VALUES (?, ?, ?, ?)",
+            [(*triple, timestamp(i, len(triples))) for i, triple in enumerate(triples)])
+    report('conversations', len(triples))
+
+    def message_rows():
+        for i in range(messages):
+            conversation_id = rnd.randint(1, len(triples))
+            book_id, buyer_id, seller_id = triples[conversation_id - 1]
+            sender_id = buyer_id if rnd.random() < 0.55 else seller_id
+            yield (conversation_id, sender_id, rnd.choice(MESSAGES), timestamp(i, messages),
+                   rnd.random() < 0.8)
+
+    if triples:
+        with db.connection() as conn:
+            for batch in chunks(message_rows(), batch_size):
+                conn.executemany(
+                    "INSERT INTO messages (conversation_id, sender_id, message, created_at, is_read) "
+                    "VALUES (?, ?, ?, ?, ?)", batch)
+    report('messages', messages if triples else 0)
+
+    # Objednávky: každá kniha nejvýš jednou, stavy postupně dokola
+    order_books = rnd.sample(range(1, books + 1), min(orders, books))
+
+    def order_rows():
+        for i, book_id in enumerate(order_books):
+            seller_id = sellers[book_id - 1]
+            buyer_id = rnd.randint(1, users)
+            if buyer_id == seller_id:
+                buyer_id = buyer_id % users + 1
+            status = ORDER_STATUSES[i % len(ORDER_STATUSES)]
+            created_at = timestamp(i, len(order_books))
+            completed_at = created_at if status == 'completed' else None
+            address = f"{rnd.choice(STREETS)} {rnd.randint(1, 120)}, {rnd.choice(CITIES)}"
+            phone = f"+420 {rnd.randint(600, 799)} {rnd.randint(100, 999)} {rnd.randint(100, 999)}"
+            yield (book_id, buyer_id, seller_id, status, prices[book_id - 1], address, phone,
+                   created_at, completed_at)
+
+    with db.connection() as conn:
+        for batch in chunks(order_rows(), batch_size):
+            conn.executemany(
+                "INSERT INTO orders (book_id, buyer_id, seller_id, order_status, total_price, "
+                "buyer_address, buyer_phone, created_at, completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch)
+        conn.execute(
+            "UPDATE books SET is_sold = TRUE WHERE id IN "
+            "(SELECT book_id FROM orders WHERE order_status != 'cancelled')")
+    report('orders', len(order_books))
+
+    db.cache.clear()
+    with db.connection() as conn:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('users', 'books', 'conversations', 'messages', 'orders')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generátor syntetických dat Knihomatu')
+    parser.add_argument('db', help='cesta k nové databázi')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='předdefinovaná velikost')
+    for table in ('users', 'books', 'conversations', 'messages', 'orders'):
+        parser.add_argument(f'--{table}', type=int, help=f'počet řádků {table} (přepíše --scale)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        print(f"Soubor {args.db} už existuje!")
+        return 1
+
+    sizes = dict(SCALES[args.scale])
+    for table in sizes:
+        if getattr(args, table) is not None:
+            sizes[table] = getattr(args, table)
+
+    start = time.perf_counter()
+    db = Database(args.db, instrument=False)
+    counts = generate_dataset(
+        db, seed=args.seed,
+        progress=lambda table, count: print(f"{table}: {count} ({time.perf_counter() - start:.1f} s)"),
+        **sizes)
+    db.close()
+    print(f"Hotovo za {time.perf_counter() - start:.1f} s: {counts}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
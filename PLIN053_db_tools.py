@@ -0,0 +1,720 @@
+#!/usr/bin/env python3
+"""Nástroje pro kontrolu databázové vrstvy Knihomatu.
+
+Spuštění z příkazové řádky, např.:
+    python PLIN053_db_tools.py plans
+    python PLIN053_db_tools.py migrations
+    python PLIN053_db_tools.py stats --json statistiky.json
+    python PLIN053_db_tools.py summaries
+    python PLIN053_db_tools.py archive
+    python PLIN053_db_tools.py vacuum --db knihomat.db
+    python PLIN053_db_tools.py server
+    python PLIN053_db_tools.py outbox
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Kivy jinak zpracovává argumenty příkazové řádky sám
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from PLIN053_database import Database, MIGRATIONS, SCHEMA_VERSION, apply_migrations, get_schema_version
+from PLIN053_benchmark import seed_database
+from PLIN053_dataset import PASSWORD, generate_dataset
+from PLIN053_outbox import Outbox
+from PLIN053_remote_database import RemoteDatabase
+from PLIN053_server import DatabaseServer
+
+
+class TracingDatabase(Database):
+    """Database, která si zaznamenává všechny provedené SQL příkazy"""
+
+    def __init__(self, *args, **kwargs):
+        self.statements = []
+        # Vlastní trace callback by přepsal ten z měření volání
+        kwargs.setdefault('instrument', False)
+        super().__init__(*args, **kwargs)
+
+    @contextmanager
+    def connection(self):
+        with super().connection() as conn:
+            conn.set_trace_callback(self.statements.append)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+
+def query_calls(db):
+    """Volání všech dotazovacích metod Database s ukázkovými argumenty"""
+    return {
+        'login_user': lambda: db.login_user('user1@knihomat.cz', 'heslo123'),
+        'get_all_books': lambda: db.get_all_books(),
+        'search_books': lambda: db.search_books('Kniha 1'),
+        'get_books_page': lambda: db.get_books_page(),
+        'get_books_page (cursor)': lambda: db.get_books_page(db.get_books_page()[1]),
+        'search_books_page': lambda: db.search_books_page('Kniha', ('9999-12-31', 10**9)),
+        'create_or_get_conversation': lambda: db.create_or_get_conversation(
+            1, 2 if db.get_seller_id_by_book(1) == 1 else 1, db.get_seller_id_by_book(1)),
+        'get_messages': lambda: db.get_messages(1),
+        'get_messages_since': lambda: db.get_messages_since(1, 3),
+        'get_messages_page': lambda: db.get_messages_page(1),
+        'get_messages_page (before)': lambda: db.get_messages_page(1, before_id=10**9),
+        'get_messages_page (after)': lambda: db.get_messages_page(1, after_id=3),
+        'apply_writes': lambda: db.apply_writes(1, [('plans-1', 'update_book_status', {'book_id': 1, 'is_sold': False}),
+                                                    ('plans-2', 'send_message', {'conversation_id': 1, 'message': 'x'})]),
+        'get_user_conversations': lambda: db.get_user_conversations(1),
+        'get_unread_counts': lambda: db.get_unread_counts(1),
+        'mark_messages_read': lambda: db.mark_messages_read(1, 2, 10**9),
+        'get_conversation_info': lambda: db.get_conversation_info(1),
+        'get_seller_id_by_book': lambda: db.get_seller_id_by_book(1),
+        'get_conversation_participants': lambda: db.get_conversation_participants(1),
+        'get_order_seller_id': lambda: db.get_order_seller_id(1),
+        'get_user_orders (buyer)': lambda: db.get_user_orders(1, as_buyer=True),
+        'get_user_orders (seller)': lambda: db.get_user_orders(1, as_buyer=False),
+        'get_book_details': lambda: db.get_book_details(1),
+        'get_user_books': lambda: db.get_user_books(1),
+        'get_user_books_page (all)': lambda: db.get_user_books_page(1, 'all', ('9999-12-31', 10**9)),
+        'get_user_books_page (available)': lambda: db.get_user_books_page(1, 'available'),
+        'get_user_books_page (sold)': lambda: db.get_user_books_page(1, 'sold', fields=('title',)),
+        'get_user_book_counts': lambda: db.get_user_book_counts(1),
+        'create_order': lambda: db.create_order(2, 1, 'Brno', '+420 123 456 789'),
+        'update_book_status': lambda: db.update_book_status(3, 1, False),
+        'delete_book': lambda: db.delete_book(4, 1),
+        'archive_old_data': lambda: db.archive_old_data(0),
+    }
+
+
+# Malé tabulky s pevným počtem řádků, které se čtou celé záměrně
+SMALL_TABLES = ('table_versions',)
+
+
+def is_full_scan(detail):
+    """Jde o průchod celou tabulkou bez indexu?"""
+    if not detail.startswith('SCAN') or 'USING' in detail or 'VIRTUAL TABLE' in detail:
+        return False
+    # SCAN (subquery-N) čte už vybrané řádky poddotazu, ne tabulku
+    name = detail.split()[1]
+    return not name.startswith('(') and name not in SMALL_TABLES
+
+
+def is_loop(detail):
+    """Řádek plánu, který prochází řádky tabulky (vnější nebo vnořená smyčka)"""
+    return detail.startswith(('SCAN', 'SEARCH'))
+
+
+def plan_problems(rows):
+    """Problémové řádky plánu: průchod celou tabulkou a vnořené hledání ve FTS.
+
+    rows jsou (id, parent, detail) z EXPLAIN QUERY PLAN. SCAN virtuální
+    tabulky (MATCH ve FTS) je v pořádku jen jako vnější smyčka - pokud
+    mu na stejné úrovni předchází jiná smyčka nebo leží pod korelovaným
+    poddotazem, provede se MATCH znovu pro každý řádek vnější tabulky.
+    """
+    details = {row_id: detail for row_id, _, detail in rows}
+    parents = {row_id: parent for row_id, parent, _ in rows}
+    problems = []
+    for index, (row_id, parent, detail) in enumerate(rows):
+        if is_full_scan(detail):
+            problems.append(detail)
+        elif detail.startswith('SCAN') and 'VIRTUAL TABLE' in detail:
+            outer = [d for _, p, d in rows[:index] if p == parent and is_loop(d)]
+            ancestor = parent
+            while ancestor and not outer:
+                if 'CORRELATED' in details.get(ancestor, ''):
+                    outer.append(details[ancestor])
+                ancestor = parents.get(ancestor, 0)
+            if outer:
+                problems.append(detail)
+    return problems
+
+
+def collect_query_plans(db):
+    """EXPLAIN QUERY PLAN pro každý dotaz (SELECT/UPDATE/DELETE) každé metody"""
+    plans = {}
+    for name, call in query_calls(db).items():
+        db.statements.clear()
+        call()
+        method_plans = []
+        for index, sql in enumerate(db.statements):
+            # Příkazy triggerů hlásí sqlite3 znovu textem vnějšího příkazu
+            if index and sql == db.statements[index - 1]:
+                continue
+            keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+            if keyword not in ('SELECT', 'UPDATE', 'DELETE', 'WITH'):
+                continue
+            with db.connection() as conn:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            method_plans.append((sql, [(row[0], row[1], row[3]) for row in rows]))
+        plans[name] = method_plans
+    return plans
+
+
+def check_plans(args):
+    """Kontrola, že žádný dotaz Database neprochází celou tabulku (SCAN)
+    ani nehledá ve FTS znovu pro každý řádek jiné tabulky"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'knihomat_plans.db')
+    db = TracingDatabase(db_path)
+    seed_database(db, users=20, books=200, conversations=50, messages=5)
+
+    failures = 0
+    for name, method_plans in collect_query_plans(db).items():
+        for sql, rows in method_plans:
+            scans = plan_problems(rows)
+            status = 'SCAN' if scans else 'OK'
+            failures += bool(scans)
+            if scans or args.verbose:
+                print(f"[{status}] {name}: {' '.join(sql.split())}")
+                for _, _, detail in rows:
+                    print(f"        {'!' if detail in scans else ' '} {detail}")
+            else:
+                print(f"[{status}] {name}")
+
+    db.close()
+    if failures:
+        print(f"\n{failures} dotazů prochází celou tabulku nebo FTS pro každý řádek!")
+        return 1
+    print("\nVšechny dotazy používají index.")
+    return 0
+
+
+def build_old_database(path, version):
+    """Databáze se schématem starší verze, jak by ji vytvořila starší aplikace.
+
+    Verze 0 odpovídá původní aplikaci: tabulky existují, ale user_version
+    ještě nebyla nastavena.
+    """
+    conn = sqlite3.connect(path)
+    if version == 0:
+        MIGRATIONS[0](conn.cursor())
+        conn.commit()
+    else:
+        apply_migrations(conn, version)
+
+    # Ukázková data přes sloupce základního schématu
+    conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('Jana', 'jana@knihomat.cz', 'x')")
+    conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('Petr', 'petr@knihomat.cz', 'x')")
+    conn.execute("INSERT INTO books (title, author, price, condition, description, seller_id) "
+                 "VALUES ('Krakatit', 'Karel Čapek', 120, 'Dobrý', 'Vydání z roku 1924', 1)")
+    conn.execute("INSERT INTO books (title, author, price, condition, description, seller_id) "
+                 "VALUES ('Babička', 'Božena Němcová', 80, 'Velmi dobrý', '', 1)")
+    conn.execute("INSERT INTO conversations (book_id, buyer_id, seller_id) VALUES (1, 2, 1)")
+    conn.execute("INSERT INTO messages (conversation_id, sender_id, message) VALUES (1, 2, 'Dobrý den')")
+    conn.execute("INSERT INTO orders (book_id, buyer_id, seller_id, total_price) VALUES (2, 2, 1, 80)")
+    conn.commit()
+    return conn
+
+
+def schema_snapshot(path):
+    """Normalizované schéma databáze (typ, název, SQL) pro porovnání"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"
+    ).fetchall()
+    conn.close()
+    return [(kind, name, ' '.join((sql or '').split())) for kind, name, sql in rows]
+
+
+def check_migrations(args):
+    """Upgrade databází ze všech starších verzí schématu na aktuální"""
+    tmp_dir = tempfile.mkdtemp()
+    fresh_path = os.path.join(tmp_dir, 'fresh.db')
+    Database(fresh_path).close()
+    expected = schema_snapshot(fresh_path)
+
+    failures = 0
+    for version in range(SCHEMA_VERSION):
+        path = os.path.join(tmp_dir, f'v{version}.db')
+        old = build_old_database(path, version)
+        counts_before = {table: old.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                         for table in ('users', 'books', 'conversations', 'messages', 'orders')}
+        old.close()
+
+        problems = []
+        try:
+            db = Database(path)
+        except Exception as e:
+            print(f"[CHYBA] verze {version} -> {SCHEMA_VERSION}: {e}")
+            failures += 1
+            continue
+
+        with db.connection() as conn:
+            if get_schema_version(conn) != SCHEMA_VERSION:
+                problems.append(f"user_version je {get_schema_version(conn)}")
+            for table, count in counts_before.items():
+                after = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                if after != count:
+                    problems.append(f"{table}: {count} řádků před, {after} po migraci")
+        if not db.get_all_books() or not db.get_messages(1):
+            problems.append("data nejsou čitelná přes Database")
+        db.close()
+
+        actual = schema_snapshot(path)
+        for item in sorted(set(expected) ^ set(actual)):
+            source = 'chybí' if item in expected else 'navíc'
+            problems.append(f"{source}: {item[0]} {item[1]}")
+
+        failures += bool(problems)
+        print(f"[{'CHYBA' if problems else 'OK'}] verze {version} -> {SCHEMA_VERSION}")
+        for problem in problems:
+            print(f"        {problem}")
+
+    return 1 if failures else 0
+
+
+def show_stats(args):
+    """Statistiky volání metod Database nad ukázkovými daty"""
+    if args.db:
+        db = Database(args.db, slow_threshold_ms=args.slow_ms)
+    else:
+        db = Database(os.path.join(tempfile.mkdtemp(), 'knihomat_stats.db'), slow_threshold_ms=args.slow_ms)
+        seed_database(db, users=50, books=2000, conversations=200, messages=10)
+        db.reset_query_stats()
+
+    calls = query_calls(db)
+    for _ in range(args.repeat):
+        for call in calls.values():
+            call()
+
+    print(f"{'metoda':<28}{'volání':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'řádky':>8}{'zámek ms':>10}")
+    for name, stats in db.get_query_stats().items():
+        print(f"{name:<28}{stats['calls']:>8}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}{stats['rows']:>8}{stats['lock_wait_ms']:>10.3f}")
+
+    slow = db.get_slow_queries()
+    print(f"\nPomalá volání (nad {args.slow_ms} ms): {len(slow)}")
+    for entry in slow[-5:]:
+        print(f"  {entry['method']}: {entry['duration_ms']} ms")
+        for statement in entry['statements']:
+            print(f"        {statement['sql'][:100]}")
+            for detail in statement['plan'] or []:
+                print(f"            {detail}")
+
+    if args.json:
+        db.dump_query_stats(args.json)
+        print(f"\nStatistiky uloženy do {args.json}")
+    db.close()
+    return 0
+
+
+def expected_summaries(conn):
+    """Souhrny konverzací spočítané znovu přímo ze zpráv (nezávisle na triggerech)"""
+    summaries = {}
+    for conversation_id, buyer_id, seller_id, created_at in conn.execute(
+            "SELECT id, buyer_id, seller_id, created_at FROM conversations"):
+        for user_id, other_id, role in ((buyer_id, seller_id, 'buyer'), (seller_id, buyer_id, 'seller')):
+            summaries.setdefault((conversation_id, user_id),
+                                 [other_id, role, None, None, created_at, 0])
+
+    for message_id, conversation_id, sender_id, message, created_at, is_read in conn.execute(
+            "SELECT id, conversation_id, sender_id, message, created_at, is_read FROM messages ORDER BY id"):
+        for (summary_conversation, user_id), summary in summaries.items():
+            if summary_conversation != conversation_id:
+                continue
+            summary[2:5] = [message_id, message[:80], created_at]
+            if user_id != sender_id and not is_read:
+                summary[5] += 1
+    return {key: tuple(value) for key, value in summaries.items()}
+
+
+def check_summaries(args):
+    """Kontrola souhrnů konverzací udržovaných triggery po náhodných změnách"""
+    db = Database(os.path.join(tempfile.mkdtemp(), 'knihomat_summaries.db'))
+    generate_dataset(db, users=30, books=300, conversations=60, messages=600, seed=args.seed)
+    rnd = random.Random(args.seed)
+
+    with db.connection() as conn:
+        for _ in range(args.operations):
+            conversations = conn.execute("SELECT id, buyer_id, seller_id FROM conversations").fetchall()
+            message_ids = [row[0] for row in conn.execute("SELECT id FROM messages")]
+            action = rnd.choice(['send', 'send', 'read', 'unread', 'mark_read', 'delete_message', 'open',
+                                 'delete_conversation'])
+            if action == 'send' and conversations:
+                conversation_id, buyer_id, seller_id = rnd.choice(conversations)
+                conn.execute("INSERT INTO messages (conversation_id, sender_id, message) VALUES (?, ?, ?)",
+                             (conversation_id, rnd.choice([buyer_id, seller_id]), f"Zpráva {rnd.random()}"))
+            elif action in ('read', 'unread') and message_ids:
+                conn.execute("UPDATE messages SET is_read = ? WHERE id = ?",
+                             (action == 'read', rnd.choice(message_ids)))
+            elif action == 'mark_read' and conversations and message_ids:
+                conversation_id, buyer_id, seller_id = rnd.choice(conversations)
+                db.mark_messages_read(conversation_id, rnd.choice([buyer_id, seller_id]), rnd.choice(message_ids))
+            elif action == 'delete_message' and message_ids:
+                conn.execute("DELETE FROM messages WHERE id = ?", (rnd.choice(message_ids),))
+            elif action == 'open':
+                conn.execute("INSERT OR IGNORE INTO conversations (book_id, buyer_id, seller_id) VALUES (?, ?, ?)",
+                             (rnd.randint(1, 300), rnd.randint(1, 30), rnd.randint(1, 30)))
+            elif action == 'delete_conversation' and conversations:
+                conversation_id = rnd.choice(conversations)[0]
+                conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+        expected = expected_summaries(conn)
+        actual = {(row[0], row[1]): tuple(row[2:]) for row in conn.execute(
+            "SELECT conversation_id, user_id, other_user_id, user_role, last_message_id, last_message, "
+            "last_activity, unread_count FROM conversation_summaries")}
+    db.close()
+
+    problems = [key for key in sorted(set(expected) | set(actual)) if expected.get(key) != actual.get(key)]
+    for key in problems[:10]:
+        print(f"[CHYBA] konverzace {key[0]}, uživatel {key[1]}: očekáváno {expected.get(key)}, "
+              f"v tabulce {actual.get(key)}")
+    print(f"{len(actual)} souhrnů po {args.operations} změnách, nesouhlasí {len(problems)}")
+    return 1 if problems else 0
+
+
+def archive_snapshot(db, users, books, conversations):
+    """Výsledky čtecích metod, které musí archivace zachovat beze změny"""
+    snapshot = {}
+    for user_id in range(1, users + 1):
+        snapshot[('get_user_books', user_id)] = db.get_user_books(user_id)
+        snapshot[('get_user_book_counts', user_id)] = db.get_user_book_counts(user_id)
+        for status in ('all', 'available', 'sold'):
+            snapshot[(f'get_user_books_page ({status})', user_id)] = db.get_user_books_page(
+                user_id, status, page_size=5)
+        snapshot[('get_user_orders (buyer)', user_id)] = db.get_user_orders(user_id, as_buyer=True)
+        snapshot[('get_user_orders (seller)', user_id)] = db.get_user_orders(user_id, as_buyer=False)
+        snapshot[('get_user_conversations', user_id)] = db.get_user_conversations(user_id)
+    for book_id in range(1, books + 1):
+        snapshot[('get_book_details', book_id)] = db.get_book_details(book_id)
+        snapshot[('get_seller_id_by_book', book_id)] = db.get_seller_id_by_book(book_id)
+    for conversation_id in range(1, conversations + 1):
+        snapshot[('get_conversation_info', conversation_id)] = db.get_conversation_info(conversation_id)
+    return snapshot
+
+
+def check_archive(args):
+    """Kontrola, že archivace nemění výsledky čtení a zmenší živé tabulky"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'knihomat_archive.db')
+    db = Database(db_path, instrument=False)
+    sizes = {'users': 50, 'books': args.books, 'conversations': args.books // 5,
+             'messages': args.books, 'orders': args.books // 2}
+    generate_dataset(db, seed=args.seed, **sizes)
+
+    def table_counts():
+        with db.connection() as conn:
+            counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ('books', 'orders', 'books_archive', 'orders_archive')}
+            # Velikost živých tabulek včetně indexů a fulltextu (dbstat nemusí být zkompilované)
+            try:
+                counts['hot KiB'] = conn.execute('''
+                    SELECT SUM(pgsize) / 1024 FROM dbstat WHERE name IN (
+                        SELECT name FROM sqlite_schema WHERE tbl_name IN ('books', 'orders')
+                           OR tbl_name LIKE 'books_fts%')
+                ''').fetchone()[0]
+            except sqlite3.Error:
+                pass
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        counts['file KiB'] = os.path.getsize(db_path) // 1024
+        return counts
+
+    before = archive_snapshot(db, sizes['users'], sizes['books'], sizes['conversations'])
+    counts_before = table_counts()
+
+    # Generovaná data končí v roce 2025 -> archivuje se vše, co podmínky splňuje
+    report = db.run_maintenance(older_than_days=args.days)
+    after = archive_snapshot(db, sizes['users'], sizes['books'], sizes['conversations'])
+    counts_after = table_counts()
+    db.close()
+
+    problems = [key for key in before if before[key] != after[key]]
+    for key in problems[:10]:
+        print(f"[CHYBA] {key[0]}({key[1]}): před {before[key]}, po {after[key]}")
+    print(f"Přesunuto: {report['archived']}, uvolněno stránek: {report['freed_pages']}")
+    for table in counts_before:
+        print(f"  {table:<16}{counts_before[table]:>8} -> {counts_after[table]}")
+    print(f"{len(before)} výsledků čtení, nesouhlasí {len(problems)}")
+    return 1 if problems or not report['archived']['books'] else 0
+
+
+def run_vacuum(args):
+    """Offline převod databáze na auto_vacuum a vrácení volného místa"""
+    if not os.path.exists(args.db):
+        print(f"[CHYBA] Databáze {args.db} neexistuje")
+        return 1
+    size_before = os.path.getsize(args.db) // 1024
+    db = Database(args.db)
+    converted = db.enable_auto_vacuum()
+    freed = db.incremental_vacuum()
+    with db.connection() as conn:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+    print(f"Převedeno: {'ano' if converted else 'ne'}, uvolněno stránek: {freed}, "
+          f"soubor {size_before} -> {os.path.getsize(args.db) // 1024} KiB")
+    return 0 if mode == 2 else 1
+
+
+def user_snapshot(db, user_id):
+    """Výsledky metod přihlášeného uživatele pro porovnání lokálně vs. přes server"""
+    snapshot = {
+        'get_user_conversations': db.get_user_conversations(user_id),
+        'get_unread_counts': db.get_unread_counts(user_id),
+        'get_user_orders (buyer)': db.get_user_orders(user_id, as_buyer=True),
+        'get_user_orders (seller)': db.get_user_orders(user_id, as_buyer=False),
+        'get_user_books': db.get_user_books(user_id),
+        'get_user_book_counts': db.get_user_book_counts(user_id),
+    }
+    for status in ('all', 'available', 'sold'):
+        snapshot[f'get_user_books_page ({status})'] = db.get_user_books_page(user_id, status, page_size=5)
+    for conversation in snapshot['get_user_conversations'][:3]:
+        snapshot[f'get_messages ({conversation.id})'] = db.get_messages(conversation.id)
+        snapshot[f'get_messages_page ({conversation.id})'] = db.get_messages_page(conversation.id, page_size=5)
+        snapshot[f'get_conversation_info ({conversation.id})'] = db.get_conversation_info(conversation.id)
+    return snapshot
+
+
+def check_server(args):
+    """Kontrola serveru: stejné výsledky jako lokální Database a kontrola relací"""
+    db = Database(os.path.join(tempfile.mkdtemp(), 'knihomat_server.db'))
+    generate_dataset(db, users=args.users, books=args.users * 20, conversations=args.users * 3,
+                     messages=args.users * 30, orders=args.users * 3, seed=args.seed)
+    server = DatabaseServer(db, port=0, maintenance_interval=0)
+    remote = RemoteDatabase(server.start_background())
+    problems = []
+
+    def expect(name, local, remote_result):
+        if local != remote_result:
+            problems.append(name)
+            print(f"[CHYBA] {name}: lokálně {local}, přes server {remote_result}")
+
+    def expect_error(name, error, call):
+        try:
+            call()
+        except error:
+            return
+        except Exception as e:
+            problems.append(name)
+            print(f"[CHYBA] {name}: místo {error.__name__} {type(e).__name__}: {str(e)}")
+            return
+        problems.append(name)
+        print(f"[CHYBA] {name}: očekávána chyba {error.__name__}")
+
+    try:
+        # Veřejné metody bez přihlášení
+        page, cursor = db.get_books_page()
+        expect('get_books_page', (page, cursor), remote.get_books_page())
+        expect('get_books_page (cursor)', db.get_books_page(cursor), remote.get_books_page(cursor))
+        expect('search_books_page', db.search_books_page('Kniha'), remote.search_books_page('Kniha'))
+        expect('get_book_details', db.get_book_details(1), remote.get_book_details(1))
+        token = db.get_change_token('books', 'users')
+        expect('get_change_token', token, remote.get_change_token('books', 'users'))
+        expect('has_changed', False, remote.has_changed(token, 'books', 'users'))
+        expect_error('bez přihlášení', PermissionError, lambda: remote.get_user_books(1))
+        expect('login_user (špatné heslo)', False, remote.login_user('user1@knihomat.cz', 'x')[0])
+
+        for user_id in range(1, args.users + 1):
+            success, user = remote.login_user(f'user{user_id}@knihomat.cz', PASSWORD)
+            expect(f'login_user ({user_id})', (True, user_id), (success, user['id'] if success else None))
+            local, over_server = user_snapshot(db, user_id), user_snapshot(remote, user_id)
+            for name in local:
+                expect(f'{name} [{user_id}]', local[name], over_server[name])
+            other_id = user_id % args.users + 1
+            expect_error(f'cizí uživatel [{user_id}]', PermissionError, lambda: remote.get_user_books(other_id))
+            remote.logout()
+
+        # Zápis přes server je vidět v lokální databázi
+        remote.login_user('user1@knihomat.cz', PASSWORD)
+        conversation = remote.get_user_conversations(1)[0]
+        cursor = remote.wait_messages()['cursor']
+        expect('send_message', True, remote.send_message(conversation.id, 1, 'Zpráva přes server'))
+        expect('send_message (uloženo)', 'Zpráva přes server', db.get_messages(conversation.id)[-1].message)
+        events = remote.wait_messages(cursor, 1)['events']
+        expect('wait_messages', [(conversation.id, 'Zpráva přes server')],
+               [(event.conversation_id, event.message.message) for event in events])
+        # Cizí konverzace a objednávky
+        with db.connection() as conn:
+            foreign_id = conn.execute(
+                "SELECT id FROM conversations WHERE buyer_id != 1 AND seller_id != 1 LIMIT 1").fetchone()[0]
+        expect_error('cizí konverzace', PermissionError, lambda: remote.get_messages_page(foreign_id))
+        expect_error('cizí konverzace (info)', PermissionError, lambda: remote.get_conversation_info(foreign_id))
+        expect_error('zpráva do cizí konverzace', PermissionError,
+                     lambda: remote.send_message(foreign_id, 1, 'Cizí zpráva'))
+        expect_error('neexistující konverzace', PermissionError, lambda: remote.get_messages(10 ** 9))
+        # Konverzace jen se skutečným prodávajícím knihy
+        with db.connection() as conn:
+            book_id, seller_id = conn.execute(
+                "SELECT id, seller_id FROM books WHERE seller_id NOT IN (1, 2) LIMIT 1").fetchone()
+            own_book_id = conn.execute("SELECT id FROM books WHERE seller_id = 1 LIMIT 1").fetchone()[0]
+        expect('create_or_get_conversation', db.create_or_get_conversation(book_id, 1, seller_id),
+               remote.create_or_get_conversation(book_id, 1, seller_id))
+        expect_error('konverzace s cizím prodávajícím', PermissionError,
+                     lambda: remote.create_or_get_conversation(book_id, 1, 2))
+        expect_error('konverzace sám se sebou', PermissionError,
+                     lambda: remote.create_or_get_conversation(own_book_id, 1, 1))
+        expect('konverzace s cizím prodávajícím (lokálně)', None, db.create_or_get_conversation(book_id, 1, 2))
+        expect('konverzace sám se sebou (lokálně)', None, db.create_or_get_conversation(own_book_id, 1, 1))
+        bought = remote.get_user_orders(1, as_buyer=True)
+        if bought:
+            expect_error('objednávka kupujícího', PermissionError,
+                         lambda: remote.update_order_status(bought[0].id, 'completed'))
+        sold = remote.get_user_orders(1, as_buyer=False)
+        if sold:
+            expect('objednávka prodávajícího', True, remote.update_order_status(sold[0].id, sold[0].status))
+        expect_error('neplatný filtr', ValueError, lambda: remote.get_user_books_page(1, 'neznámý'))
+        expect_error('neplatné argumenty', TypeError, lambda: remote.get_user_books(1, 2, 3))
+        remote.logout()
+        expect_error('po odhlášení', PermissionError, lambda: remote.get_user_conversations(1))
+    finally:
+        remote.close()
+        server.stop_background()
+        db.close()
+
+    print(f"{server.requests} požadavků, nesouhlasí {len(problems)}")
+    return 1 if problems else 0
+
+
+def check_outbox(args):
+    """Kontrola outboxu: výpadek serveru, opakování dávek a idempotence zápisů"""
+    work_dir = tempfile.mkdtemp()
+    db = Database(os.path.join(work_dir, 'knihomat_outbox_check.db'))
+    generate_dataset(db, users=5, books=100, conversations=10, messages=50, seed=args.seed)
+    server = DatabaseServer(db, port=0, maintenance_interval=0)
+    remote = RemoteDatabase(server.start_background())
+    outbox_path = os.path.join(work_dir, 'outbox.db')
+    results = {}
+    problems = []
+
+    def open_outbox():
+        # Odesílání řídí kontrola sama přes flush()
+        outbox = Outbox(remote, outbox_path, background=False)
+        outbox.add_listener(lambda entry, result: results.__setitem__(entry.key, result))
+        return outbox
+
+    def expect(name, expected, actual):
+        if expected != actual:
+            problems.append(name)
+            print(f"[CHYBA] {name}: očekáváno {expected}, výsledek {actual}")
+
+    def count_messages():
+        with db.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    try:
+        remote.login_user('user1@knihomat.cz', PASSWORD)
+        conversation = remote.get_user_conversations(1)[0]
+        own_book = remote.get_user_books(1)[0]
+        foreign_book = next(book for book in db.get_all_books() if book.id not in
+                            {book.id for book in remote.get_user_books(1)})
+        with db.connection() as conn:
+            foreign_conversation_id = conn.execute(
+                "SELECT id FROM conversations WHERE buyer_id != 1 AND seller_id != 1 LIMIT 1").fetchone()[0]
+        messages_before = count_messages()
+
+        # Výpadek serveru: zápisy čekají v outboxu
+        server.stop_background()
+        server = None
+        outbox = open_outbox()
+        entries = [outbox.send_message(conversation.id, 1, f"Offline zpráva {i}") for i in range(args.messages)]
+        entries.append(outbox.update_book_status(own_book.id, 1, True))
+        foreign_status = outbox.update_book_status(foreign_book.id, 1, True)
+        foreign_message = outbox.send_message(foreign_conversation_id, 1, "Zpráva do cizí konverzace")
+        missing_message = outbox.send_message(10 ** 9, 1, "Zpráva do neexistující konverzace")
+        new_book = outbox.add_book('Kniha z outboxu', 'Karel Čapek', 120.0, 'Dobrý', 'Offline', 1)
+        entries.extend([foreign_status, foreign_message, missing_message, new_book])
+        expect('flush bez serveru', False, outbox.flush())
+        expect('čekající zápisy', len(entries), len(outbox.pending(1)))
+        expect('pokusy', {1}, {entry.attempts for entry in outbox.pending(1)})
+
+        # Zápisy přežijí zavření a znovuotevření outboxu
+        outbox.close()
+        outbox = open_outbox()
+        expect('po znovuotevření', [entry.key for entry in entries], [entry.key for entry in outbox.pending()])
+
+        # Část dávky se zapsala, ale potvrzení se ke klientovi nedostalo
+        first = entries[:3]
+        lost = db.apply_writes(1, [(entry.key, entry.method, entry.args) for entry in first])
+
+        # Server znovu běží (nová relace), outbox dávku zopakuje
+        server = DatabaseServer(db, port=urlsplit(remote.url).port, maintenance_interval=0)
+        server.start_background()
+        remote.login_user('user1@knihomat.cz', PASSWORD)
+        expect('flush po obnovení', True, outbox.flush())
+        expect('outbox prázdný', [], outbox.pending())
+        expect('zprávy zapsané jednou', messages_before + args.messages, count_messages())
+        expect('stejná id po opakování', [lost[entry.key] for entry in first], [results[entry.key] for entry in first])
+        expect('stav vlastní knihy', True, db.get_book_details(own_book.id).is_sold)
+        expect('cizí kniha odmítnuta', (False, "Nemůžete upravit cizí knihu!"), results[foreign_status.key])
+        expect('cizí konverzace odmítnuta', (False, "Nejste účastníkem této konverzace!"),
+               results[foreign_message.key])
+        expect('neexistující konverzace odmítnuta', (False, "Konverzace neexistuje!"), results[missing_message.key])
+        success, book_id = results[new_book.key]
+        expect('nová kniha', 'Kniha z outboxu', db.get_book_details(book_id).title if success else None)
+
+        # Opakovaná dávka přes server vrátí původní výsledky
+        batch = [(entry.key, entry.method, entry.args) for entry in entries]
+        expect('opakovaná dávka', {entry.key: results[entry.key] for entry in entries}, remote.apply_writes(1, batch))
+        expect('zprávy po opakování', messages_before + args.messages, count_messages())
+        try:
+            remote.apply_writes(2, batch)
+            problems.append('cizí dávka')
+            print("[CHYBA] cizí dávka: očekávána chyba PermissionError")
+        except PermissionError:
+            pass
+        outbox.close()
+    finally:
+        remote.close()
+        if server is not None:
+            server.stop_background()
+        db.close()
+
+    print(f"{len(results)} zápisů přes outbox, nesouhlasí {len(problems)}")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kontrolní nástroje databáze Knihomatu')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plans_parser = subparsers.add_parser('plans', help='EXPLAIN QUERY PLAN všech dotazů')
+    plans_parser.add_argument('-v', '--verbose', action='store_true', help='vypsat i plány bez chyb')
+    plans_parser.set_defaults(func=check_plans)
+
+    migrations_parser = subparsers.add_parser('migrations', help='upgrade databází ze starších verzí schématu')
+    migrations_parser.set_defaults(func=check_migrations)
+
+    stats_parser = subparsers.add_parser('stats', help='latence, řádky a pomalé dotazy metod Database')
+    stats_parser.add_argument('--db', help='existující databáze (výchozí: dočasná s ukázkovými daty)')
+    stats_parser.add_argument('--repeat', type=int, default=20)
+    stats_parser.add_argument('--slow-ms', type=float, default=5.0, help='limit pro log pomalých dotazů')
+    stats_parser.add_argument('--json', help='uložit statistiky do JSON souboru')
+    stats_parser.set_defaults(func=show_stats)
+
+    summaries_parser = subparsers.add_parser('summaries', help='souhrny konverzací vs. přepočet ze zpráv')
+    summaries_parser.add_argument('--operations', type=int, default=2000)
+    summaries_parser.add_argument('--seed', type=int, default=42)
+    summaries_parser.set_defaults(func=check_summaries)
+
+    archive_parser = subparsers.add_parser('archive', help='archivace starých dat a transparentní čtení')
+    archive_parser.add_argument('--books', type=int, default=2000)
+    archive_parser.add_argument('--days', type=int, default=180, help='archivovat data starší než dní')
+    archive_parser.add_argument('--seed', type=int, default=42)
+    archive_parser.set_defaults(func=check_archive)
+
+    vacuum_parser = subparsers.add_parser('vacuum', help='offline převod na auto_vacuum (plný VACUUM)')
+    vacuum_parser.add_argument('--db', required=True, help='databáze aplikace (nesmí být otevřená)')
+    vacuum_parser.set_defaults(func=run_vacuum)
+
+    server_parser = subparsers.add_parser('server', help='výsledky přes HTTP server vs. lokální Database')
+    server_parser.add_argument('--users', type=int, default=10)
+    server_parser.add_argument('--seed', type=int, default=42)
+    server_parser.set_defaults(func=check_server)
+
+    outbox_parser = subparsers.add_parser('outbox', help='outbox: výpadek serveru, opakování a idempotence')
+    outbox_parser.add_argument('--messages', type=int, default=20)
+    outbox_parser.add_argument('--seed', type=int, default=42)
+    outbox_parser.set_defaults(func=check_outbox)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
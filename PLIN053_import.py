@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Hromadný import knih do katalogu Knihomatu.
+
+Vstupem je CSV (se záhlavím) nebo JSON Lines se sloupci title, author,
+price, condition, description a seller_id. Spuštění např.:
+    python PLIN053_import.py knihy.csv --seller-id 1 --errors chyby.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Kivy jinak zpracovává argumenty příkazové řádky sám
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from PLIN053_database import Database, parse_price
+
+DEFAULT_CONDITION = 'Velmi dobrý'
+
+
+def read_rows(path, file_format):
+    """Postupné čtení řádků souboru jako (číslo řádku, slovník)"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, {'_error': f"Neplatný JSON: {e.msg}"}
+
+
+def read_chunks(rows, chunk_size):
+    """Rozdělení proudu řádků na dávky"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalize_row(row, default_seller_id=None):
+    """Validace a normalizace jednoho řádku, vrací n-tici pro vložení"""
+    if not isinstance(row, dict):
+        raise ValueError("Řádek není objekt")
+    if '_error' in row:
+        raise ValueError(row['_error'])
+
+    title = str(row.get('title') or '').strip()
+    author = str(row.get('author') or '').strip()
+    price = row.get('price')
+    price_text = '' if price is None else str(price).strip()
+    condition = str(row.get('condition') or '').strip() or DEFAULT_CONDITION
+    description = str(row.get('description') or '').strip()
+
+    if not title or not author or not price_text:
+        raise ValueError("Chybí název, autor nebo cena")
+
+    try:
+        price = parse_price(price_text)
+    except ValueError:
+        raise ValueError(f"Neplatná cena: {price_text}")
+
+    seller = row.get('seller_id') or default_seller_id
+    try:
+        seller_id = int(seller)
+    except (TypeError, ValueError):
+        raise ValueError(f"Neplatné seller_id: {seller}")
+
+    return (title, author, price, condition, description, seller_id)
+
+
+def normalize_chunk(chunk, default_seller_id=None):
+    """Normalizace dávky řádků (běží v pracovním procesu)"""
+    rows = []
+    errors = []
+    for line_number, row in chunk:
+        try:
+            rows.append((line_number, normalize_row(row, default_seller_id)))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+    return rows, errors
+
+
+def normalize_parallel(chunks, default_seller_id, workers):
+    """Normalizace dávek v poolu procesů se zachováním pořadí.
+
+    Najednou se zpracovává jen omezený počet dávek, aby se celý soubor
+    nenačetl do paměti.
+    """
+    if workers <= 0:
+        for chunk in chunks:
+            yield normalize_chunk(chunk, default_seller_id)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(normalize_chunk, chunk, default_seller_id))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_books(db, path, file_format=None, default_seller_id=None, batch_size=5000,
+                 workers=None, progress=None):
+    """Import knih ze souboru, vrací (počet vložených, seznam chyb).
+
+    Celý soubor se načte a zkontroluje dřív, než bulk_add_books zamkne
+    databázi pro zápis - aplikace mezitím normálně zapisuje.
+    """
+    if file_format is None:
+        file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with db.connection() as conn:
+        seller_ids = {row[0] for row in conn.execute("SELECT id FROM users")}
+
+    errors = []
+    processed = [0]
+
+    def batches():
+        chunks = read_chunks(read_rows(path, file_format), batch_size)
+        for rows, chunk_errors in normalize_parallel(chunks, default_seller_id, workers):
+            processed[0] += len(rows) + len(chunk_errors)
+            errors.extend(chunk_errors)
+
+            valid = []
+            for line_number, row in rows:
+                if row[5] in seller_ids:
+                    valid.append(row)
+                else:
+                    errors.append((line_number, f"Neexistující prodávající: {row[5]}"))
+            yield valid
+
+    def report(inserted):
+        if progress:
+            progress(processed[0], inserted, len(errors))
+
+    inserted = db.bulk_add_books(batches(), progress=report)
+    return inserted, errors
+
+
+def write_errors(path, errors):
+    """Uložení chyb jednotlivých řádků do CSV"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['line', 'error'])
+        writer.writerows(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hromadný import knih do Knihomatu')
+    parser.add_argument('path', help='soubor CSV nebo JSON Lines')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='formát (výchozí podle přípony)')
+    parser.add_argument('--seller-id', type=int, help='prodávající pro řádky bez seller_id')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, help='počet procesů pro zpracování (0 = bez poolu)')
+    parser.add_argument('--errors', help='soubor CSV pro chyby jednotlivých řádků')
+    parser.add_argument('--db', help='cesta k databázi (výchozí podle platformy)')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    start = time.perf_counter()
+
+    def progress(processed, inserted, error_count):
+        print(f"\rZpracováno {processed}, vloženo {inserted}, chyb {error_count}", end='', flush=True)
+
+    try:
+        inserted, errors = import_books(
+            db, args.path, args.format, args.seller_id, args.batch_size, args.workers, progress)
+    except Exception as e:
+        print(f"\nImport selhal, nic nebylo uloženo: {str(e)}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+    print(f"\nImportováno {inserted} knih za {time.perf_counter() - start:.1f} s, chyb: {len(errors)}")
+    if errors:
+        if args.errors:
+            write_errors(args.errors, errors)
+            print(f"Chyby uloženy do {args.errors}")
+        else:
+            for line_number, message in errors[:20]:
+                print(f"  řádek {line_number}: {message}")
+            if len(errors) > 20:
+                print(f"  ... a dalších {len(errors) - 20}")
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Simulace zátěže: více procesů se chová jako uživatelé nad sdílenou databází.
+
+Každý proces má vlastní Database a opakovaně vybírá operace (prohlížení,
+vyhledávání, chat, nákup, ...) podle zadaného poměru. Spuštění např.:
+    python PLIN053_loadsim.py --processes 1,2,4,8 --duration 20
+    python PLIN053_loadsim.py --db knihomat.db --mix browse=50,buy=50 --think-ms 0
+    python PLIN053_loadsim.py --server --processes 1,4,16 --think-ms 0
+
+S --server běží nad databází jeden PLIN053_server a procesy jsou jeho
+klienti (RemoteDatabase přihlášená jako userN z PLIN053_dataset).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import redirect_stdout
+from datetime import datetime
+
+# Kivy jinak zpracovává argumenty příkazové řádky sám
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from PLIN053_database import Database, is_busy_error
+from PLIN053_dataset import AUTHORS, MESSAGES, PASSWORD, SCALES, TITLE_WORDS
+from PLIN053_benchmark import percentile, prepare_dataset
+from PLIN053_remote_database import RemoteDatabase
+
+# Výchozí poměr operací (váhy)
+DEFAULT_MIX = 'browse=35,search=20,chat=20,contact=10,buy=5,orders=5,sell=5'
+
+
+class UserSession:
+    """Jeden simulovaný uživatel a jeho operace nad Database.
+
+    Každá operace vrací výsledek 'ok', 'error' nebo u nákupu 'sold'
+    (knihu mezitím koupil někdo jiný) a 'skip' (nebylo co koupit).
+    Zamčenou databázi ('busy') pozná load_worker ze statistik Database.
+    """
+
+    def __init__(self, db, user_id, rnd):
+        self.db = db
+        self.user_id = user_id
+        self.rnd = rnd
+        self.seen_books = []
+        self.last_message_ids = {}
+
+    def remember(self, books):
+        self.seen_books = [book.id for book in books] or self.seen_books
+
+    def browse(self):
+        books, cursor = self.db.get_books_page()
+        # Část uživatelů posune seznam o stránku nebo dvě
+        for _ in range(self.rnd.choice([0, 0, 1, 2])):
+            if not cursor:
+                break
+            books, cursor = self.db.get_books_page(cursor)
+        self.remember(books)
+        if books:
+            self.db.get_book_details(self.rnd.choice(books).id)
+        return 'ok'
+
+    def search(self):
+        query = self.rnd.choice(TITLE_WORDS + AUTHORS).split()[-1]
+        books, cursor = self.db.search_books_page(query)
+        self.remember(books)
+        return 'ok'
+
+    def chat(self):
+        conversations = self.db.get_user_conversations(self.user_id)
+        if not conversations:
+            return self.contact()
+        conversation_id = self.rnd.choice(conversations).id
+        last_id = self.last_message_ids.get(conversation_id)
+        if last_id is None:
+            messages, _ = self.db.get_messages_page(conversation_id)
+        else:
+            messages = self.db.get_messages_since(conversation_id, last_id)
+        if messages:
+            self.last_message_ids[conversation_id] = messages[-1].id
+        if not self.db.send_message(conversation_id, self.user_id, self.rnd.choice(MESSAGES)):
+            return 'error'
+        return 'ok'
+
+    def contact(self):
+        if not self.seen_books:
+            return self.browse()
+        book_id = self.rnd.choice(self.seen_books)
+        seller_id = self.db.get_seller_id_by_book(book_id)
+        if seller_id is None or seller_id == self.user_id:
+            return 'ok'
+        conversation_id = self.db.create_or_get_conversation(book_id, self.user_id, seller_id)
+        if conversation_id is None:
+            return 'error'
+        self.db.get_conversation_info(conversation_id)
+        if not self.db.send_message(conversation_id, self.user_id, MESSAGES[0]):
+            return 'error'
+        return 'ok'
+
+    def buy(self):
+        if not self.seen_books:
+            self.browse()
+        if not self.seen_books:
+            return 'skip'
+        book_id = self.rnd.choice(self.seen_books)
+        self.seen_books.remove(book_id)
+        details = self.db.get_book_details(book_id)
+        if not details or details.seller_id == self.user_id:
+            # Vlastní nebo smazaná kniha
+            return 'skip'
+        success, message = self.db.create_order(book_id, self.user_id, 'Husova 12, Brno', '+420 777 123 456')
+        if success:
+            return 'ok'
+        # Neúspěch u knihy, která teď je prodaná = předběhl nás jiný kupující
+        details = self.db.get_book_details(book_id)
+        return 'sold' if details and details.is_sold else 'error'
+
+    def orders(self):
+        self.db.get_user_orders(self.user_id, as_buyer=self.rnd.random() < 0.7)
+        return 'ok'
+
+    def sell(self):
+        title = ' '.join(self.rnd.sample(TITLE_WORDS, 2))
+        success, message = self.db.add_book(title, self.rnd.choice(AUTHORS), self.rnd.randint(3, 180) * 5,
+                                            'Dobrý', 'Přidáno simulací zátěže', self.user_id)
+        return 'ok' if success else 'error'
+
+
+def parse_mix(text):
+    """Převod 'browse=35,buy=5' na slovník vah operací"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(UserSession, name) or name.startswith('_') or name == 'remember':
+            raise ValueError(f"Neznámá operace: {name}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("Alespoň jedna operace musí mít kladnou váhu")
+    return mix
+
+
+def load_worker(db_path, worker_id, users, mix, think_ms, duration, seed, start_event, server_url=None):
+    """Jeden proces simulující uživatele, vrací statistiky operací"""
+    rnd = random.Random(seed * 1000 + worker_id)
+    user_id = worker_id % users + 1
+    if server_url:
+        db = RemoteDatabase(server_url)
+        success, message = db.login_user(f'user{user_id}@knihomat.cz', PASSWORD)
+        if not success:
+            raise RuntimeError(f"Přihlášení user{user_id} k serveru selhalo: {message}")
+    else:
+        db = Database(db_path)
+    session = UserSession(db, user_id, rnd)
+    names, weights = list(mix), list(mix.values())
+    stats = {name: {'latencies': [], 'ok': 0, 'busy': 0, 'error': 0, 'sold': 0, 'skip': 0} for name in names}
+    # Chyby, které Database zachytí a jen vypíše, počítá QueryStats.
+    # U serveru je vidí jen server (viz stop_server).
+    query_stats = None if server_url else db.stats
+
+    start_event.wait()
+    deadline = time.perf_counter() + duration
+    # Výpisy chyb z Database by zahltily výstup simulace
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        while time.perf_counter() < deadline:
+            name = rnd.choices(names, weights)[0]
+            errors, busy = query_stats.error_counts() if query_stats else (0, 0)
+            start = time.perf_counter()
+            try:
+                outcome = getattr(session, name)()
+            except Exception as e:
+                outcome = 'busy' if is_busy_error(e) else 'error'
+            latency = time.perf_counter() - start
+
+            # Chyba uvnitř Database přebíjí výsledek operace
+            if query_stats:
+                errors_after, busy_after = query_stats.error_counts()
+                if busy_after > busy:
+                    outcome = 'busy'
+                elif errors_after > errors and outcome in ('ok', 'sold'):
+                    outcome = 'error'
+            stats[name]['latencies'].append(latency)
+            stats[name][outcome] += 1
+
+            if think_ms:
+                time.sleep(rnd.expovariate(1000.0 / think_ms))
+
+    # Čekání na zámek u serveru měří server sám (viz start_server)
+    lock_wait_ms = 0.0 if server_url else sum(
+        method['lock_wait_ms'] for method in db.get_query_stats().values())
+    db.close()
+    return {'operations': stats, 'lock_wait_ms': lock_wait_ms}
+
+
+def start_server(db_path, connections, stats_path):
+    """Spuštění PLIN053_server nad databází v samostatném procesu, vrací (proces, URL)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PLIN053_server.py'),
+         db_path, '--port', str(port), '--connections', str(connections), '--maintenance-interval', '0',
+         '--stats', stats_path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env={**os.environ, 'KIVY_NO_CONSOLELOG': '1'})
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.perf_counter() + 30
+    while True:
+        try:
+            with urllib.request.urlopen(f'{url}/health', timeout=1):
+                return server, url
+        except OSError:
+            if server.poll() is not None or time.perf_counter() > deadline:
+                server.kill()
+                raise RuntimeError("Server se nepodařilo spustit")
+            time.sleep(0.1)
+
+
+def stop_server(server, stats_path):
+    """Ukončení serveru, vrací (čekání na zámek v ms, volání se zamčenou databází) z jeho statistik"""
+    server.terminate()
+    server.wait(timeout=30)
+    try:
+        with open(stats_path, encoding='utf-8') as f:
+            methods = json.load(f)['methods']
+    except (OSError, ValueError, KeyError):
+        return 0.0, 0
+    return (sum(method['lock_wait_ms'] for method in methods.values()),
+            sum(method.get('busy', 0) for method in methods.values()))
+
+
+def run_level(template_path, processes, args, mix, users):
+    """Jeden běh simulace s daným počtem procesů nad čerstvou kopií dat"""
+    work_path = os.path.join(tempfile.mkdtemp(), 'knihomat_load.db')
+    # Záloha přes SQLite (zahrne i obsah WAL souboru běžící aplikace)
+    source, target = sqlite3.connect(template_path), sqlite3.connect(work_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    server, server_url = None, None
+    if args.server:
+        stats_path = os.path.join(os.path.dirname(work_path), 'server_stats.json')
+        server, server_url = start_server(work_path, args.connections, stats_path)
+
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Manager() as manager:
+        start_event = manager.Event()
+        with ctx.Pool(processes) as pool:
+            results = [pool.apply_async(load_worker, (work_path, worker_id, users, mix, args.think_ms,
+                                                      args.duration, args.seed, start_event, server_url))
+                       for worker_id in range(processes)]
+            time.sleep(1.0)  # Všechny procesy se stihnou připravit
+            start = time.perf_counter()
+            start_event.set()
+            workers = [result.get() for result in results]
+            elapsed = time.perf_counter() - start
+
+    server_lock_wait_ms, server_busy = stop_server(server, stats_path) if server else (0.0, 0)
+    shutil.rmtree(os.path.dirname(work_path), ignore_errors=True)
+
+    operations = {}
+    for name in mix:
+        merged = [worker['operations'][name] for worker in workers]
+        latencies = sorted(latency * 1000 for op in merged for latency in op['latencies'])
+        operations[name] = {
+            'count': len(latencies),
+            'per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            **{outcome: sum(op[outcome] for op in merged) for outcome in ('ok', 'busy', 'error', 'sold', 'skip')},
+        }
+
+    total = sum(op['count'] for op in operations.values())
+    all_latencies = sorted(latency * 1000 for worker in workers for op in worker['operations'].values()
+                           for latency in op['latencies'])
+    # U serveru se zamčená databáze projeví klientům jen jako neúspěch operace
+    busy = sum(op['busy'] for op in operations.values()) + server_busy
+    buy = operations.get('buy', {})
+    return {
+        'processes': processes,
+        'elapsed_s': round(elapsed, 2),
+        'operations_total': total,
+        'throughput': round(total / elapsed, 1),
+        'p50_ms': round(percentile(all_latencies, 0.50), 3),
+        'p95_ms': round(percentile(all_latencies, 0.95), 3),
+        'p99_ms': round(percentile(all_latencies, 0.99), 3),
+        'busy': busy,
+        'busy_rate': round(busy / total, 4) if total else 0.0,
+        'errors': sum(op['error'] for op in operations.values()),
+        'checkouts': {outcome: buy.get(outcome, 0) for outcome in ('ok', 'sold', 'busy', 'error', 'skip')},
+        'lock_wait_ms': round(server_lock_wait_ms + sum(worker['lock_wait_ms'] for worker in workers), 1),
+        'operations': operations,
+    }
+
+
+def print_level(level):
+    print(f"\n{level['processes']} procesů: {level['operations_total']} operací za {level['elapsed_s']} s")
+    print(f"{'operace':<10}{'počet':>8}{'/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'busy':>7}{'chyby':>7}{'prodáno':>9}")
+    for name, op in level['operations'].items():
+        print(f"{name:<10}{op['count']:>8}{op['per_second']:>9.1f}{op['p50_ms']:>9.2f}{op['p95_ms']:>9.2f}"
+              f"{op['p99_ms']:>9.2f}{op['busy']:>7}{op['error']:>7}{op['sold']:>9}")
+    checkouts = level['checkouts']
+    print(f"Nákupy: úspěšné {checkouts['ok']}, již prodáno {checkouts['sold']}, "
+          f"zamčeno {checkouts['busy']}, chyby {checkouts['error']}, přeskočeno {checkouts['skip']}; "
+          f"čekání na zámek celkem {level['lock_wait_ms']:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulace více uživatelů nad sdílenou databází Knihomatu')
+    parser.add_argument('--db', help='existující databáze (kopíruje se, originál zůstane beze změny)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='velikost vygenerovaných dat')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'knihomat_datasets'))
+    parser.add_argument('--processes', default='1,2,4,8', help='počty procesů oddělené čárkou')
+    parser.add_argument('--duration', type=float, default=10.0, help='délka každého běhu v sekundách')
+    parser.add_argument('--think-ms', type=float, default=20.0, help='průměrná pauza mezi operacemi (0 = bez pauz)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'váhy operací (výchozí {DEFAULT_MIX})')
+    parser.add_argument('--server', action='store_true', help='procesy jsou klienti HTTP serveru nad databází')
+    parser.add_argument('--connections', type=int, default=4, help='velikost poolu spojení serveru')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='uložit výsledky do JSON souboru')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+        levels = [int(count) for count in args.processes.split(',')]
+    except ValueError as e:
+        print(f"Chyba: {str(e)}")
+        return 2
+
+    template_path = args.db or prepare_dataset(args.scale, args.seed, args.data_dir)
+    db = Database(template_path, instrument=False)
+    with db.connection() as conn:
+        users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    db.close()
+    if not users:
+        print("Databáze neobsahuje žádné uživatele!")
+        return 2
+
+    results = []
+    for processes in levels:
+        level = run_level(template_path, processes, args, mix, users)
+        print_level(level)
+        results.append(level)
+
+    # Souhrn pro hledání stropu souběžnosti
+    print(f"\n{'procesů':>8}{'operací/s':>11}{'p95 ms':>9}{'p99 ms':>9}{'busy %':>8}{'neúspěšné nákupy':>18}")
+    for level in results:
+        failed = level['checkouts']['busy'] + level['checkouts']['error']
+        print(f"{level['processes']:>8}{level['throughput']:>11.1f}{level['p95_ms']:>9.2f}{level['p99_ms']:>9.2f}"
+              f"{level['busy_rate'] * 100:>8.2f}{failed:>18}")
+
+    if args.json:
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'db': args.db or f'{args.scale} (seed {args.seed})',
+            'duration_s': args.duration,
+            'think_ms': args.think_ms,
+            'server': {'connections': args.connections} if args.server else None,
+            'mix': mix,
+            'levels': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nVýsledky uloženy do {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,10 +5,11 @@ from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.gridlayout import GridLayout
 
-from PLIN053_utils import show_popup, set_current_user, get_database
+from PLIN053_utils import show_popup, set_current_user, get_database, get_async_database
 
 # Instance databáze
 db = get_database()
+async_db = get_async_database()
 
 class LoginScreen(Screen):
     """Obrazovka pro přihlášení"""
@@ -58,8 +59,11 @@ class LoginScreen(Screen):
             show_popup("Chyba", "Vyplňte všechna pole!")
             return
 
-        success, result = db.login_user(email, password)
+        async_db.login_user(email, password, callback=self.login_done, tag='login')
 
+    def login_done(self, login_result):
+        """Výsledek přihlášení"""
+        success, result = login_result
         if success:
             set_current_user(result)
             show_popup("Úspěch", f"Vítejte, {result['name']}!")
@@ -130,8 +134,11 @@ class RegisterScreen(Screen):
             show_popup("Chyba", "Heslo musí mít alespoň 6 znaků!")
             return
 
-        success, message = db.register_user(name, email, password)
+        async_db.register_user(name, email, password, callback=self.register_done, tag='register')
 
+    def register_done(self, result):
+        """Výsledek registrace"""
+        success, message = result
         if success:
             show_popup("Úspěch", message)
             self.manager.current = 'login'
@@ -4,11 +4,15 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.popup import Popup
+from kivy.clock import Clock
 
-from PLIN053_utils import show_popup, get_current_user, get_database
+from PLIN053_records import MY_BOOKS_FIELDS, Book
+from PLIN053_utils import show_popup, get_current_user, get_database, get_async_database, get_outbox
 
 # Instance databáze
 db = get_database()
+async_db = get_async_database()
+outbox = get_outbox()
 
 
 class MyBooksScreen(Screen):
@@ -50,8 +54,9 @@ class MyBooksScreen(Screen):
         filter_layout.add_widget(self.available_btn)
         filter_layout.add_widget(self.sold_btn)
 
-        # Seznam knih
+        # Seznam knih - další stránky se načítají při posunu dolů
         scroll = ScrollView(size_hint_y=0.82)
+        scroll.bind(scroll_y=self.on_scroll)
         self.books_layout = BoxLayout(orientation='vertical', spacing=10, size_hint_y=None)
         self.books_layout.bind(minimum_height=self.books_layout.setter('height'))
 
@@ -64,9 +69,31 @@ class MyBooksScreen(Screen):
         self.add_widget(layout)
 
         self.current_filter = 'all'  # Výchozí filtr
+        self.next_cursor = None  # Kurzor další stránky aktuálního filtru
+        self.books_token = None  # Stav dat při posledním načtení
+        self.counts = None  # Počty knih podle filtrů (bez zápisů v outboxu)
+
+        # Nové knihy a změny stavu se zapisují přes outbox
+        outbox.add_listener(self.on_outbox_result)
 
     def on_enter(self):
         """Načtení knih při vstupu na obrazovku"""
+        current_user = get_current_user()
+        if not current_user:
+            return
+
+        user_id = current_user['id']
+        async_db.get_change_token('books', callback=lambda token: self.check_books(user_id, token),
+                                  error_callback=lambda e: self.check_books(user_id, None),
+                                  tag='my_books_token')
+
+    def check_books(self, user_id, token):
+        """Pokud se knihy ani čekající zápisy od posledního načtení nezměnily, seznam zůstává"""
+        pending = tuple(entry.key for entry in outbox.pending(user_id))
+        token = (user_id, token, pending)
+        if token[1] is not None and token == self.books_token:
+            return
+        self.books_token = token
         self.load_books()
 
     def show_all_books(self, instance):
@@ -75,7 +102,7 @@ class MyBooksScreen(Screen):
         self.all_btn.background_color = (0.2, 0.6, 1, 1)
         self.available_btn.background_color = (1, 1, 1, 1)
         self.sold_btn.background_color = (1, 1, 1, 1)
-        self.load_books()
+        self.load_page()
 
     def show_available_books(self, instance):
         """Zobrazení knih k prodeji"""
@@ -83,7 +110,7 @@ class MyBooksScreen(Screen):
         self.available_btn.background_color = (0.2, 0.6, 1, 1)
         self.all_btn.background_color = (1, 1, 1, 1)
         self.sold_btn.background_color = (1, 1, 1, 1)
-        self.load_books()
+        self.load_page()
 
     def show_sold_books(self, instance):
         """Zobrazení prodaných knih"""
@@ -91,26 +118,69 @@ class MyBooksScreen(Screen):
         self.sold_btn.background_color = (0.2, 0.6, 1, 1)
         self.all_btn.background_color = (1, 1, 1, 1)
         self.available_btn.background_color = (1, 1, 1, 1)
-        self.load_books()
+        self.load_page()
 
     def load_books(self):
-        """Načtení knih podle filtru"""
+        """Načtení počtů knih pro filtry a první stránky aktuálního filtru"""
         current_user = get_current_user()
         if not current_user:
             return
 
+        async_db.get_user_book_counts(current_user['id'], callback=self.show_counts, tag='my_books_counts')
+        self.load_page()
+
+    def show_counts(self, counts):
+        """Zobrazení počtů knih na tlačítkách filtrů (včetně knih z outboxu)"""
+        self.counts = dict(counts)
+        current_user = get_current_user()
+        if current_user:
+            new_books = len(outbox.pending(current_user['id'], 'add_book'))
+            self.counts['all'] += new_books
+            self.counts['available'] += new_books
+        self.update_count_buttons()
+
+    def update_count_buttons(self):
+        self.all_btn.text = f"Všechny ({self.counts['all']})"
+        self.available_btn.text = f"K prodeji ({self.counts['available']})"
+        self.sold_btn.text = f"Prodané ({self.counts['sold']})"
+
+    def load_page(self, cursor=None):
+        """Načtení stránky knih aktuálního filtru (filtruje databáze)"""
+        current_user = get_current_user()
+        if not current_user:
+            return
+
+        # Změna filtru zruší starší nedokončené načítání
+        # Seznam nezobrazuje popis ani datum -> záznamy jen s potřebnými sloupci
+        self.next_cursor = None
+        async_db.get_user_books_page(
+            current_user['id'], self.current_filter, cursor, fields=MY_BOOKS_FIELDS,
+            callback=self.show_next_page if cursor else self.show_books, tag='my_books')
+
+    def on_scroll(self, scroll, scroll_y):
+        """Při posunu na konec seznamu se načte další stránka"""
+        if scroll_y <= 0 and self.next_cursor:
+            self.load_page(self.next_cursor)
+
+    def show_next_page(self, result):
+        """Připojení další stránky na konec seznamu"""
+        books, self.next_cursor = result
+        self.add_book_widgets(books)
+
+    def show_books(self, result):
+        """Zobrazení první stránky knih podle filtru"""
+        books, self.next_cursor = result
         self.books_layout.clear_widgets()
-        all_books = db.get_user_books(current_user['id'])
 
-        # Filtrování knih
-        if self.current_filter == 'available':
-            books = [book for book in all_books if not book[6]]  # is_sold je na indexu 6
-        elif self.current_filter == 'sold':
-            books = [book for book in all_books if book[6]]
-        else:  
-            books = all_books
+        # Nové knihy z outboxu jsou nejnovější -> na začátek seznamu
+        current_user = get_current_user()
+        if current_user and self.current_filter != 'sold':
+            for entry in reversed(outbox.pending(current_user['id'], 'add_book')):
+                book = Book(None, entry.args['title'], entry.args['author'], entry.args['price'],
+                            entry.args['condition'], is_sold=False)
+                self.books_layout.add_widget(self.create_book_widget(book, pending=True))
 
-        if not books:
+        if not books and not self.books_layout.children:
             filter_text = {
                 'all': 'žádné knihy',
                 'available': 'žádné knihy k prodeji',
@@ -120,13 +190,26 @@ class MyBooksScreen(Screen):
             self.books_layout.add_widget(no_books)
             return
 
+        self.add_book_widgets(books)
+
+    def add_book_widgets(self, books):
+        """Připojení knih na konec seznamu se stavem podle čekajících změn v outboxu"""
+        current_user = get_current_user()
+        pending_status = {}
+        if current_user:
+            for entry in outbox.pending(current_user['id'], 'update_book_status'):
+                pending_status[entry.args['book_id']] = entry.args['is_sold']
+
         for book in books:
-            book_widget = self.create_book_widget(book)
-            self.books_layout.add_widget(book_widget)
+            pending = book.id in pending_status
+            if pending:
+                book = Book(*book)
+                book.is_sold = pending_status[book.id]
+            self.books_layout.add_widget(self.create_book_widget(book, pending))
 
-    def create_book_widget(self, book):
-        """Vytvoření widgetu pro knihu"""
-        book_id, title, author, price, condition, description, is_sold, created_at = book
+    def create_book_widget(self, book, pending=False):
+        """Vytvoření widgetu pro knihu (pending = zápis čeká v outboxu)"""
+        book_id, is_sold = book.id, book.is_sold
 
         # Hlavní layout pro knihu
         book_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=100, spacing=10)
@@ -136,11 +219,13 @@ class MyBooksScreen(Screen):
         
         status_text = "PRODÁNO" if is_sold else "K PRODEJI"
         status_color = (1, 0.3, 0.3, 1) if is_sold else (0.3, 1, 0.3, 1)
+        if pending:
+            status_text += " (ukládá se)"
         
-        title_label = Label(text=f"{title} - {author}", font_size=16, bold=True, halign='left')
+        title_label = Label(text=f"{book.title} - {book.author}", font_size=16, bold=True, halign='left')
         title_label.bind(size=title_label.setter('text_size'))
         
-        details_label = Label(text=f"{price} Kč | {condition}", halign='left')
+        details_label = Label(text=f"{book.price} Kč | {book.condition}", halign='left')
         details_label.bind(size=details_label.setter('text_size'))
         
         status_label = Label(text=status_text, color=status_color, halign='left')
@@ -153,52 +238,68 @@ class MyBooksScreen(Screen):
         # Tlačítka pro akce
         actions_layout = BoxLayout(orientation='vertical', size_hint_x=0.3, spacing=5)
 
-        if not is_sold:
-            # Tlačítko pro označení jako prodané
-            mark_sold_btn = Button(text='Označit\njako prodané', font_size=12)
-            mark_sold_btn.bind(on_press=lambda x, bid=book_id: self.mark_as_sold(bid))
-            actions_layout.add_widget(mark_sold_btn)
-        else:
-            # Tlačítko pro vrácení do prodeje
-            mark_available_btn = Button(text='Vrátit\ndo prodeje', font_size=12)
-            mark_available_btn.bind(on_press=lambda x, bid=book_id: self.mark_as_available(bid))
-            actions_layout.add_widget(mark_available_btn)
-
-        # Tlačítko pro smazání
-        delete_btn = Button(text='Smazat', font_size=12, background_color=(1, 0.3, 0.3, 1))
-        delete_btn.bind(on_press=lambda x, bid=book_id, title=title: self.confirm_delete(bid, title))
-        actions_layout.add_widget(delete_btn)
+        # Nová kniha z outboxu ještě nemá id v databázi -> zatím bez akcí
+        if book_id is not None:
+            if not is_sold:
+                # Tlačítko pro označení jako prodané
+                mark_sold_btn = Button(text='Označit\njako prodané', font_size=12)
+                mark_sold_btn.bind(on_press=lambda x: self.mark_as_sold(book, book_layout))
+                actions_layout.add_widget(mark_sold_btn)
+            else:
+                # Tlačítko pro vrácení do prodeje
+                mark_available_btn = Button(text='Vrátit\ndo prodeje', font_size=12)
+                mark_available_btn.bind(on_press=lambda x: self.mark_as_available(book, book_layout))
+                actions_layout.add_widget(mark_available_btn)
+
+            # Tlačítko pro smazání
+            delete_btn = Button(text='Smazat', font_size=12, background_color=(1, 0.3, 0.3, 1))
+            delete_btn.bind(on_press=lambda x, bid=book_id, title=book.title: self.confirm_delete(bid, title))
+            actions_layout.add_widget(delete_btn)
 
         book_layout.add_widget(info_layout)
         book_layout.add_widget(actions_layout)
 
         return book_layout
 
-    def mark_as_sold(self, book_id):
+    def mark_as_sold(self, book, widget):
         """Označení knihy jako prodané"""
-        current_user = get_current_user()
-        if not current_user:
-            return
-
-        success, message = db.update_book_status(book_id, current_user['id'], True)
-        if success:
-            show_popup("Úspěch", message)
-            self.load_books()
-        else:
-            show_popup("Chyba", message)
+        self.change_status(book, widget, True)
 
-    def mark_as_available(self, book_id):
+    def mark_as_available(self, book, widget):
         """Vrácení knihy do prodeje"""
+        self.change_status(book, widget, False)
+
+    def change_status(self, book, widget, is_sold):
+        """Změna stavu přes outbox - seznam i počty se upraví hned"""
         current_user = get_current_user()
         if not current_user:
             return
 
-        success, message = db.update_book_status(book_id, current_user['id'], False)
-        if success:
-            show_popup("Úspěch", message)
+        outbox.update_book_status(book.id, current_user['id'], is_sold)
+
+        changed = Book(*book)
+        changed.is_sold = is_sold
+        if widget.parent is self.books_layout:
+            index = self.books_layout.children.index(widget)
+            self.books_layout.remove_widget(widget)
+            self.books_layout.add_widget(self.create_book_widget(changed, pending=True), index=index)
+        if self.counts is not None:
+            self.counts['sold' if is_sold else 'available'] += 1
+            self.counts['available' if is_sold else 'sold'] -= 1
+            self.update_count_buttons()
+
+    def on_outbox_result(self, entry, result):
+        """Výsledek zápisu z outboxu (volá se z vlákna na pozadí)"""
+        if entry.method in ('add_book', 'update_book_status'):
+            Clock.schedule_once(lambda dt: self.outbox_done(result))
+
+    def outbox_done(self, result):
+        """Zapsaná kniha nebo změna stavu - zobrazený seznam se načte znovu"""
+        success, value = result
+        if not success:
+            show_popup("Chyba", value)
+        if self.manager and self.manager.current == self.name:
             self.load_books()
-        else:
-            show_popup("Chyba", message)
 
     def confirm_delete(self, book_id, title):
         """Potvrzení smazání knihy"""
@@ -227,9 +328,12 @@ class MyBooksScreen(Screen):
         if not current_user:
             return
 
-        success, message = db.delete_book(book_id, current_user['id'])
         popup.dismiss()
-        
+        async_db.delete_book(book_id, current_user['id'], callback=self.action_done)
+
+    def action_done(self, result):
+        """Výsledek změny stavu nebo smazání knihy"""
+        success, message = result
         if success:
             show_popup("Úspěch", message)
             self.load_books()
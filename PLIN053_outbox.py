@@ -0,0 +1,249 @@
+"""Trvalý outbox zápisů aplikace (zprávy, nové knihy, změny stavu knih).
+
+Obrazovky nezapisují přímo do Database: zápis se hned uloží do malé
+lokální SQLite databáze outboxu a obrazovka ho může zobrazit jako
+odesílaný. Vlákno na pozadí posílá čekající zápisy dávkou přes
+Database.apply_writes (jedna transakce na dávku) a po chybě (nedostupný
+server, zamčená databáze) to zkouší znovu s rostoucí pauzou. Každý
+zápis má vlastní klíč, takže dávka odeslaná znovu se v databázi
+neprovede dvakrát. Funguje s lokální Database i RemoteDatabase.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from kivy.utils import platform
+
+from PLIN053_database import OUTBOX_METHODS, Database
+from PLIN053_records import OutboxEntry
+
+# Pauza po prvním zápisu, během které se do dávky přidají další zápisy (s)
+FLUSH_DELAY = 0.2
+
+# Nejvýš tolik zápisů v jedné dávce (= jedné transakci databáze)
+BATCH_SIZE = 50
+
+# Pauza po neúspěšné dávce, s každou další chybou dvojnásobná až do RETRY_MAX (s)
+RETRY_DELAY = 1.0
+RETRY_MAX = 60.0
+
+
+def outbox_row(cursor, row):
+    """Row factory pro řádky outboxu (argumenty jsou uložené jako JSON)"""
+    return OutboxEntry(row[0], row[1], row[2], row[3], json.loads(row[4]), *row[5:])
+
+
+def default_outbox_path(db):
+    """Soubor outboxu vedle lokální databáze, u vzdálené v datech aplikace"""
+    if isinstance(db, Database):
+        return os.path.join(os.path.dirname(db.db_name), 'knihomat_outbox.db')
+    if platform == 'android':
+        return '/data/data/org.example.knihomat/files/knihomat_outbox.db'
+    return 'knihomat_outbox.db'
+
+
+class Outbox:
+    """Odložené zápisy s odesíláním na pozadí.
+
+    send_message / add_book / update_book_status mají stejné parametry
+    jako metody Database, ale jen zápis uloží a vrátí OutboxEntry.
+    Výsledek (úspěch, id nového řádku nebo zpráva) dostanou callbacky
+    z add_listener - volají se z vlákna na pozadí. S background=False
+    se zápisy odesílají jen voláním flush() (nástroje, měření).
+    """
+
+    def __init__(self, db, path=None, delay=FLUSH_DELAY, batch_size=BATCH_SIZE, background=True):
+        self.db = db
+        self.path = path or default_outbox_path(db)
+        self.delay = delay
+        self.batch_size = batch_size
+        self.background = background
+        self.failures = 0
+        # Uživatelé, jejichž zápisy se smí odesílat (None = všichni)
+        self._session_users = None
+
+        outbox_dir = os.path.dirname(self.path)
+        if outbox_dir and not os.path.exists(outbox_dir):
+            os.makedirs(outbox_dir, exist_ok=True)
+
+        # Jedno spojení pro hlavní vlákno i odesílání, zápis ihned na disk
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = FULL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                user_id INTEGER NOT NULL,
+                method TEXT NOT NULL,
+                args TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT
+            )
+        ''')
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._listeners = []
+        self._thread = None
+        self._closed = False
+
+        # Zápisy, které nestihly odejít před ukončením aplikace
+        if self.pending():
+            self._start()
+
+    def set_session_user(self, user_id):
+        """Omezení odesílání na přihlášeného uživatele (None = nikdo).
+
+        Se serverem jde zápis odeslat jen s relací jeho autora. Zápisy
+        odhlášeného uživatele zůstanou v outboxu a odejdou po jeho
+        dalším přihlášení.
+        """
+        self._session_users = set() if user_id is None else {user_id}
+        if user_id is not None:
+            self.failures = 0
+            self._start()
+
+    def add_listener(self, callback):
+        """Callback(entry, (úspěch, hodnota)) po zapsání nebo odmítnutí zápisu"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def enqueue(self, user_id, method, **args):
+        """Uložení zápisu metody Database (args bez id uživatele), vrací OutboxEntry"""
+        if method not in OUTBOX_METHODS:
+            raise ValueError(f"Metodu {method} nelze zapsat přes outbox")
+
+        key = uuid.uuid4().hex
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (key, user_id, method, args, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, user_id, method, json.dumps(args, ensure_ascii=False), created_at))
+        self._start()
+        return OutboxEntry(cursor.lastrowid, key, user_id, method, args, created_at, 0, None)
+
+    def send_message(self, conversation_id, sender_id, message):
+        return self.enqueue(sender_id, 'send_message', conversation_id=conversation_id, message=message)
+
+    def add_book(self, title, author, price, condition, description, seller_id):
+        return self.enqueue(seller_id, 'add_book', title=title, author=author, price=price,
+                            condition=condition, description=description)
+
+    def update_book_status(self, book_id, user_id, is_sold):
+        return self.enqueue(user_id, 'update_book_status', book_id=book_id, is_sold=is_sold)
+
+    def pending(self, user_id=None, method=None):
+        """Čekající zápisy od nejstaršího (volitelně jen uživatele / metody)"""
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if method is not None:
+            conditions.append("method = ?")
+            params.append(method)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.row_factory = outbox_row
+            return cursor.execute(f'''
+                SELECT id, key, user_id, method, args, created_at, attempts, last_error
+                FROM outbox {where} ORDER BY id
+            ''', params).fetchall()
+
+    def flush(self):
+        """Odeslání všech čekajících zápisů v tomto vlákně, vrací False po chybě.
+
+        Zápisy každého uživatele jdou ve svých dávkách. Chyba dávky
+        jednoho uživatele (např. jeho relace na serveru už neplatí)
+        nezdrží zápisy ostatních.
+        """
+        with self._flush_lock:
+            failed_users = set()
+            while True:
+                allowed = self._session_users
+                entries = [entry for entry in self.pending()
+                           if entry.user_id not in failed_users
+                           and (allowed is None or entry.user_id in allowed)]
+                if not entries:
+                    return not failed_users
+                user_id = entries[0].user_id
+                batch = [entry for entry in entries if entry.user_id == user_id][:self.batch_size]
+                if not self._send_batch(user_id, batch):
+                    failed_users.add(user_id)
+
+    def _send_batch(self, user_id, batch):
+        """Jedna dávka přes apply_writes, vrací False pokud se má zopakovat"""
+        try:
+            results = self.db.apply_writes(user_id, [(entry.key, entry.method, entry.args) for entry in batch])
+            error = None if results is not None else "Dávku se nepodařilo zapsat"
+        except Exception as e:
+            # Nedostupný server (OSError), neplatná relace (PermissionError) apod.
+            results, error = None, str(e)
+
+        done = [entry for entry in batch if entry.key in results] if results is not None else []
+        if not done:
+            error = error or "Databáze nevrátila výsledek zápisů"
+            marks = ', '.join('?' * len(batch))
+            with self._lock:
+                self._conn.execute(
+                    f"UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id IN ({marks})",
+                    (error, *(entry.id for entry in batch)))
+            print(f"Chyba při odesílání zápisů z outboxu: {error}")
+            return False
+
+        marks = ', '.join('?' * len(done))
+        with self._lock:
+            self._conn.execute(f"DELETE FROM outbox WHERE id IN ({marks})", [entry.id for entry in done])
+        for entry in done:
+            for callback in list(self._listeners):
+                try:
+                    callback(entry, tuple(results[entry.key]))
+                except Exception as e:
+                    print(f"Chyba při zpracování výsledku zápisu: {str(e)}")
+        return True
+
+    def _start(self):
+        """Probuzení vlákna odesílání (při prvním zápisu ho spustí)"""
+        if not self.background:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        """Smyčka odesílání: čeká na nové zápisy, po chybě na další pokus"""
+        retry_in = None
+        while True:
+            self._wake.wait(retry_in)
+            if self._closed:
+                break
+            if retry_in is None:
+                time.sleep(self.delay)  # Další zápisy se přidají do stejné dávky
+            self._wake.clear()
+
+            if self.flush():
+                self.failures = 0
+                retry_in = None
+            else:
+                self.failures += 1
+                retry_in = min(RETRY_DELAY * 2 ** (self.failures - 1), RETRY_MAX)
+
+    def close(self):
+        """Ukončení odesílání, neodeslané zápisy zůstanou na příští spuštění"""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._flush_lock, self._lock:
+            self._conn.close()
@@ -6,10 +6,11 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.scrollview import ScrollView
 
-from PLIN053_utils import show_popup, get_current_user, get_database
+from PLIN053_utils import show_popup, get_current_user, get_database, get_async_database
 
 # Instance databáze
 db = get_database()
+async_db = get_async_database()
 
 
 class PurchaseScreen(Screen):
@@ -73,7 +74,15 @@ class PurchaseScreen(Screen):
     def set_book_for_purchase(self, book_id):
         """Nastavení knihy pro nákup"""
         self.book_id = book_id
-        self.book_info = db.get_book_details(book_id)
+        self.book_info = None
+        async_db.get_book_details(
+            book_id, callback=lambda book_info: self.show_book_info(book_id, book_info), tag='purchase')
+
+    def show_book_info(self, book_id, book_info):
+        """Zobrazení načtených informací o knize"""
+        if book_id != self.book_id:
+            return
+        self.book_info = book_info
         self.update_book_display()
 
     def update_book_display(self):
@@ -85,20 +94,20 @@ class PurchaseScreen(Screen):
             self.book_info_layout.add_widget(Label(text='Chyba při načítání knihy'))
             return
 
-        book_id, title, author, price, condition, description, seller_name, seller_email, seller_id, is_sold = self.book_info
+        book = self.book_info
 
-        if is_sold:
+        if book.is_sold:
             self.book_info_layout.add_widget(Label(text='Tato kniha již byla prodána!', color=(1, 0, 0, 1)))
             return
 
         # Informace o knize
-        self.book_info_layout.add_widget(Label(text=f'Kniha: {title}', font_size=18))
-        self.book_info_layout.add_widget(Label(text=f'Autor: {author}'))
-        self.book_info_layout.add_widget(Label(text=f'Stav: {condition}'))
-        self.book_info_layout.add_widget(Label(text=f'Prodává: {seller_name}'))
+        self.book_info_layout.add_widget(Label(text=f'Kniha: {book.title}', font_size=18))
+        self.book_info_layout.add_widget(Label(text=f'Autor: {book.author}'))
+        self.book_info_layout.add_widget(Label(text=f'Stav: {book.condition}'))
+        self.book_info_layout.add_widget(Label(text=f'Prodává: {book.seller_name}'))
 
         # Celková cena
-        self.price_layout.add_widget(Label(text=f'Celková cena: {price} Kč', font_size=18, bold=True))
+        self.price_layout.add_widget(Label(text=f'Celková cena: {book.price} Kč', font_size=18, bold=True))
 
     def confirm_purchase(self, instance):
         """Potvrzení nákupu"""
@@ -125,13 +134,17 @@ class PurchaseScreen(Screen):
             return
 
         # Vytvoření objednávky
-        success, message = db.create_order(
+        async_db.create_order(
             self.book_id,
             current_user['id'],
             address,
-            phone
+            phone,
+            callback=self.order_created
         )
 
+    def order_created(self, result):
+        """Výsledek vytvoření objednávky"""
+        success, message = result
         if success:
             show_popup("Úspěch", message)
             self.clear_form()
@@ -195,9 +208,26 @@ class OrdersScreen(Screen):
         self.add_widget(layout)
 
         self.current_view = 'purchases'  # Výchozí zobrazení
+        self.orders_token = None  # Stav dat při posledním načtení
 
     def on_enter(self):
         """Načtení objednávek při vstupu na obrazovku"""
+        current_user = get_current_user()
+        if not current_user:
+            return
+
+        user_id = current_user['id']
+        async_db.get_change_token('orders', 'books', 'users',
+                                  callback=lambda token: self.check_orders(user_id, token),
+                                  error_callback=lambda e: self.check_orders(user_id, None),
+                                  tag='orders_token')
+
+    def check_orders(self, user_id, token):
+        """Pokud se objednávky od posledního načtení nezměnily, seznam zůstává"""
+        token = (user_id, token)
+        if token[1] is not None and token == self.orders_token:
+            return
+        self.orders_token = token
         self.show_purchases(None)
 
     def show_purchases(self, instance):
@@ -220,8 +250,14 @@ class OrdersScreen(Screen):
         if not current_user:
             return
 
+        # Přepnutí mezi nákupy a prodeji zruší starší nedokončené načítání
+        async_db.get_user_orders(
+            current_user['id'], as_buyer,
+            callback=lambda orders: self.show_orders(orders, as_buyer), tag='orders')
+
+    def show_orders(self, orders, as_buyer):
+        """Zobrazení načtených objednávek"""
         self.orders_layout.clear_widgets()
-        orders = db.get_user_orders(current_user['id'], as_buyer)
 
         if not orders:
             no_orders_text = 'Zatím žádné nákupy' if as_buyer else 'Zatím žádné prodeje'
@@ -236,11 +272,9 @@ class OrdersScreen(Screen):
     def create_order_widget(self, order, as_buyer):
         """Vytvoření widgetu pro objednávku"""
         if as_buyer:
-            order_id, title, author, price, status, created_at, other_user = order
             contact_info = ""
         else:
-            order_id, title, author, price, status, created_at, other_user, address, phone = order
-            contact_info = f"\nAdresa: {address}\nTelefon: {phone}"
+            contact_info = f"\nAdresa: {order.buyer_address}\nTelefon: {order.buyer_phone}"
 
         # Převod stavu do češtiny
         status_cz = {
@@ -249,11 +283,12 @@ class OrdersScreen(Screen):
             'shipped': 'Odesláno',
             'completed': 'Dokončeno',
             'cancelled': 'Zrušeno'
-        }.get(status, status)
+        }.get(order.status, order.status)
 
         role_text = 'Prodáno uživateli:' if not as_buyer else 'Koupeno od:'
         
-        order_text = f"#{order_id} - {title} ({author})\n{price} Kč | {status_cz}\n{role_text} {other_user}{contact_info}"
+        order_text = (f"#{order.id} - {order.book_title} ({order.book_author})\n{order.total_price} Kč | {status_cz}\n"
+                      f"{role_text} {order.other_user}{contact_info}")
 
         order_btn = Button(
             text=order_text,
@@ -265,14 +300,17 @@ class OrdersScreen(Screen):
         )
 
         # Pokud je prodávající, může měnit stav objednávky
-        if not as_buyer and status == 'pending':
-            order_btn.bind(on_press=lambda x, oid=order_id: self.confirm_order(oid))
+        if not as_buyer and order.status == 'pending':
+            order_btn.bind(on_press=lambda x, oid=order.id: self.confirm_order(oid))
 
         return order_btn
 
     def confirm_order(self, order_id):
         """Potvrzení objednávky prodávajícím"""
-        success = db.update_order_status(order_id, 'confirmed')
+        async_db.update_order_status(order_id, 'confirmed', callback=self.order_confirmed)
+
+    def order_confirmed(self, success):
+        """Výsledek potvrzení objednávky"""
         if success:
             show_popup("Úspěch", "Objednávka byla potvrzena!")
             self.load_orders(as_buyer=False)
@@ -0,0 +1,251 @@
+"""Záznamy vracené z Database místo pozičních n-tic.
+
+Každý typ má __slots__ (žádný __dict__ na řádek) a přistupuje se k němu
+přes atributy, např. book.is_sold místo book_details[9]. Sloupce,
+které dotaz nevrací nebo které projekce vynechá, mají hodnotu None.
+"""
+
+from operator import itemgetter
+
+
+class Record:
+    """Společný základ záznamů (porovnání, výpis, rozbalení do proměnných)"""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def as_dict(self):
+        """Hodnoty záznamu jako slovník (např. pro JSON)"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Book(Record):
+    """Kniha v seznamu (nabídka, vyhledávání, knihy prodávajícího)"""
+
+    __slots__ = ('id', 'title', 'author', 'price', 'condition', 'description', 'seller_name',
+                 'created_at', 'is_sold')
+
+    def __init__(self, id, title=None, author=None, price=None, condition=None, description=None,
+                 seller_name=None, created_at=None, is_sold=None):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.price = price
+        self.condition = condition
+        self.description = description
+        self.seller_name = seller_name
+        self.created_at = created_at
+        self.is_sold = is_sold
+
+
+class BookDetail(Record):
+    """Detail knihy pro nákup včetně kontaktu na prodávajícího"""
+
+    __slots__ = ('id', 'title', 'author', 'price', 'condition', 'description', 'seller_name',
+                 'seller_email', 'seller_id', 'is_sold')
+
+    def __init__(self, id, title=None, author=None, price=None, condition=None, description=None,
+                 seller_name=None, seller_email=None, seller_id=None, is_sold=None):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.price = price
+        self.condition = condition
+        self.description = description
+        self.seller_name = seller_name
+        self.seller_email = seller_email
+        self.seller_id = seller_id
+        self.is_sold = is_sold
+
+
+class Conversation(Record):
+    """Konverzace v seznamu konverzací nebo hlavička chatu.
+
+    Seznam plní souhrn (druhý účastník, role, poslední zpráva,
+    nepřečtené), hlavička chatu cenu knihy a jména obou účastníků.
+    """
+
+    __slots__ = ('id', 'book_title', 'book_author', 'other_user', 'user_role', 'created_at',
+                 'last_message', 'last_activity', 'unread_count', 'book_price', 'seller_name',
+                 'buyer_name', 'book_id')
+
+    def __init__(self, id, book_title=None, book_author=None, other_user=None, user_role=None,
+                 created_at=None, last_message=None, last_activity=None, unread_count=None,
+                 book_price=None, seller_name=None, buyer_name=None, book_id=None):
+        self.id = id
+        self.book_title = book_title
+        self.book_author = book_author
+        self.other_user = other_user
+        self.user_role = user_role
+        self.created_at = created_at
+        self.last_message = last_message
+        self.last_activity = last_activity
+        self.unread_count = unread_count
+        self.book_price = book_price
+        self.seller_name = seller_name
+        self.buyer_name = buyer_name
+        self.book_id = book_id
+
+
+class Message(Record):
+    """Zpráva v chatu"""
+
+    __slots__ = ('id', 'message', 'created_at', 'sender_id', 'sender_name')
+
+    def __init__(self, id, message=None, created_at=None, sender_id=None, sender_name=None):
+        self.id = id
+        self.message = message
+        self.created_at = created_at
+        self.sender_id = sender_id
+        self.sender_name = sender_name
+
+
+class Order(Record):
+    """Objednávka z pohledu kupujícího nebo prodávajícího.
+
+    other_user je prodávající (u nákupů) nebo kupující (u prodejů),
+    adresu a telefon kupujícího vidí jen prodávající.
+    """
+
+    __slots__ = ('id', 'book_title', 'book_author', 'total_price', 'status', 'created_at',
+                 'other_user', 'buyer_address', 'buyer_phone')
+
+    def __init__(self, id, book_title=None, book_author=None, total_price=None, status=None,
+                 created_at=None, other_user=None, buyer_address=None, buyer_phone=None):
+        self.id = id
+        self.book_title = book_title
+        self.book_author = book_author
+        self.total_price = total_price
+        self.status = status
+        self.created_at = created_at
+        self.other_user = other_user
+        self.buyer_address = buyer_address
+        self.buyer_phone = buyer_phone
+
+
+class MessageEvent(Record):
+    """Nová zpráva doručená účastníkům konverzace (MessageBus).
+
+    previous_id je id předchozí zprávy téže konverzace - pokud odpovídá
+    poslední zobrazené zprávě, lze novou zprávu rovnou připojit, jinak
+    příjemci nějaká zpráva chybí a musí je načíst dotazem.
+    """
+
+    __slots__ = ('conversation_id', 'message', 'previous_id', 'participants')
+
+    def __init__(self, conversation_id, message=None, previous_id=None, participants=None):
+        self.conversation_id = conversation_id
+        self.message = message
+        self.previous_id = previous_id
+        self.participants = participants
+
+
+class OutboxEntry(Record):
+    """Zápis čekající v outboxu aplikace na odeslání do databáze.
+
+    args jsou parametry metody Database bez id uživatele, key je klíč,
+    podle kterého databáze pozná už provedený zápis.
+    """
+
+    __slots__ = ('id', 'key', 'user_id', 'method', 'args', 'created_at', 'attempts', 'last_error')
+
+    def __init__(self, id, key=None, user_id=None, method=None, args=None, created_at=None,
+                 attempts=None, last_error=None):
+        self.id = id
+        self.key = key
+        self.user_id = user_id
+        self.method = method
+        self.args = args
+        self.created_at = created_at
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+RECORD_TYPES = {cls.__name__: cls for cls in (Book, BookDetail, Conversation, Message, Order, MessageEvent,
+                                              OutboxEntry)}
+
+
+def encode_value(value):
+    """Převod výsledku nebo argumentu Database na hodnotu pro JSON.
+
+    Záznamy, n-tice (kurzory, tokeny změn) a slovníky s jinými než
+    textovými klíči (např. nepřečtené zprávy podle id konverzace) se
+    označí, aby je decode_value vrátila ve stejném tvaru.
+    """
+    if isinstance(value, Record):
+        return {'$record': type(value).__name__, 'values': [encode_value(item) for item in value]}
+    if isinstance(value, tuple):
+        return {'$tuple': [encode_value(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) and not key.startswith('$') for key in value):
+            return {key: encode_value(item) for key, item in value.items()}
+        return {'$dict': [[encode_value(key), encode_value(item)] for key, item in value.items()]}
+    return value
+
+
+def decode_value(value):
+    """Opak encode_value (hodnota z JSON zpět na záznamy, n-tice a slovníky)"""
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if isinstance(value, dict):
+        if '$record' in value:
+            cls = RECORD_TYPES.get(value['$record'])
+            if cls is None:
+                raise ValueError(f"Neznámý typ záznamu: {value['$record']}")
+            return cls(*decode_value(value['values']))
+        if '$tuple' in value:
+            return tuple(decode_value(item) for item in value['$tuple'])
+        if '$dict' in value:
+            return {decode_value(key): decode_value(item) for key, item in value['$dict']}
+        return {key: decode_value(item) for key, item in value.items()}
+    return value
+
+
+# Sloupce, které potřebují seznamy na obrazovkách (projekce pro record_factory)
+MY_BOOKS_FIELDS = ('id', 'title', 'author', 'price', 'condition', 'is_sold')
+
+
+def record_factory(cls, columns=None, fields=None):
+    """Row factory pro sqlite3 vytvářející záznamy typu cls.
+
+    columns jsou názvy sloupců v pořadí dotazu (výchozí: začátek
+    cls.__slots__). Projekce fields nechá v záznamu jen vyjmenované
+    sloupce a ostatní nastaví na None, např. aby dlouhé popisy knih
+    nezůstávaly v paměti seznamu, který je nezobrazuje.
+    """
+    columns = tuple(columns or cls.__slots__)
+    if fields is not None:
+        unknown = set(fields) - set(columns)
+        if unknown:
+            raise ValueError(f"Neznámé sloupce projekce: {', '.join(sorted(unknown))}")
+
+    # Rychlá cesta: sloupce dotazu odpovídají začátku konstruktoru
+    if fields is None and columns == cls.__slots__[:len(columns)]:
+        return lambda cursor, row: cls(*row)
+
+    # Pozice každého slotu v řádku, -1 ukazuje na None přidané na konec řádku
+    positions = [columns.index(name) if name in columns and (fields is None or name in fields) else -1
+                 for name in cls.__slots__]
+    while len(positions) > 1 and positions[-1] == -1:
+        positions.pop()
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda cursor, row: cls((row + (None,))[position])
+    getter = itemgetter(*positions)
+    return lambda cursor, row: cls(*getter(row + (None,)))
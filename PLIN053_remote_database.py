@@ -0,0 +1,234 @@
+"""Klient serveru PLIN053_server se stejnými metodami jako Database.
+
+RemoteDatabase lze použít místo Database (get_database(), AsyncDatabase):
+volání db.get_books_page(cursor) se pošle serveru a vrátí stejné záznamy
+a n-tice jako lokální databáze. Po úspěšném login_user si klient pamatuje
+token relace a posílá ho se všemi dalšími požadavky. Nové zprávy doručuje
+db.events stejně jako MessageBus lokální databáze, jen přes long-poll.
+"""
+
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from PLIN053_records import decode_value, encode_value
+
+DEFAULT_URL = 'http://127.0.0.1:8053'
+
+# Čekání jednoho long-pollu na serveru (server sám nečeká déle než 25 s)
+LONG_POLL_WAIT = 20.0
+
+# Pauza před dalším long-pollem po chybě (server nedostupný, odhlášení)
+LONG_POLL_RETRY = 5.0
+
+
+class RemoteError(Exception):
+    """Chyba hlášená serverem (status HTTP a zpráva)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RemoteDatabase:
+    """Vzdálená databáze přes HTTP/JSON.
+
+    Každé vlákno (hlavní vlákno, vlákna AsyncDatabase) má vlastní
+    keep-alive spojení k serveru. Chyby argumentů se vyvolají jako
+    ValueError/TypeError, chybějící nebo cizí relace jako PermissionError.
+    """
+
+    def __init__(self, url=DEFAULT_URL, timeout=10.0):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.session = None
+        self.events = RemoteMessageBus(self)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self, timeout=None):
+        """Spojení k serveru pro aktuální vlákno (nové, pokud ještě není)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout or self.timeout)
+            self._local.conn = conn
+            self._local.used = False
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return  # Spojení už zavřelo close()
+        conn.close()
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+    def _request(self, path, payload=None, timeout=None, session=None):
+        """POST požadavek na server, vrací dekódované JSON tělo odpovědi"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b''
+        headers = {'Content-Type': 'application/json'}
+        session = session or self.session
+        if session:
+            headers['Authorization'] = f'Bearer {session}'
+
+        while True:
+            conn = self._connection(timeout)
+            reused = self._local.used
+            try:
+                conn.request('POST', path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Server mezitím zavřel nečinné keep-alive spojení -> jeden nový pokus
+                self._drop_connection()
+                if not reused:
+                    raise
+            except Exception:
+                self._drop_connection()
+                raise
+
+        self._local.used = True
+        if response.getheader('Connection', '').lower() == 'close':
+            self._drop_connection()
+
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            raise RemoteError(response.status, "Neplatná odpověď serveru")
+        if response.status == 200:
+            return result
+
+        message = result.get('error') or response.reason
+        if response.status == 400:
+            raise TypeError(message) if result.get('type') == 'TypeError' else ValueError(message)
+        if response.status in (401, 403):
+            raise PermissionError(message)
+        raise RemoteError(response.status, message)
+
+    def call(self, name, *args, **kwargs):
+        """Volání metody Database na serveru"""
+        payload = self._request(f'/api/{name}', {'args': encode_value(list(args)),
+                                                  'kwargs': encode_value(kwargs)})
+        return decode_value(payload['result'])
+
+    def login_user(self, email, password):
+        """Přihlášení - při úspěchu si klient uloží token relace"""
+        payload = self._request('/api/login_user', {'args': [email, password]})
+        if payload.get('session'):
+            self.session = payload['session']
+        return decode_value(payload['result'])
+
+    def logout(self, session=None):
+        """Zrušení relace na serveru (session = token dřívější relace, výchozí je aktuální)"""
+        session = session or self.session
+        if not session:
+            return
+        try:
+            self._request('/api/logout', session=session)
+        except (OSError, RemoteError) as e:
+            print(f"Chyba při odhlášení ze serveru: {str(e)}")
+        # Mezitím se mohl přihlásit jiný uživatel, jeho relace zůstává
+        if self.session == session:
+            self.session = None
+
+    def close(self):
+        """Zavření spojení všech vláken k serveru"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        # Ostatní metody Database: db.get_messages(1) -> POST /api/get_messages
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+
+class RemoteMessageBus:
+    """Nové zprávy ze serveru se stejným rozhraním jako MessageBus.
+
+    Dokud je přihlášený aspoň jeden callback, vlákno na pozadí opakuje
+    long-poll POST /api/wait_messages a doručuje MessageEvent. Pokud
+    klient mohl o zprávy přijít (výpadek, restart serveru), dostanou
+    callbacky None a mají si zprávy načíst dotazem.
+    """
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.cursor = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id, callback):
+        """Callback(event) pro nové zprávy v konverzacích uživatele"""
+        with self._lock:
+            self._subscribers.setdefault(user_id, []).append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='long-poll', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, user_id, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(user_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(user_id, None)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def _callbacks(self, participants=None):
+        with self._lock:
+            if participants is None:
+                return [callback for callbacks in self._subscribers.values() for callback in callbacks]
+            return [callback for user_id in participants for callback in self._subscribers.get(user_id, ())]
+
+    def _dispatch(self, callbacks, event):
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Chyba při doručení zprávy: {str(e)}")
+
+    def _run(self):
+        """Smyčka long-pollu, skončí s odhlášením posledního callbacku"""
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    break
+            try:
+                payload = self.remote._request(
+                    '/api/wait_messages', {'args': [self.cursor, LONG_POLL_WAIT]}, timeout=LONG_POLL_WAIT + 10)
+                result = decode_value(payload['result'])
+            except (OSError, RemoteError, ValueError) as e:
+                if not self.has_subscribers():
+                    continue  # Už nikdo nečeká (odchod z chatu, zavření klienta)
+                # PermissionError (odhlášení) je také OSError
+                print(f"Chyba při čekání na nové zprávy: {str(e)}")
+                time.sleep(LONG_POLL_RETRY)
+                continue
+
+            self.cursor = result['cursor']
+            if result['reset']:
+                self._dispatch(self._callbacks(), None)
+            for event in result['events']:
+                self._dispatch(self._callbacks(event.participants), event)
+
+        # Spojení tohoto vlákna už nikdo nepoužije
+        self.remote._drop_connection()
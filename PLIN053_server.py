@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""HTTP/JSON server zpřístupňující Database více klientům (telefonům).
+
+Jeden proces s asyncio obsluhuje spojení, dotazy běží ve vláknech nad
+poolem spojení Database. Klient volá POST /api/<metoda> s tělem
+{"args": [...], "kwargs": {...}} a dostane {"result": ...}; hodnoty
+kóduje encode_value z PLIN053_records. Přihlášení (login_user) vrací
+token relace, který klient posílá v hlavičce Authorization. Nové zprávy
+klient dostává long-pollem POST /api/wait_messages. Spuštění např.:
+    python PLIN053_server.py knihomat.db --port 8053
+"""
+
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import os
+import secrets
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+# Kivy jinak zpracovává argumenty příkazové řádky sám
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from PLIN053_database import ARCHIVE_AFTER_DAYS, Database
+from PLIN053_records import decode_value, encode_value
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8053
+
+# Relace vyprší po hodině nečinnosti
+SESSION_TTL = 3600.0
+
+# Nečinné spojení (keep-alive) se po této době zavře
+IDLE_TIMEOUT = 60.0
+
+# Největší povolené tělo požadavku
+MAX_BODY_BYTES = 1024 * 1024
+
+# Údržba databáze (archivace, VACUUM) jednou za tuto dobu, 0 = vypnuto
+MAINTENANCE_INTERVAL = 3600.0
+
+# Nejdelší čekání long-pollu na nové zprávy
+LONG_POLL_TIMEOUT = 25.0
+
+# Kolik posledních zpráv si server drží pro long-poll (starší klient dostane reset)
+EVENT_BUFFER_SIZE = 1000
+
+# Argumenty long-pollu POST /api/wait_messages (kurzor poslední události, čekání)
+WAIT_MESSAGES_SIGNATURE = inspect.Signature([
+    inspect.Parameter('after', inspect.Parameter.POSITIONAL_OR_KEYWORD, default=None),
+    inspect.Parameter('timeout', inspect.Parameter.POSITIONAL_OR_KEYWORD, default=LONG_POLL_TIMEOUT),
+])
+
+# Metody dostupné bez přihlášení
+PUBLIC_METHODS = frozenset({
+    'register_user', 'get_books_page', 'search_books_page', 'get_book_details',
+    'get_seller_id_by_book', 'get_change_token', 'has_changed',
+})
+
+# Metody pro přihlášené -> parametr, který musí být id přihlášeného uživatele
+# (None = metoda žádné id uživatele nebere)
+SESSION_METHODS = {
+    'add_book': 'seller_id',
+    'create_or_get_conversation': 'buyer_id',
+    'send_message': 'sender_id',
+    'get_messages': None,
+    'get_messages_since': None,
+    'get_messages_page': None,
+    'apply_writes': 'user_id',
+    'mark_messages_read': 'user_id',
+    'get_unread_counts': 'user_id',
+    'get_user_conversations': 'user_id',
+    'get_conversation_info': None,
+    'create_order': 'buyer_id',
+    'get_user_orders': 'user_id',
+    'update_order_status': None,
+    'get_user_books': 'user_id',
+    'get_user_books_page': 'user_id',
+    'get_user_book_counts': 'user_id',
+    'delete_book': 'user_id',
+    'update_book_status': 'user_id',
+}
+
+# Metody nad jednou konverzací - přihlášený uživatel musí být její
+# kupující nebo prodávající
+CONVERSATION_METHODS = {
+    'send_message', 'get_messages', 'get_messages_since', 'get_messages_page',
+    'get_conversation_info', 'mark_messages_read',
+}
+
+# Metody nad objednávkou - smí je volat jen prodávající objednávky
+ORDER_SELLER_METHODS = {'update_order_status'}
+
+# Metody nad knihou - seller_id musí být prodávající knihy (a ne přihlášený)
+BOOK_SELLER_METHODS = {'create_or_get_conversation'}
+
+
+class HttpError(Exception):
+    """Chyba požadavku, která se klientovi vrátí jako odpověď se statusem"""
+
+    def __init__(self, status, message, error_type=None):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+
+class SessionStore:
+    """Přihlášení uživatelé serveru (token -> uživatel).
+
+    Nahrazuje globální current_user aplikace: každý požadavek nese
+    vlastní token. Používá se jen z vlákna smyčky asyncio.
+    """
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+
+    def create(self, user):
+        """Nová relace pro přihlášeného uživatele, vrací token"""
+        self.purge()
+        token = secrets.token_urlsafe(32)
+        self._sessions[token] = [user, time.monotonic() + self.ttl]
+        return token
+
+    def get(self, token):
+        """Uživatel relace (a prodloužení její platnosti), None = neplatná"""
+        entry = self._sessions.get(token)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[1] < now:
+            del self._sessions[token]
+            return None
+        entry[1] = now + self.ttl
+        return entry[0]
+
+    def remove(self, token):
+        self._sessions.pop(token, None)
+
+    def purge(self):
+        """Odstranění vypršených relací"""
+        now = time.monotonic()
+        for token in [token for token, entry in self._sessions.items() if entry[1] < now]:
+            del self._sessions[token]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+async def read_request(reader):
+    """Načtení jednoho HTTP požadavku, None = klient spojení zavřel"""
+    try:
+        line = await reader.readline()
+    except ValueError:
+        raise HttpError(400, "Příliš dlouhý řádek požadavku")
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "Neplatný řádek požadavku")
+
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise HttpError(400, "Příliš dlouhá hlavička")
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise HttpError(400, "Příliš mnoho hlaviček")
+
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400, "Neplatná délka těla")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Příliš velké tělo požadavku")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, version.upper(), headers, body
+
+
+def build_response(status, body, keep_alive):
+    """HTTP odpověď s JSON tělem (body jsou už zakódované bajty)"""
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+def json_body(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class DatabaseServer:
+    """Asyncio HTTP server nad jednou instancí Database.
+
+    Volání metod běží v ThreadPoolExecutor s tolika vlákny, kolik má
+    Database spojení v poolu, takže žádné vlákno nečeká na spojení.
+    U metod ze SESSION_METHODS server ověří, že id uživatele v argumentech
+    patří přihlášenému uživateli relace, u metod nad konverzací nebo
+    objednávkou také, že se ho týkají. Zprávy z Database.events si server
+    číslované drží v krátké frontě, ze které je vydává long-poll.
+    """
+
+    def __init__(self, db, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None,
+                 session_ttl=SESSION_TTL, maintenance_interval=MAINTENANCE_INTERVAL):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.maintenance_interval = maintenance_interval
+        self.sessions = SessionStore(session_ttl)
+        self.executor = ThreadPoolExecutor(max_workers=workers or db.pool.max_connections,
+                                           thread_name_prefix='server')
+        self.signatures = {name: inspect.signature(getattr(db, name))
+                           for name in PUBLIC_METHODS | SESSION_METHODS.keys() | {'login_user'}}
+        self.signatures['wait_messages'] = WAIT_MESSAGES_SIGNATURE
+        self.requests = 0
+        self.event_seq = 0
+        self._events = deque(maxlen=EVENT_BUFFER_SIZE)
+        self._new_event = None
+        self._clients = set()
+        self._server = None
+        self._maintenance = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self):
+        """Spuštění naslouchání, vrací skutečný port (port 0 = libovolný volný)"""
+        self._loop = asyncio.get_running_loop()
+        self._new_event = asyncio.Event()
+        self.db.events.subscribe(None, self.on_message_event)
+        self._server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.maintenance_interval:
+            self._maintenance = asyncio.create_task(self.maintenance_loop())
+        return self.port
+
+    async def close(self):
+        """Zastavení serveru, otevřených spojení a vláken s dotazy"""
+        if self._maintenance:
+            self._maintenance.cancel()
+        self.db.events.unsubscribe(None, self.on_message_event)
+        self._server.close()
+        for task in self._clients:
+            task.cancel()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        await self._server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def maintenance_loop(self):
+        """Pravidelná údržba databáze (dělá ji server místo aplikací)"""
+        while True:
+            await asyncio.sleep(self.maintenance_interval)
+            try:
+                await self._loop.run_in_executor(
+                    self.executor, functools.partial(self.db.run_maintenance, ARCHIVE_AFTER_DAYS))
+            except Exception as e:
+                print(f"Chyba při údržbě databáze: {str(e)}")
+            self.sessions.purge()
+
+    def on_message_event(self, event):
+        """Nová zpráva z Database.events (volá se z vlákna s dotazem)"""
+        self._loop.call_soon_threadsafe(self.add_event, event)
+
+    def add_event(self, event):
+        """Zařazení zprávy do fronty a probuzení čekajících long-pollů"""
+        self.event_seq += 1
+        self._events.append((self.event_seq, event))
+        self._new_event.set()
+        self._new_event = asyncio.Event()
+
+    async def wait_messages(self, user_id, after=None, timeout=LONG_POLL_TIMEOUT):
+        """Long-poll: nové zprávy uživatele po kurzoru after (nejdéle timeout sekund).
+
+        Vrací {'cursor', 'events', 'reset'}. Bez kurzoru se vrátí hned jen
+        aktuální kurzor. reset znamená, že klient mohl o zprávy přijít
+        (kurzor je starší než fronta nebo ze staršího běhu serveru) a má
+        si je načíst dotazem.
+        """
+        deadline = self._loop.time() + min(max(float(timeout), 0.0), LONG_POLL_TIMEOUT)
+        while True:
+            if after is None or after > self.event_seq or (
+                    self._events and after < self._events[0][0] - 1):
+                return {'cursor': self.event_seq, 'events': [], 'reset': after is not None}
+            events = [event for seq, event in self._events if seq > after and user_id in event.participants]
+            remaining = deadline - self._loop.time()
+            if events or remaining <= 0:
+                return {'cursor': self.event_seq, 'events': events, 'reset': False}
+            try:
+                await asyncio.wait_for(self._new_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def handle_client(self, reader, writer):
+        """Obsluha jednoho spojení (více požadavků přes keep-alive)"""
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                except HttpError as e:
+                    writer.write(build_response(e.status, json_body({'error': str(e)}), False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+                status, payload = await self.dispatch(method, target, headers, body)
+                writer.write(build_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass  # Ukončení serveru (close) s otevřeným keep-alive spojením
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body):
+        """Zpracování požadavku, vrací (status, zakódované tělo odpovědi)"""
+        self.requests += 1
+        path = target.split('?', 1)[0]
+        try:
+            if path == '/health':
+                return 200, json_body({'status': 'ok', 'sessions': len(self.sessions),
+                                       'requests': self.requests})
+            if method != 'POST' or not path.startswith('/api/'):
+                raise HttpError(404, f"Neznámá adresa: {method} {path}")
+
+            name = path[len('/api/'):]
+            token = headers.get('authorization', '').removeprefix('Bearer ').strip()
+            if name == 'logout':
+                self.sessions.remove(token)
+                return 200, json_body({'result': True})
+            if name == 'wait_messages':
+                user = self.session_user(token)
+                arguments = self.bind_arguments(name, body)
+                try:
+                    result = await self.wait_messages(user['id'], *arguments.args, **arguments.kwargs)
+                except (TypeError, ValueError) as e:
+                    raise HttpError(400, f"Neplatný kurzor nebo čekání: {str(e)}", 'ValueError')
+                return 200, json_body({'result': encode_value(result)})
+            if name != 'login_user' and name not in PUBLIC_METHODS and name not in SESSION_METHODS:
+                raise HttpError(404, f"Neznámá metoda: {name}")
+
+            arguments = self.bind_arguments(name, body)
+            if name in SESSION_METHODS:
+                await self.authorize(name, token, arguments)
+            if name == 'login_user':
+                return 200, await self.login(arguments)
+            return 200, await self.call(name, arguments)
+        except HttpError as e:
+            payload = {'error': str(e)}
+            if e.error_type:
+                payload['type'] = e.error_type
+            return e.status, json_body(payload)
+
+    def bind_arguments(self, name, body):
+        """Argumenty z těla požadavku navázané na signaturu metody"""
+        try:
+            request = json.loads(body or b'{}')
+            args = decode_value(request.get('args', []))
+            kwargs = decode_value(request.get('kwargs', {}))
+            return self.signatures[name].bind(*args, **kwargs)
+        except (ValueError, AttributeError) as e:
+            raise HttpError(400, f"Neplatné tělo požadavku: {str(e)}", 'ValueError')
+        except TypeError as e:
+            raise HttpError(400, str(e), 'TypeError')
+
+    def session_user(self, token):
+        """Přihlášený uživatel relace požadavku"""
+        user = self.sessions.get(token) if token else None
+        if user is None:
+            raise HttpError(401, "Nejste přihlášen!")
+        return user
+
+    async def authorize(self, name, token, arguments):
+        """Kontrola relace, id uživatele v argumentech a vlastnictví konverzace / objednávky / knihy.
+
+        Účastníky konverzace a prodávajícího objednávky čte Database ve
+        vlákně. Neexistující konverzace nebo objednávka se odmítne stejně
+        jako cizí, aby nešlo zjišťovat, která id existují.
+        """
+        user = self.session_user(token)
+        param = SESSION_METHODS[name]
+        if param is not None and arguments.arguments.get(param) != user['id']:
+            raise HttpError(403, "Operace za jiného uživatele není povolena!")
+
+        if name in CONVERSATION_METHODS:
+            participants = await self._loop.run_in_executor(
+                self.executor, self.db.get_conversation_participants, arguments.arguments.get('conversation_id'))
+            if not participants or user['id'] not in participants:
+                raise HttpError(403, "Nejste účastníkem této konverzace!")
+        elif name in ORDER_SELLER_METHODS:
+            seller_id = await self._loop.run_in_executor(
+                self.executor, self.db.get_order_seller_id, arguments.arguments.get('order_id'))
+            if seller_id is None or seller_id != user['id']:
+                raise HttpError(403, "Objednávku může měnit jen její prodávající!")
+        elif name in BOOK_SELLER_METHODS:
+            seller_id = await self._loop.run_in_executor(
+                self.executor, self.db.get_seller_id_by_book, arguments.arguments.get('book_id'))
+            if seller_id is None or seller_id == user['id'] or seller_id != arguments.arguments.get('seller_id'):
+                raise HttpError(403, "Konverzaci lze založit jen s prodávajícím knihy!")
+
+    async def call(self, name, arguments):
+        """Volání metody Database ve vlákně, výsledek se zakóduje tamtéž"""
+        method = getattr(self.db, name)
+
+        def run():
+            return json_body({'result': encode_value(method(*arguments.args, **arguments.kwargs))})
+
+        try:
+            return await self._loop.run_in_executor(self.executor, run)
+        except (ValueError, TypeError) as e:
+            raise HttpError(400, str(e), type(e).__name__)
+        except Exception as e:
+            print(f"Chyba při volání {name}: {str(e)}")
+            raise HttpError(500, f"Chyba serveru: {str(e)}")
+
+    async def login(self, arguments):
+        """Přihlášení - při úspěchu vznikne relace a klient dostane její token"""
+        success, result = await self._loop.run_in_executor(
+            self.executor, functools.partial(self.db.login_user, *arguments.args, **arguments.kwargs))
+        payload = {'result': encode_value((success, result))}
+        if success:
+            payload['session'] = self.sessions.create(result)
+        return json_body(payload)
+
+    def start_background(self):
+        """Spuštění serveru ve vlákně s vlastní smyčkou (pro nástroje a měření), vrací URL"""
+        started = threading.Event()
+        loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='server', daemon=True)
+        self._thread.start()
+        started.wait()
+        return f"http://{self.host}:{self.port}"
+
+    def stop_background(self):
+        """Zastavení serveru spuštěného přes start_background"""
+        loop = self._loop
+        asyncio.run_coroutine_threadsafe(self.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+async def serve(args):
+    db = Database(args.db, profile=args.profile, max_connections=args.connections)
+    server = DatabaseServer(db, args.host, args.port, maintenance_interval=args.maintenance_interval)
+    port = await server.start()
+    print(f"Server Knihomatu běží na http://{args.host}:{port} ({args.connections} spojení)", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows - ukončení přes KeyboardInterrupt
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+        if args.stats:
+            db.dump_query_stats(args.stats)
+        db.close()
+    print(f"Server ukončen po {server.requests} požadavcích")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP/JSON server databáze Knihomatu')
+    parser.add_argument('db', help='cesta k databázi')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='0 = libovolný volný port')
+    parser.add_argument('--connections', type=int, default=4, help='velikost poolu spojení = počet vláken')
+    parser.add_argument('--profile', help='PRAGMA profil (výchozí podle platformy)')
+    parser.add_argument('--maintenance-interval', type=float, default=MAINTENANCE_INTERVAL,
+                        help='sekundy mezi údržbami databáze (0 = vypnuto)')
+    parser.add_argument('--stats', help='při ukončení uložit statistiky dotazů do JSON souboru')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,34 @@
+import os
+import threading
+import time
+
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.popup import Popup
 
 from PLIN053_database import Database
+from PLIN053_async_database import AsyncDatabase, ReadReceipts
+from PLIN053_outbox import Outbox
+from PLIN053_remote_database import RemoteDatabase
+
+# Adresa serveru PLIN053_server (např. http://192.168.1.10:8053),
+# bez ní aplikace používá vlastní lokální databázi
+SERVER_URL = os.environ.get('KNIHOMAT_SERVER')
 
-db = Database()
+db = RemoteDatabase(SERVER_URL) if SERVER_URL else Database()
+async_db = AsyncDatabase(db)
+read_receipts = ReadReceipts(async_db)
+outbox = Outbox(db)
 current_user = None
 
+# Nejdelší čekání na odeslání potvrzení přečtení před zrušením relace (s)
+LOGOUT_WAIT = 5.0
+
+if SERVER_URL:
+    # Zápisy z outboxu odcházejí až s relací svého autora
+    outbox.set_session_user(None)
+
 
 def show_popup(title, message):
     """Zobrazení popup zprávy"""
@@ -25,6 +46,8 @@ def set_current_user(user):
     """Nastavení aktuálního uživatele"""
     global current_user
     current_user = user
+    if SERVER_URL:
+        outbox.set_session_user(user['id'] if user else None)
 
 
 def get_current_user():
@@ -33,11 +56,43 @@ def get_current_user():
 
 
 def get_database():
-    """Získání instance databáze"""
+    """Získání instance databáze (lokální Database nebo RemoteDatabase)"""
     return db
 
 
+def get_async_database():
+    """Získání neblokující fasády databáze (výsledky přes callbacky)"""
+    return async_db
+
+
+def get_read_receipts():
+    """Získání odloženého potvrzování přečtených zpráv"""
+    return read_receipts
+
+
+def get_outbox():
+    """Získání outboxu pro zprávy, nové knihy a změny stavu knih"""
+    return outbox
+
+
 def logout_user():
-    """Odhlášení uživatele"""
+    """Odhlášení uživatele (se serverem se relace ruší na pozadí)"""
     global current_user
-    current_user = None
\ No newline at end of file
+    requests = read_receipts.flush()
+    if SERVER_URL:
+        # Neodeslané zápisy z outboxu počkají na další přihlášení uživatele
+        outbox.set_session_user(None)
+        threading.Thread(target=finish_logout, args=(requests, db.session),
+                         name='logout', daemon=True).start()
+    current_user = None
+
+
+def finish_logout(requests, session):
+    """Zrušení relace na serveru po odeslání potvrzení přečtení (nejvýš LOGOUT_WAIT s)"""
+    deadline = time.monotonic() + LOGOUT_WAIT
+    for request in requests:
+        try:
+            request.future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"Chyba při odesílání potvrzení přečtení: {str(e)}")
+    db.logout(session)
\ No newline at end of file
@@ -18,6 +18,9 @@ source.include_exts = py,png,jpg,kv,atlas
 # (list) List of inclusions using pattern matching
 #source.include_patterns = assets/*,images/*.png
 
+# (list) List of exclusions using pattern matching
+source.exclude_patterns = PLIN053_benchmark.py,PLIN053_db_tools.py,PLIN053_import.py,PLIN053_dataset.py,PLIN053_loadsim.py,PLIN053_server.py
+
 # (str) Application versioning (method 1)
 version = 0.1
 